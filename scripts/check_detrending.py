@@ -0,0 +1,81 @@
+"""
+Checks that detrending leaves traces without photobleaching alone.
+
+Synthetic coverslips with flat baselines (responses that recover, and slow ones that outlast the
+recording) are preprocessed with and without each detrending model. Amplitude and eflux of every ROI
+must agree within a tolerance, since the bleaching fit must not absorb any part of the response.
+Exits non-zero otherwise.
+
+    python scripts/check_detrending.py [--tolerance 0.02] [--seed 0]
+"""
+import argparse
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from calcium_imaging.instantiation import _instantiate_coverslip  # noqa: E402
+from calcium_imaging.processing import DETRENDING_MODELS, CoverslipInfo, Preprocessor  # noqa: E402
+from calcium_imaging.processing.constants import BACKGROUND_FLUORESCENCE_ROIS, TIME_COL  # noqa: E402
+
+N_FRAMES = 180
+FRAME_MS = 1000.0
+ONSET_FRAME = 60
+CHECKED_METRICS = ("amplitude", "eflux")
+
+
+def make_raw_coverslip(rng: np.random.Generator, n_rois: int = 40) -> pd.DataFrame:
+    """Raw coverslip df as `load_vsi` returns it: time, background and ROI columns, no bleaching."""
+    frames = np.arange(N_FRAMES)
+    columns = {TIME_COL: frames * FRAME_MS}
+    for col in BACKGROUND_FLUORESCENCE_ROIS:
+        columns[col] = 10.0 + rng.normal(0, 0.2, N_FRAMES)
+    for roi_id in range(4, 4 + n_rois):
+        baseline = rng.uniform(80, 150)
+        amplitude = baseline * rng.uniform(0.3, 1.0)
+        rise_frames = rng.integers(3, 10)
+        decay_frames = rng.uniform(8, 20) if roi_id % 3 else rng.uniform(60, 120)  # every third never recovers
+        t = frames - ONSET_FRAME
+        rise = np.clip(t / rise_frames, 0, 1)
+        decay = np.exp(-np.clip(t - rise_frames, 0, None) / decay_frames)
+        response = amplitude * rise * decay
+        columns[f"ROI {roi_id} (Average)"] = 10.0 + baseline + response + rng.normal(0, 0.005 * baseline, N_FRAMES)
+    return pd.DataFrame(columns, index=frames)
+
+
+def calculate_metrics(raw_df: pd.DataFrame, preprocessor: Preprocessor) -> pd.DataFrame:
+    with contextlib.redirect_stdout(io.StringIO()):  # per-column warnings
+        processed_df = preprocessor.preprocess(raw_df)
+        coverslip = _instantiate_coverslip(CoverslipInfo(1, "check"), processed_df, preprocessor.time_col_name)
+        return coverslip.calculate_metrics(list(CHECKED_METRICS))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checks that detrending leaves unbleached traces unchanged.")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Largest relative change of a metric.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raw_df = make_raw_coverslip(np.random.default_rng(args.seed))
+    reference = calculate_metrics(raw_df, Preprocessor())
+    failed = False
+    for model in DETRENDING_MODELS:
+        detrended = calculate_metrics(raw_df, Preprocessor(detrending_model=model))
+        for metric in CHECKED_METRICS:
+            relative_change = np.abs(detrended[metric] - reference[metric]) / np.abs(reference[metric])
+            worst = float(np.nanmax(relative_change))
+            print(f"{model} detrending, {metric}: largest relative change {worst:.4f} (tolerance {args.tolerance})")
+            if not worst <= args.tolerance:
+                failed = True
+    if failed:
+        print("FAIL: detrending changed the metrics of traces without bleaching")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Checks that `import calcium_imaging` stays fast and headless.
+
+Plotting, UI and file-format libraries are imported on first use only, so a batch worker process
+imports NumPy and pandas and nothing heavier. Exits non-zero if the import takes longer than the
+budget, or if any of the lazily imported libraries is loaded by it.
+
+    python scripts/check_import_time.py [--budget-seconds 1.0] [--repeats 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+LAZY_MODULES = ("matplotlib", "openpyxl", "plotly", "scipy", "xlrd")
+DEFAULT_BUDGET_SECONDS = 1.0
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import calcium_imaging
+elapsed = time.perf_counter() - start
+loaded = sorted(m for m in {LAZY_MODULES!r} if m in sys.modules)
+print(elapsed, ",".join(loaded))
+"""
+
+
+def measure_import() -> tuple:
+    """Imports the package in a fresh interpreter, returns (seconds, lazy modules that got loaded)."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC_DIR), os.environ.get("PYTHONPATH")]))}
+    output = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True).stdout
+    seconds, _, loaded = output.strip().partition(" ")
+    return float(seconds), [m for m in loaded.split(",") if m]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checks the import time budget of calcium_imaging.")
+    parser.add_argument("--budget-seconds", type=float, default=DEFAULT_BUDGET_SECONDS)
+    parser.add_argument("--repeats", type=int, default=5, help="The fastest of the repeats is compared to the budget.")
+    args = parser.parse_args()
+
+    measurements = [measure_import() for _ in range(args.repeats)]
+    seconds = min(s for s, _ in measurements)
+    loaded = sorted(set(m for _, modules in measurements for m in modules))
+    print(f"import calcium_imaging: {seconds:.3f}s (budget {args.budget_seconds:.3f}s)")
+    failed = False
+    if loaded:
+        print(f"FAIL: imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if seconds > args.budget_seconds:
+        print("FAIL: over budget, see `python -X importtime -c 'import calcium_imaging'`")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
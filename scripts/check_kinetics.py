@@ -0,0 +1,79 @@
+"""
+Checks the kinetic fits of the bundled experiments for values that aren't estimates.
+
+Every experiment under the raw-data root is loaded with the default preprocessing and fitted with
+`Experiment.fit_kinetics`. Fails if any decay or exponential rise tau sits at the rate bounds, if a
+bi-exponential fast fraction is outside [0, 1], or if a fit flagged as converged has a NaN tau.
+Exits non-zero otherwise.
+
+    python scripts/check_kinetics.py [--raw-data-root raw_data]
+"""
+import argparse
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "src"))
+
+from calcium_imaging import Preprocessor, load_experiment  # noqa: E402
+from calcium_imaging.analysis.kinetic_fitting import MAX_RATE, MIN_RATE  # noqa: E402
+
+BOUND_TAUS = (1 / MIN_RATE, 1 / MAX_RATE)
+CONVERGED_TAUS = {
+    "mono_decay_converged": ["mono_decay_tau"],
+    "bi_decay_converged": ["bi_decay_tau_fast", "bi_decay_tau_slow", "bi_decay_fast_fraction"],
+}
+
+
+def check_kinetics(name: str, kinetics_df: pd.DataFrame) -> list:
+    """Descriptions of the problems of one experiment's kinetics table, empty if there are none."""
+    problems = []
+    tau_cols = [col for col in ("mono_decay_tau", "bi_decay_tau_fast", "bi_decay_tau_slow", "rise_tau")
+                if col in kinetics_df.columns]
+    for col in tau_cols:
+        at_bounds = np.isclose(kinetics_df[col].to_numpy(dtype=float)[:, None], BOUND_TAUS, rtol=1e-9).any(axis=1)
+        if at_bounds.any():
+            problems.append(f"{name}: {int(at_bounds.sum())} {col} at the rate bounds {BOUND_TAUS}")
+    fraction = kinetics_df["bi_decay_fast_fraction"]
+    outside = ((fraction < 0) | (fraction > 1)).sum()
+    if outside:
+        problems.append(f"{name}: {int(outside)} bi_decay_fast_fraction outside [0, 1]")
+    for converged_col, value_cols in CONVERGED_TAUS.items():
+        missing = (kinetics_df[converged_col] & kinetics_df[value_cols].isna().any(axis=1)).sum()
+        if missing:
+            problems.append(f"{name}: {int(missing)} {converged_col} fits with NaN {value_cols}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checks the kinetic fits of the bundled experiments.")
+    parser.add_argument("--raw-data-root", type=Path, default=REPO_DIR / "raw_data")
+    args = parser.parse_args()
+
+    problems = []
+    for experiment_dir in sorted(p for p in args.raw_data_root.iterdir() if p.is_dir()):
+        with contextlib.redirect_stdout(io.StringIO()):  # per-column preprocessing warnings
+            experiment = load_experiment(str(experiment_dir), Preprocessor())
+            kinetics_df = pd.concat([
+                experiment.fit_kinetics(rise_model="sigmoid"),
+                experiment.fit_kinetics(rise_model="exponential")[["rise_tau"]],
+            ], axis=1)
+        experiment_problems = check_kinetics(experiment_dir.name, kinetics_df)
+        print(
+            f"{experiment_dir.name}: {len(kinetics_df)} ROIs, "
+            f"{kinetics_df['mono_decay_converged'].mean():.1%} mono and "
+            f"{kinetics_df['bi_decay_converged'].mean():.1%} bi-exponential decays converged"
+        )
+        problems.extend(experiment_problems)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
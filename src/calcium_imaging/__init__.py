@@ -1,4 +1,8 @@
+from .background_loading import ExperimentLoader, load_experiment_async
+from .catalog import CATALOG_FILE_NAME, build_catalog, load_catalog
 from .data_models import *
-from .instantiation import load_experiment
+from .instantiation import estimate_experiment_nbytes, load_experiment
 from .io import *
+from .out_of_core import analyze_research_out_of_core
+from .parameter_sweep import sweep_preprocessor_settings
 from .processing import *
@@ -1,7 +1,47 @@
 from .baseline_return_detection import detect_baseline_return_idx
+from .batch_least_squares import BatchFitResult, batch_variable_projection, separable_grid_search
+from .deconvolution import (
+    DECONVOLUTION_BASELINE_PERCENTILE,
+    DECONVOLUTION_MIN_SPIKE_SIGMAS,
+    DeconvolvedTrace,
+    deconvolve_trace,
+    estimate_ar1_decay,
+    oasis_ar1,
+)
 from .eflux_calculation import calculate_eflux_linear_coefficients, detect_eflux_start_index, detect_eflux_end_index
+from .event_detection import (
+    EVENT_COLUMNS,
+    EVENT_HIGH_THRESHOLD_SIGMAS,
+    EVENT_LOW_THRESHOLD_SIGMAS,
+    EVENT_MIN_AMPLITUDE,
+    EVENT_MIN_DURATION_FRAMES,
+    detect_events,
+    estimate_noise_sigma,
+)
 from .influx_calculation import calculate_influx_linear_coefficients
+from .kinetic_fitting import fit_decay_kinetics, fit_kinetics, fit_rise_kinetics
 from .linear_fit import linear_fit
+from .metric_registry import (
+    RESERVED_METRIC_NAMES,
+    Metric,
+    MetricFunc,
+    RoiIndexes,
+    calculate_metrics,
+    get_registered_metrics,
+    register_metric,
+    unregister_metric,
+)
 from .onset_detection import detect_onset_index
 from .peak_detection import detect_peak_index
+from .post_peak_metrics import calculate_post_peak_metrics
 from .regression_coefficients import RegressionCoefficients1D
+from .resampling import ResampledTraces, make_resampling_grid, resample_trace_matrix, resample_traces
+from .synchrony import (
+    SYNCHRONY_MAX_LAG,
+    SynchronyMatrices,
+    calculate_synchrony,
+    mean_correlation_per_roi,
+    summarize_synchrony,
+)
+from .trace_accumulator import TraceAccumulator
+from .trace_matrix import TraceMatrix, build_trace_matrix, concat_trace_matrices, mean_over_rois
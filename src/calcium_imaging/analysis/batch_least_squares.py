@@ -0,0 +1,172 @@
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# basis(theta (..., p), x (n, m)) -> (..., m, q), the columns of the linear part of a separable model
+# given its non-linear parameters theta. Leading dims of theta broadcast against the rows of x:
+# theta of shape (g, 1, p) evaluates a grid for every series, theta of shape (n, p) one point per series.
+SeparableBasis = Callable[[np.ndarray, np.ndarray], np.ndarray]
+# basis_jacobian(theta, x) -> (..., m, q, p), derivative of every basis column by every non-linear parameter
+SeparableBasisJacobian = Callable[[np.ndarray, np.ndarray], np.ndarray]
+MAX_GRID_VALUES_PER_CHUNK = 2_000_000
+
+
+class BatchFitResult(NamedTuple):
+    nonlinear_params: np.ndarray  # (n_fits, p), e.g. decay rates
+    linear_params: np.ndarray  # (n_fits, q), e.g. amplitudes and offset
+    sse: np.ndarray  # (n_fits,) sum of squared residuals over the valid samples
+    r2: np.ndarray  # (n_fits,) coefficient of determination
+    converged: np.ndarray  # (n_fits,) bool
+
+
+def _solve_linear(columns: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Batched least squares for the linear coefficients, returns (coefs (..., q), gram inverse (..., q, q))."""
+    gram = np.einsum("...mq,...mr->...qr", columns, columns) + 1e-12 * np.eye(columns.shape[-1])
+    gram_inverse = np.linalg.pinv(gram, hermitian=True)
+    coefs = np.einsum("...qr,...mr,...m->...q", gram_inverse, columns, y)
+    return coefs, gram_inverse
+
+
+def _sum_of_squares(columns: np.ndarray, coefs: np.ndarray, y: np.ndarray) -> np.ndarray:
+    residuals = y - np.einsum("...mq,...q->...m", columns, coefs)
+    return np.einsum("...m,...m->...", residuals, residuals)
+
+
+def separable_grid_search(
+        basis: SeparableBasis,
+        grid: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        mask: np.ndarray
+) -> np.ndarray:
+    """
+    Global initialization for models that are linear given a few non-linear parameters.
+
+    For every point of `grid` (e.g. candidate decay rates) the linear coefficients (e.g. amplitudes
+    and offset) of all series are solved in closed form, and the grid point with the lowest SSE is
+    kept per series. Grid points are processed in chunks to bound memory.
+
+    Returns
+    -------
+    np.ndarray
+        (n_fits, n_nonlinear) best grid point per series.
+    """
+    y = np.where(mask, y, 0.0)
+    best_sse = np.full(len(y), np.inf)
+    best_grid_idx = np.zeros(len(y), dtype=int)
+    chunk_size = max(1, MAX_GRID_VALUES_PER_CHUNK // max(y.size, 1))
+    for start in range(0, len(grid), chunk_size):
+        columns = basis(grid[start:start + chunk_size, None, :], x) * mask[..., None]
+        coefs, _ = _solve_linear(columns, y[None])
+        sse = _sum_of_squares(columns, coefs, y[None])
+        chunk_best = sse.argmin(axis=0)
+        chunk_best_sse = sse[chunk_best, np.arange(len(y))]
+        better = chunk_best_sse < best_sse
+        best_sse[better] = chunk_best_sse[better]
+        best_grid_idx[better] = start + chunk_best[better]
+    return grid[best_grid_idx]
+
+
+def batch_variable_projection(
+        basis: SeparableBasis,
+        basis_jacobian: SeparableBasisJacobian,
+        x: np.ndarray,
+        y: np.ndarray,
+        mask: np.ndarray,
+        initial_params: np.ndarray,
+        lower_bounds: Optional[np.ndarray] = None,
+        upper_bounds: Optional[np.ndarray] = None,
+        max_iterations: int = 200,
+        tolerance: float = 1e-8
+) -> BatchFitResult:
+    """
+    Fits the same separable non-linear model to many independent series at once.
+
+    A separable model is a linear combination of basis columns that depend on a few non-linear
+    parameters, e.g. A * exp(-rate * t) + C. Levenberg-Marquardt only iterates on the non-linear
+    parameters; the linear ones are solved exactly at every step (variable projection, with
+    Kaufman's jacobian). Every iteration works on (n_fits, n_samples) arrays and solves all the
+    stacked normal equations in one call, so there is no Python loop over series. Series may have
+    different lengths, samples outside `mask` are ignored.
+
+    Parameters
+    ----------
+    basis, basis_jacobian : SeparableBasis, SeparableBasisJacobian
+        Vectorized basis columns and their derivatives by the non-linear parameters.
+    x, y : np.ndarray
+        (n_fits, n_samples) independent and dependent variables.
+    mask : np.ndarray
+        (n_fits, n_samples) bool, valid samples.
+    initial_params : np.ndarray
+        (n_fits, n_nonlinear) starting point, e.g. from `separable_grid_search`.
+    lower_bounds, upper_bounds : Optional[np.ndarray]
+        (n_nonlinear,) box constraints, parameters are clipped after every step.
+    max_iterations : int
+        Iteration cap, fits still improving after it are flagged as not converged.
+    tolerance : float
+        Relative decrease in SSE (or relative step size) under which a fit is converged.
+
+    Returns
+    -------
+    BatchFitResult
+        NamedTuple(nonlinear_params, linear_params, sse, r2, converged)
+    """
+    n_fits, n_params = initial_params.shape
+    lower_bounds = np.full(n_params, -np.inf) if lower_bounds is None else np.asarray(lower_bounds, dtype=float)
+    upper_bounds = np.full(n_params, np.inf) if upper_bounds is None else np.asarray(upper_bounds, dtype=float)
+    y = np.where(mask, y, 0.0)
+    theta = np.clip(np.asarray(initial_params, dtype=float), lower_bounds, upper_bounds)
+    columns = basis(theta, x) * mask[..., None]
+    coefs, _ = _solve_linear(columns, y)
+    sse = _sum_of_squares(columns, coefs, y)
+    damping = np.full(n_fits, 1e-3)
+    converged = np.zeros(n_fits, dtype=bool)
+
+    for _ in range(max_iterations):
+        active = np.flatnonzero(~converged)
+        if len(active) == 0:
+            break
+        t, xa, ya, ma = theta[active], x[active], y[active], mask[active]
+        cols = basis(t, xa) * ma[..., None]
+        c, gram_inverse = _solve_linear(cols, ya)
+        residuals = ya - np.einsum("nmq,nq->nm", cols, c)
+
+        # Kaufman: d(residual)/d(theta) ~= -(I - P) dPhi/dtheta c, P the projection on the basis columns
+        d_model = np.einsum("nmqp,nq->nmp", basis_jacobian(t, xa) * ma[..., None, None], c)
+        projected = np.einsum("nmq,nqr,nkr,nkp->nmp", cols, gram_inverse, cols, d_model, optimize=True)
+        jac = d_model - projected
+        jtj = np.einsum("nmk,nml->nkl", jac, jac)
+        gradient = np.einsum("nmk,nm->nk", jac, residuals)
+        diagonal = np.einsum("nkk->nk", jtj) + 1e-12
+        lhs = jtj + damping[active, None, None] * diagonal[:, :, None] * np.eye(n_params)
+        step = np.einsum("nkl,nl->nk", np.linalg.pinv(lhs), gradient)
+
+        candidate = np.clip(t + step, lower_bounds, upper_bounds)
+        candidate_cols = basis(candidate, xa) * ma[..., None]
+        candidate_coefs, _ = _solve_linear(candidate_cols, ya)
+        candidate_sse = _sum_of_squares(candidate_cols, candidate_coefs, ya)
+        improved = np.isfinite(candidate_sse) & (candidate_sse < sse[active])
+
+        relative_decrease = np.where(improved, (sse[active] - candidate_sse) / np.maximum(sse[active], 1e-300), 0.0)
+        relative_step = np.linalg.norm(candidate - t, axis=1) / (np.linalg.norm(t, axis=1) + 1e-12)
+        done = (improved & (relative_decrease < tolerance)) | (relative_step < tolerance)
+
+        theta[active[improved]] = candidate[improved]
+        sse[active[improved]] = candidate_sse[improved]
+        damping[active] = np.where(improved, damping[active] / 10, damping[active] * 10)
+        converged[active[done]] = True
+        converged[active[damping[active] > 1e12]] = True  # no descent direction left, at a minimum
+
+    columns = basis(theta, x) * mask[..., None]
+    coefs, _ = _solve_linear(columns, y)
+    y_mean = y.sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+    centered = np.where(mask, y - y_mean[:, None], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = 1 - sse / np.einsum("nm,nm->n", centered, centered)
+    return BatchFitResult(
+        nonlinear_params=theta,
+        linear_params=coefs,
+        sse=sse,
+        r2=r2,
+        converged=converged & np.isfinite(sse),
+    )
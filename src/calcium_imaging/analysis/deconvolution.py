@@ -0,0 +1,151 @@
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .event_detection import MAD_TO_SIGMA
+
+DECONVOLUTION_BASELINE_PERCENTILE = 10.0  # baseline fluorescence is a low percentile of the trace
+DECONVOLUTION_MIN_SPIKE_SIGMAS = 1.0  # smaller increments of activity are merged into the decay
+DECONVOLUTION_MAX_DECAY = 0.999  # AR(1) coefficients are clipped to [0, max], 1 would never decay
+
+
+class DeconvolvedTrace(NamedTuple):
+    calcium: np.ndarray  # (n_frames,) denoised trace, baseline included, NaN where the trace is
+    activity: np.ndarray  # (n_frames,) inferred non-negative activity (spikes), NaN where the trace is
+    baseline: float
+    decay: float  # AR(1) coefficient g, calcium decays by g per frame
+    noise_sigma: float
+
+
+def estimate_ar1_decay(trace: np.ndarray) -> float:
+    """
+    AR(1) coefficient of a trace from its autocovariance, g = acov(2) / acov(1). Lag 0 is left out as
+    it includes the noise variance, so the estimate isn't biased towards 0 by noise.
+    """
+    trace = trace[~np.isnan(trace)]
+    if len(trace) < 4:
+        return 0.0
+    centered = trace - trace.mean()
+    acov1 = np.dot(centered[1:], centered[:-1])
+    acov2 = np.dot(centered[2:], centered[:-2])
+    if acov1 <= 0:
+        return 0.0
+    return float(np.clip(acov2 / acov1, 0.0, DECONVOLUTION_MAX_DECAY))
+
+
+def oasis_ar1(y: np.ndarray, g: float, sparsity: float = 0.0, min_spike: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    OASIS (Friedrich, Zhou & Paninski 2017) for the AR(1) model c_t = g c_{t-1} + s_t, s_t >= 0:
+    minimizes 1/2 ||y - c||^2 + sparsity * sum(s) in linear time.
+
+    Frames are added one by one as pools of constant activity-free decay. While a pool's start
+    value is below the decayed end of the previous pool (plus `min_spike`), the two pools are
+    merged into their joint least squares fit, pool adjacent violators style. Every frame is added
+    once and merged at most once, so the cost is O(n_frames).
+
+    Parameters
+    ----------
+    y : np.ndarray
+        (n_frames,) baseline-subtracted fluorescence, without NaNs.
+    g : float
+        AR(1) coefficient in [0, 1).
+    sparsity : float
+        L1 penalty on the activity.
+    min_spike : float
+        Smallest activity increment kept, smaller ones are merged into the preceding decay.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Denoised calcium c and activity s, both (n_frames,).
+    """
+    n_frames = len(y)
+    if n_frames == 0:
+        return np.zeros(0), np.zeros(0)
+    # the L1 penalty on s shifts y: sum(s) = (1 - g) sum(c[:-1]) + c[-1]
+    y = np.asarray(y, dtype=float) - sparsity * (1 - g)
+    y[-1] -= sparsity * g
+    y = y.tolist()  # Python floats, the loop below is scalar
+
+    values, weights, starts, lengths = [y[0]], [1.0], [0], [1]
+    for t in range(1, n_frames):
+        value, weight, length = y[t], 1.0, 1
+        # merge while the new pool doesn't rise enough above the previous one's decayed end
+        while values and values[-1] * g ** lengths[-1] + min_spike > value:
+            decay = g ** lengths[-1]
+            previous_weight = weights.pop()
+            merged_weight = previous_weight + decay * decay * weight
+            value = (previous_weight * values.pop() + decay * weight * value) / merged_weight
+            weight = merged_weight
+            length += lengths.pop()
+            starts.pop()
+        values.append(value)
+        weights.append(weight)
+        starts.append(t - length + 1)
+        lengths.append(length)
+
+    calcium = np.empty(n_frames)
+    for value, start, length in zip(values, starts, lengths):
+        calcium[start:start + length] = max(value, 0.0) * g ** np.arange(length)
+    activity = calcium.copy()
+    activity[1:] -= g * calcium[:-1]
+    return calcium, np.maximum(activity, 0.0)
+
+
+def deconvolve_trace(
+        trace: np.ndarray,
+        decay: Optional[float] = None,
+        sparsity: float = 0.0,
+        min_spike_sigmas: float = DECONVOLUTION_MIN_SPIKE_SIGMAS,
+        baseline_percentile: float = DECONVOLUTION_BASELINE_PERCENTILE
+) -> DeconvolvedTrace:
+    """
+    Infers the activity underlying one fluorescence trace with an AR(1) calcium model, see `oasis_ar1`.
+
+    The baseline is the `baseline_percentile` of the trace, the noise level is estimated from the
+    median absolute frame-to-frame difference (as in `estimate_noise_sigma`), and the decay per
+    frame from the trace's autocovariance unless given.
+
+    Parameters
+    ----------
+    trace : np.ndarray
+        (n_frames,) fluorescence, e.g. F/F0. NaN frames are filled with the baseline and are NaN in
+        the outputs.
+    decay : Optional[float]
+        AR(1) coefficient, estimated per trace by default (see `estimate_ar1_decay`).
+    sparsity : float
+        L1 penalty on the activity, in units of the trace.
+    min_spike_sigmas : float
+        Smallest activity increment kept, in noise standard deviations.
+    baseline_percentile : float
+        Percentile of the trace taken as its baseline.
+
+    Returns
+    -------
+    DeconvolvedTrace
+        NamedTuple(calcium, activity, baseline, decay, noise_sigma)
+    """
+    trace = np.asarray(trace, dtype=float)
+    valid = ~np.isnan(trace)
+    if not np.any(valid):
+        nan_trace = np.full(len(trace), np.nan)
+        return DeconvolvedTrace(nan_trace, nan_trace.copy(), np.nan, np.nan, np.nan)
+    baseline = float(np.percentile(trace[valid], baseline_percentile))
+    noise_sigma = float(np.median(np.abs(np.diff(trace[valid])))) * MAD_TO_SIGMA if valid.sum() > 1 else 0.0
+    decay = estimate_ar1_decay(trace) if decay is None else decay
+    if not 0 <= decay < 1:
+        raise ValueError(f"AR(1) decay must be in [0, 1), got {decay}.")
+
+    calcium, activity = oasis_ar1(
+        np.where(valid, trace - baseline, 0.0),
+        g=decay,
+        sparsity=sparsity,
+        min_spike=min_spike_sigmas * noise_sigma,
+    )
+    return DeconvolvedTrace(
+        calcium=np.where(valid, calcium + baseline, np.nan),
+        activity=np.where(valid, activity, np.nan),
+        baseline=baseline,
+        decay=decay,
+        noise_sigma=noise_sigma,
+    )
@@ -24,12 +24,14 @@ def calculate_eflux_linear_coefficients(
     return linear_coefficients
 
 
-def detect_eflux_start_index(trace: pd.Series) -> int:
-    return detect_peak_index(trace) + EFLUX_START_INDEX_OFFSET_FROM_PEAK
+def detect_eflux_start_index(trace: pd.Series, peak_idx: Optional[int] = None) -> int:
+    if peak_idx is None:
+        peak_idx = detect_peak_index(trace)
+    return peak_idx + EFLUX_START_INDEX_OFFSET_FROM_PEAK
 
 
-def detect_eflux_end_index(trace: pd.Series) -> int:
-    start_idx = detect_eflux_start_index(trace)
+def detect_eflux_end_index(trace: pd.Series, peak_idx: Optional[int] = None) -> int:
+    start_idx = detect_eflux_start_index(trace, peak_idx)
     end_idx = min(
         start_idx + EFLUX_END_INDEX_MAX_OFFSET_FROM_START,
         trace.index.values.max()  # prevent out of bounds
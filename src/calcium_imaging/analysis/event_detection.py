@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from .trace_matrix import TraceMatrix
+
+EVENT_BASELINE_LEVEL = 1.0  # normalized baseline fluorescence
+EVENT_LOW_THRESHOLD_SIGMAS = 2.0  # an event lasts while the trace stays above baseline + low * noise
+EVENT_HIGH_THRESHOLD_SIGMAS = 5.0  # and must reach baseline + high * noise at least once
+EVENT_MIN_AMPLITUDE = 0.1  # and must rise at least this much above baseline
+EVENT_MIN_DURATION_FRAMES = 3
+EVENT_COLUMNS = ["event", "onset_frame", "peak_frame", "end_frame", "amplitude", "influx", "eflux", "integral"]
+MAD_TO_SIGMA = 1 / (0.6745 * np.sqrt(2))  # robust std of white noise from the median absolute first difference
+
+
+def _prefix_sums(values: np.ndarray) -> np.ndarray:
+    """(n_rois, n_frames) -> (n_rois, n_frames + 1) cumulative sums, so a segment sum is two lookups."""
+    return np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)], axis=1)
+
+
+def _ranges(lengths: np.ndarray) -> np.ndarray:
+    """Concatenated np.arange(length) for every length, without a Python loop."""
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(lengths.sum()) - offsets
+
+
+def _segment_slopes(
+        x: np.ndarray,
+        y: np.ndarray,
+        rois: np.ndarray,
+        start: np.ndarray,
+        end: np.ndarray
+) -> np.ndarray:
+    """Least squares slope of y over x for every [start, end] (inclusive) segment of a row, NaNs ignored."""
+    valid = ~np.isnan(y)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    sums = [_prefix_sums(v) for v in (valid.astype(float), x, y, x * x, x * y)]
+    n, sx, sy, sxx, sxy = [s[rois, end + 1] - s[rois, start] for s in sums]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    return np.where(n >= 2, slopes, np.nan)
+
+
+def estimate_noise_sigma(trace_matrix: TraceMatrix) -> np.ndarray:
+    """Robust per-ROI noise level, from the median absolute frame-to-frame difference."""
+    return np.nanmedian(np.abs(np.diff(trace_matrix.traces, axis=0)), axis=0) * MAD_TO_SIGMA
+
+
+def detect_events(
+        trace_matrix: TraceMatrix,
+        baseline_level: float = EVENT_BASELINE_LEVEL,
+        low_threshold_sigmas: float = EVENT_LOW_THRESHOLD_SIGMAS,
+        high_threshold_sigmas: float = EVENT_HIGH_THRESHOLD_SIGMAS,
+        min_amplitude: float = EVENT_MIN_AMPLITUDE,
+        min_duration_frames: int = EVENT_MIN_DURATION_FRAMES
+) -> pd.DataFrame:
+    """
+    Detects every transient of every ROI of the trace matrix, with hysteresis thresholds.
+
+    A transient is a run of consecutive frames above `baseline + low_threshold_sigmas * noise`
+    that reaches `baseline + max(high_threshold_sigmas * noise, min_amplitude)` at least once.
+    Runs, peaks and per-event metrics are found with a single pass of vectorized run-length and
+    cumulative sum operations over the whole matrix, so the cost is linear in the number of samples.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Normalized traces of the ROIs.
+    baseline_level : float
+        Baseline fluorescence of the normalized traces.
+    low_threshold_sigmas, high_threshold_sigmas : float
+        Hysteresis thresholds above baseline, in units of the ROI's noise level.
+    min_amplitude : float
+        Minimal peak height above baseline, regardless of the noise level.
+    min_duration_frames : int
+        Shorter runs are discarded.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per event with the ROI's column position in the matrix (`roi_position`), the event
+        number within the ROI, onset / peak / end frames, amplitude, influx (slope from onset to peak),
+        eflux (slope from peak to end) and integral (trapezoid from onset to end).
+    """
+    traces = trace_matrix.traces.T  # (n_rois, n_frames), every ROI is a contiguous row
+    n_rois, n_frames = traces.shape
+    noise = estimate_noise_sigma(trace_matrix)[:, None]
+    low = baseline_level + low_threshold_sigmas * noise
+    high = baseline_level + np.maximum(high_threshold_sigmas * noise, min_amplitude)
+    above_low = traces > low  # NaN is never above
+    above_high = traces > high
+
+    # runs of frames above the low threshold: +1 / -1 transitions of the padded mask
+    padded = np.pad(above_low, ((0, 0), (1, 1))).astype(np.int8)
+    transitions = np.diff(padded, axis=1)
+    rois, start = np.nonzero(transitions == 1)
+    _, stop = np.nonzero(transitions == -1)  # exclusive, same (roi, run) order as the starts
+    end = stop - 1
+
+    high_counts = _prefix_sums(above_high)
+    keep = (high_counts[rois, stop] > high_counts[rois, start]) & (stop - start >= min_duration_frames)
+    rois, start, end = rois[keep], start[keep], end[keep]
+    if len(rois) == 0:
+        return pd.DataFrame(columns=["roi_position"] + EVENT_COLUMNS)
+
+    # peak of every run: maximum of its segment of the flattened rows, then the first frame that reaches it
+    flat = np.append(np.where(np.isnan(traces), -np.inf, traces).ravel(), -np.inf)  # pad, so run ends are valid indexes
+    lengths = end - start + 1
+    flat_start = rois * n_frames + start
+    run_max = np.maximum.reduceat(flat, np.column_stack([flat_start, flat_start + lengths]).ravel())[::2]
+    run_ids = np.full(flat.size, -1)
+    run_ids[np.repeat(flat_start, lengths) + _ranges(lengths)] = np.repeat(np.arange(len(rois)), lengths)
+    at_max = np.flatnonzero((run_ids >= 0) & (flat == run_max[run_ids]))
+    _, first_at_max = np.unique(run_ids[at_max], return_index=True)
+    peak = at_max[first_at_max] - rois * n_frames
+
+    frames = np.broadcast_to(trace_matrix.frames.astype(float), traces.shape)
+    times = trace_matrix.times.T
+    areas = np.nan_to_num((traces[:, 1:] + traces[:, :-1]) / 2 * np.diff(times, axis=1))  # NaNs are never inside an event
+    areas = np.concatenate([areas, np.zeros((n_rois, 1))], axis=1)
+    cumulative_areas = _prefix_sums(areas)
+
+    event_number = np.arange(len(rois)) - np.searchsorted(rois, rois)
+    return pd.DataFrame({
+        "roi_position": rois,
+        "event": event_number,
+        "onset_frame": trace_matrix.frames[start],
+        "peak_frame": trace_matrix.frames[peak],
+        "end_frame": trace_matrix.frames[end],
+        "amplitude": traces[rois, peak] - baseline_level,
+        "influx": _segment_slopes(frames, traces, rois, start, peak),
+        "eflux": _segment_slopes(frames, traces, rois, peak, end),
+        "integral": cumulative_areas[rois, end] - cumulative_areas[rois, start],
+    })
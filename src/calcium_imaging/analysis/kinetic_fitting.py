@@ -0,0 +1,249 @@
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from .batch_least_squares import batch_variable_projection, separable_grid_search
+from .trace_matrix import TraceMatrix
+
+DECAY_WINDOW_FRAMES = 60
+RISE_PRE_ONSET_FRAMES = 10
+RISE_MODELS = ("sigmoid", "exponential")
+MIN_RATE = 1e-3  # 1 / frames
+MAX_RATE = 10.0  # 1 / frames
+RATE_GRID = np.geomspace(MIN_RATE, MAX_RATE, 60)
+BI_EXPONENTIAL_MIN_RATE_RATIO = 1.5  # fast / slow rate, keeps the grid away from the degenerate tau_fast == tau_slow
+SIGMOID_10_90_FACTOR = 2 * np.log(9)  # 10%-90% rise time of a logistic curve, in units of its width
+
+
+# --- separable models: basis columns given the non-linear parameters theta, and their derivatives ---
+# x is in frames after the window anchor (peak for decay, onset for rise); the sigmoid uses x scaled by
+# the onset-to-peak duration so a single grid fits ROIs with very different rise durations.
+
+def _mono_exponential_basis(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    decay = np.exp(-theta[..., 0, None] * x)
+    return np.stack([decay, np.ones_like(decay)], axis=-1)
+
+
+def _mono_exponential_basis_jacobian(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    d_decay = -x * np.exp(-theta[..., 0, None] * x)
+    return np.stack([d_decay, np.zeros_like(d_decay)], axis=-1)[..., None]
+
+
+def _bi_exponential_basis(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    decay_1 = np.exp(-theta[..., 0, None] * x)
+    decay_2 = np.exp(-theta[..., 1, None] * x)
+    return np.stack([decay_1, decay_2, np.ones_like(decay_1)], axis=-1)
+
+
+def _bi_exponential_basis_jacobian(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    d_decay_1 = -x * np.exp(-theta[..., 0, None] * x)
+    d_decay_2 = -x * np.exp(-theta[..., 1, None] * x)
+    zeros = np.zeros_like(d_decay_1)
+    return np.stack([
+        np.stack([d_decay_1, zeros], axis=-1),
+        np.stack([zeros, d_decay_2], axis=-1),
+        np.stack([zeros, zeros], axis=-1),
+    ], axis=-2)
+
+
+def _logistic(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        return 1 / (1 + np.exp(-(x - theta[..., 0, None]) / theta[..., 1, None]))
+
+
+def _sigmoid_basis(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    s = _logistic(theta, x)
+    return np.stack([s, np.ones_like(s)], axis=-1)
+
+
+def _sigmoid_basis_jacobian(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    midpoint, width = theta[..., 0, None], theta[..., 1, None]
+    s = _logistic(theta, x)
+    d_midpoint = -s * (1 - s) / width
+    d_width = d_midpoint * (x - midpoint) / width
+    zeros = np.zeros_like(s)
+    return np.stack([np.stack([d_midpoint, d_width], axis=-1), np.stack([zeros, zeros], axis=-1)], axis=-2)
+
+
+def _exponential_rise_basis(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    rise = 1 - np.exp(-theta[..., 0, None] * x)
+    return np.stack([rise, np.ones_like(rise)], axis=-1)
+
+
+def _exponential_rise_basis_jacobian(theta: np.ndarray, x: np.ndarray) -> np.ndarray:
+    d_rise = x * np.exp(-theta[..., 0, None] * x)
+    return np.stack([d_rise, np.zeros_like(d_rise)], axis=-1)[..., None]
+
+
+def _has_enough_samples(mask: np.ndarray, n_params: int) -> np.ndarray:
+    return mask.sum(axis=1) > n_params
+
+
+def _at_rate_bounds(rates: np.ndarray) -> np.ndarray:
+    """Rates the fit pushed to MIN_RATE or MAX_RATE: the data doesn't constrain them, they aren't estimates."""
+    return np.isclose(rates, MIN_RATE, rtol=1e-9, atol=0) | np.isclose(rates, MAX_RATE, rtol=1e-9, atol=0)
+
+
+def fit_decay_kinetics(
+        trace_matrix: TraceMatrix,
+        peak_indexes: Sequence[int],
+        window_frames: int = DECAY_WINDOW_FRAMES
+) -> pd.DataFrame:
+    """
+    Fits mono- and bi-exponential decays to the post-peak window of every ROI in one batch.
+
+    Models, with t in frames after the peak:
+        mono: A * exp(-t / tau) + C
+        bi:   A_fast * exp(-t / tau_fast) + A_slow * exp(-t / tau_slow) + C
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs to fit.
+    peak_indexes : Sequence[int]
+        Peak frame of every ROI (column) of the trace matrix.
+    window_frames : int
+        Number of frames after the peak to fit.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per ROI with the fitted taus (in frames), R^2 and convergence flags. Taus are NaN and
+        the fit not converged where a rate ends at MIN_RATE or MAX_RATE. Bi-exponential fits with a
+        negative amplitude (components cancelling out, so the fast fraction isn't in [0, 1]) are
+        degenerate and reported the same way.
+    """
+    start = trace_matrix.frame_positions(peak_indexes)
+    y, mask = trace_matrix.get_windows(start, start + window_frames)
+    x = np.broadcast_to(np.arange(y.shape[1], dtype=float), y.shape)
+    enough_samples = _has_enough_samples(mask, 5)
+
+    # global initialization on a grid of rates, then refinement of the rates
+    mono = batch_variable_projection(
+        _mono_exponential_basis, _mono_exponential_basis_jacobian, x, y, mask,
+        initial_params=separable_grid_search(_mono_exponential_basis, RATE_GRID[:, None], x, y, mask),
+        lower_bounds=[MIN_RATE],
+        upper_bounds=[MAX_RATE],
+    )
+
+    fast_rates, slow_rates = np.meshgrid(RATE_GRID[::2], RATE_GRID[::2], indexing="ij")
+    rate_pairs = np.column_stack([fast_rates.ravel(), slow_rates.ravel()])
+    rate_pairs = rate_pairs[rate_pairs[:, 0] >= BI_EXPONENTIAL_MIN_RATE_RATIO * rate_pairs[:, 1]]
+    bi = batch_variable_projection(
+        _bi_exponential_basis, _bi_exponential_basis_jacobian, x, y, mask,
+        initial_params=separable_grid_search(_bi_exponential_basis, rate_pairs, x, y, mask),
+        lower_bounds=[MIN_RATE, MIN_RATE],
+        upper_bounds=[MAX_RATE, MAX_RATE],
+    )
+    (rate_1, rate_2), (amplitude_1, amplitude_2, _) = bi.nonlinear_params.T, bi.linear_params.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fast_fraction = np.where(rate_1 >= rate_2, amplitude_1, amplitude_2) / (amplitude_1 + amplitude_2)
+
+    mono_rate = mono.nonlinear_params[:, 0]
+    mono_valid = ~_at_rate_bounds(mono_rate)
+    bi_valid = (
+        ~_at_rate_bounds(rate_1) & ~_at_rate_bounds(rate_2)
+        & (amplitude_1 >= 0) & (amplitude_2 >= 0) & (amplitude_1 + amplitude_2 > 0)
+    )
+    df = pd.DataFrame({
+        "mono_decay_tau": np.where(mono_valid, 1 / mono_rate, np.nan),
+        "mono_decay_r2": mono.r2,
+        "mono_decay_converged": mono.converged & enough_samples & mono_valid,
+        "bi_decay_tau_fast": np.where(bi_valid, 1 / np.maximum(rate_1, rate_2), np.nan),
+        "bi_decay_tau_slow": np.where(bi_valid, 1 / np.minimum(rate_1, rate_2), np.nan),
+        "bi_decay_fast_fraction": np.where(bi_valid, fast_fraction, np.nan),
+        "bi_decay_r2": bi.r2,
+        "bi_decay_converged": bi.converged & enough_samples & bi_valid,
+    })
+    df.loc[~enough_samples, df.columns[df.dtypes != bool]] = np.nan
+    return df
+
+
+def fit_rise_kinetics(
+        trace_matrix: TraceMatrix,
+        onset_indexes: Sequence[int],
+        peak_indexes: Sequence[int],
+        model: str = "sigmoid",
+        pre_onset_frames: int = RISE_PRE_ONSET_FRAMES
+) -> pd.DataFrame:
+    """
+    Fits the rising phase (onset to peak) of every ROI in one batch.
+
+    Models, with t in frames after the onset:
+        sigmoid:     A / (1 + exp(-(t - t_half) / w)) + C, fitted from `pre_onset_frames` before the onset
+        exponential: A * (1 - exp(-t / tau)) + C, fitted from the onset
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs to fit.
+    onset_indexes, peak_indexes : Sequence[int]
+        Onset and peak frame of every ROI (column) of the trace matrix.
+    model : str
+        'sigmoid' or 'exponential'.
+    pre_onset_frames : int
+        Baseline frames included before the onset for the sigmoid model.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per ROI. Sigmoid: half-rise frame and 10%-90% rise time (frames); exponential: rise tau
+        (frames, NaN and not converged where the rate ends at a bound). Both with R^2 and a convergence flag.
+    """
+    if model not in RISE_MODELS:
+        raise ValueError(f"Unsupported rise model '{model}', expected one of {RISE_MODELS}.")
+    onset = trace_matrix.frame_positions(onset_indexes)
+    peak = trace_matrix.frame_positions(peak_indexes)
+    pre_frames = pre_onset_frames if model == "sigmoid" else 0
+    y, mask = trace_matrix.get_windows(onset - pre_frames, peak)
+    x = np.broadcast_to(np.arange(y.shape[1], dtype=float) - pre_frames, y.shape)
+    rise_frames = np.maximum(peak - onset, 1).astype(float)
+
+    if model == "sigmoid":
+        n_params = 4
+        x = x / rise_frames[:, None]  # 0 at the onset, 1 at the peak
+        midpoints, widths = np.meshgrid(np.linspace(-0.5, 1.0, 16), np.geomspace(0.01, 1.0, 12), indexing="ij")
+        grid = np.column_stack([midpoints.ravel(), widths.ravel()])
+        fit = batch_variable_projection(
+            _sigmoid_basis, _sigmoid_basis_jacobian, x, y, mask,
+            initial_params=separable_grid_search(_sigmoid_basis, grid, x, y, mask),
+            lower_bounds=[-1.0, 0.005],
+            upper_bounds=[1.5, 2.0],
+        )
+        midpoint, width = fit.nonlinear_params.T
+        valid = np.ones(len(midpoint), dtype=bool)
+        df = pd.DataFrame({
+            "rise_half_frame": trace_matrix.frames[onset] + midpoint * rise_frames,
+            "rise_time_10_90": SIGMOID_10_90_FACTOR * width * rise_frames,
+        })
+    else:
+        n_params = 3
+        fit = batch_variable_projection(
+            _exponential_rise_basis, _exponential_rise_basis_jacobian, x, y, mask,
+            initial_params=separable_grid_search(_exponential_rise_basis, RATE_GRID[:, None], x, y, mask),
+            lower_bounds=[MIN_RATE],
+            upper_bounds=[MAX_RATE],
+        )
+        rise_rate = fit.nonlinear_params[:, 0]
+        valid = ~_at_rate_bounds(rise_rate)
+        df = pd.DataFrame({"rise_tau": np.where(valid, 1 / rise_rate, np.nan)})
+
+    enough_samples = _has_enough_samples(mask, n_params)
+    df["rise_r2"] = fit.r2
+    df.loc[~enough_samples] = np.nan
+    df["rise_converged"] = fit.converged & enough_samples & valid
+    return df
+
+
+def fit_kinetics(
+        trace_matrix: TraceMatrix,
+        onset_indexes: Sequence[int],
+        peak_indexes: Sequence[int],
+        rise_model: str = "sigmoid",
+        decay_window_frames: int = DECAY_WINDOW_FRAMES
+) -> pd.DataFrame:
+    """Decay and rise fits for every ROI of the trace matrix, see `fit_decay_kinetics` and `fit_rise_kinetics`."""
+    decay_df = fit_decay_kinetics(trace_matrix, peak_indexes, window_frames=decay_window_frames)
+    rise_df = fit_rise_kinetics(trace_matrix, onset_indexes, peak_indexes, model=rise_model)
+    return pd.concat([decay_df, rise_df], axis=1)
@@ -0,0 +1,195 @@
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .post_peak_metrics import BASELINE_LEVEL, TAU_REMAINING_FRACTION, _first_true_row, _trapezoid_integrals
+from .trace_matrix import TraceMatrix
+
+RESERVED_METRIC_NAMES = ("experiment_name", "group_type", "coverslip", "roi", "onset_frame", "peak_frame")
+
+
+class RoiIndexes(NamedTuple):
+    """
+    Every ROI's indexes as row positions in a trace matrix, one (n_rois,) array per field. Positions
+    derived from offsets (e.g. eflux_start) may fall outside the matrix, `TraceMatrix.get_windows` masks them.
+    """
+    onset: np.ndarray
+    peak: np.ndarray
+    influx_start: np.ndarray
+    influx_end: np.ndarray
+    eflux_start: np.ndarray
+    eflux_end: np.ndarray
+    baseline_return: np.ndarray
+    last: np.ndarray  # last frame of the ROI's trace
+
+    @classmethod
+    def from_frames(cls, trace_matrix: TraceMatrix, **frame_indexes: Sequence[int]) -> "RoiIndexes":
+        """Converts frame index labels (e.g. `roi.peak_idx` for every ROI), one keyword per field, to row positions."""
+        if np.any(np.diff(trace_matrix.frames) != 1):
+            raise ValueError("Metrics require a trace matrix with consecutive frame indexes.")
+        missing = [field for field in cls._fields if field not in frame_indexes]
+        if missing:
+            raise ValueError(f"Missing ROI indexes {missing}.")
+        first_frame = trace_matrix.frames[0] if trace_matrix.n_frames > 0 else 0
+        return cls(**{field: np.asarray(frame_indexes[field], dtype=np.int64) - first_frame for field in cls._fields})
+
+
+MetricFunc = Callable[[TraceMatrix, RoiIndexes], np.ndarray]
+
+
+class Metric(NamedTuple):
+    name: str
+    func: MetricFunc  # (trace_matrix, indexes) -> (n_rois,) values
+    description: str
+
+
+_METRICS: Dict[str, Metric] = {}
+
+
+def register_metric(
+        name: str,
+        func: Optional[MetricFunc] = None,
+        description: str = "",
+        overwrite: bool = False
+) -> Callable:
+    """
+    Registers a per-ROI metric computed for all ROIs at once, as a column of the full analysis table
+    (`Experiment.get_full_analysis_df`) and everything built on it (exports, results database,
+    out-of-core runs). Metrics are evaluated in registration order.
+
+    Usable as a decorator, `@register_metric("peak_time")`, or as a call, `register_metric("peak_time", func)`.
+
+    Parameters
+    ----------
+    name : str
+        Column name of the metric.
+    func : Optional[MetricFunc]
+        Function of the trace matrix (frames, (n_frames, n_rois) traces and times) and the ROIs'
+        `RoiIndexes`, returning one value per ROI (column).
+    description : str
+        One line shown by `get_registered_metrics`.
+    overwrite : bool
+        Replace a metric already registered under `name`, keeping its position.
+
+    Returns
+    -------
+    Callable
+        `func` (or the decorator if `func` is not given).
+    """
+    if name in RESERVED_METRIC_NAMES:
+        raise ValueError(f"'{name}' is a key column of the analysis table, choose another metric name.")
+
+    def decorator(metric_func: MetricFunc) -> MetricFunc:
+        if name in _METRICS and not overwrite:
+            raise ValueError(f"Metric '{name}' is already registered, pass overwrite=True to replace it.")
+        _METRICS[name] = Metric(name=name, func=metric_func, description=description)
+        return metric_func
+
+    return decorator if func is None else decorator(func)
+
+
+def unregister_metric(name: str) -> None:
+    if name not in _METRICS:
+        raise ValueError(f"Unknown metric '{name}', expected any of {list(_METRICS)}.")
+    del _METRICS[name]
+
+
+def get_registered_metrics() -> pd.DataFrame:
+    """One row per registered metric, in evaluation order, with its name and description."""
+    return pd.DataFrame(
+        [(metric.name, metric.description) for metric in _METRICS.values()], columns=["name", "description"]
+    )
+
+
+def calculate_metrics(
+        trace_matrix: TraceMatrix,
+        indexes: RoiIndexes,
+        names: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """
+    Evaluates registered metrics for every ROI (column) of the trace matrix, one batch call per metric.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs, with consecutive frame indexes.
+    indexes : RoiIndexes
+        Every ROI's indexes as row positions, see `RoiIndexes.from_frames`.
+    names : Optional[Sequence[str]]
+        Metrics to evaluate, all registered ones by default.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per ROI, one column per metric.
+    """
+    names = list(_METRICS) if names is None else list(names)
+    unknown = [name for name in names if name not in _METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown}, expected any of {list(_METRICS)}.")
+    if trace_matrix.n_rois == 0:
+        return pd.DataFrame(columns=names, dtype=float)
+    columns: Dict[str, np.ndarray] = {}
+    for name in names:
+        values = np.asarray(_METRICS[name].func(trace_matrix, indexes))
+        if values.shape != (trace_matrix.n_rois,):
+            raise ValueError(f"Metric '{name}' returned shape {values.shape}, expected ({trace_matrix.n_rois},).")
+        columns[name] = values
+    return pd.DataFrame(columns, index=pd.RangeIndex(trace_matrix.n_rois))
+
+
+def _window_slopes(trace_matrix: TraceMatrix, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Least squares slope per frame of every ROI's trace from row `start` to row `end` (inclusive), as
+    `linear_fit` but for all ROIs at once. NaN for windows with fewer than two samples.
+    """
+    windows, valid = trace_matrix.get_windows(start, end)
+    x = np.where(valid, np.arange(windows.shape[1], dtype=float), 0.0)  # slope doesn't depend on the frame offset
+    y = np.where(valid, windows, 0.0)
+    counts = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = x.sum(axis=1) / counts
+        y_mean = y.sum(axis=1) / counts
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        slopes = (dx * (y - y_mean[:, None])).sum(axis=1) / (dx * dx).sum(axis=1)
+    return np.where((counts >= 2) & (end > start), slopes, np.nan)
+
+
+def _warn_about_sign(values: np.ndarray, bad: np.ndarray, description: str) -> None:
+    if np.any(bad):
+        print(f"Warning: {description} for {int(bad.sum())} of {len(values)} ROIs")
+
+
+@register_metric("eflux", description="Slope per frame of the trace over the eflux window.")
+def _calculate_eflux(trace_matrix: TraceMatrix, indexes: RoiIndexes) -> np.ndarray:
+    slopes = _window_slopes(trace_matrix, indexes.eflux_start, indexes.eflux_end)
+    _warn_about_sign(slopes, slopes >= 0, "eflux is non-negative")
+    return slopes
+
+
+@register_metric("influx", description="Slope per frame of the trace from onset to peak.")
+def _calculate_influx(trace_matrix: TraceMatrix, indexes: RoiIndexes) -> np.ndarray:
+    slopes = _window_slopes(trace_matrix, indexes.influx_start, indexes.influx_end)
+    _warn_about_sign(slopes, slopes <= 0, "influx is non-positive")
+    return slopes
+
+
+@register_metric("amplitude", description="Peak value above the normalized baseline.")
+def _calculate_amplitude(trace_matrix: TraceMatrix, indexes: RoiIndexes) -> np.ndarray:
+    return trace_matrix.traces[indexes.peak, np.arange(trace_matrix.n_rois)] - BASELINE_LEVEL
+
+
+@register_metric("integral", description="Trapezoid integral over time from onset to baseline return.")
+def _calculate_integral(trace_matrix: TraceMatrix, indexes: RoiIndexes) -> np.ndarray:
+    end = np.minimum(indexes.baseline_return + 1, indexes.last)
+    return _trapezoid_integrals(trace_matrix.traces, trace_matrix.times, indexes.onset, end)
+
+
+@register_metric("tau", description="Time from peak to 63.2% decay towards baseline.")
+def _calculate_tau(trace_matrix: TraceMatrix, indexes: RoiIndexes) -> np.ndarray:
+    cols = np.arange(trace_matrix.n_rois)
+    traces, times = trace_matrix.traces, trace_matrix.times
+    target_values = BASELINE_LEVEL + (traces[indexes.peak, cols] - BASELINE_LEVEL) * TAU_REMAINING_FRACTION
+    crossing = _first_true_row(traces <= target_values, indexes.peak, indexes.last, default=indexes.baseline_return)
+    return times[crossing, cols] - times[indexes.peak, cols]
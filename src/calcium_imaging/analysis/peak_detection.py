@@ -1,3 +1,5 @@
+from typing import Optional
+
 import pandas as pd
 from .onset_detection import detect_onset_index
 
@@ -7,14 +9,15 @@ def detect_peak_index(
         end_bound: int = 120,
         baseline_window: int = 30,
         sliding_window: int = 3,
-        threshold_factor: float = 3.0
+        threshold_factor: float = 3.0,
+        start_bound: Optional[int] = None
 ) -> int:
     """
     Detects a peak in a trace within the given bounds.
 
     Parameters:
     - trace: pd.Series of numeric values
-    - start_bound: start index for peak search
+    - start_bound: start index for peak search, defaults to the detected onset
     - end_bound: end index for peak search
     - baseline_window: window size before start_bound to estimate noise level
     - sliding_window: how many points to consider when comparing local max
@@ -23,7 +26,8 @@ def detect_peak_index(
     Returns:
     - Index of detected peak (int)
     """
-    start_bound = detect_onset_index(trace)
+    if start_bound is None:
+        start_bound = detect_onset_index(trace)
 
     baseline = trace.iloc[start_bound - baseline_window:start_bound]
     baseline_mean = baseline.mean()
@@ -37,4 +41,4 @@ def detect_peak_index(
             return trace.index[i]
 
     # fallback
-    return trace.index.values.iloc[start_bound:][trace.argmax()]
+    return trace.iloc[start_bound:].idxmax()
@@ -0,0 +1,115 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .eflux_calculation import (
+    EFLUX_END_INDEX_MAX_OFFSET_FROM_START,
+    EFLUX_END_INDEX_MIN_OFFSET_FROM_START,
+    EFLUX_START_INDEX_OFFSET_FROM_PEAK,
+)
+from .trace_matrix import TraceMatrix
+
+BASELINE_LEVEL = 1.0  # normalized baseline fluorescence
+TAU_REMAINING_FRACTION = 0.368  # 63.2% decay from peak
+
+
+def _first_true_row(condition: np.ndarray, start: np.ndarray, stop: np.ndarray, default: np.ndarray) -> np.ndarray:
+    """First row in [start, stop] (inclusive, per column) where `condition` holds, `default` if there is none."""
+    rows = np.arange(condition.shape[0])[:, None]
+    hits = condition & (rows >= start) & (rows <= stop)
+    return np.where(hits.any(axis=0), hits.argmax(axis=0), default)
+
+
+def _last_true_row(condition: np.ndarray, start: np.ndarray, stop: np.ndarray, default: np.ndarray) -> np.ndarray:
+    """Last row in [start, stop] (inclusive, per column) where `condition` holds, `default` if there is none."""
+    rows = np.arange(condition.shape[0])[:, None]
+    hits = condition & (rows >= start) & (rows <= stop)
+    return np.where(hits.any(axis=0), condition.shape[0] - 1 - hits[::-1].argmax(axis=0), default)
+
+
+def _trapezoid_integrals(traces: np.ndarray, times: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Trapezoid integral of every column from row `start` to row `end` (inclusive), from cumulative sums."""
+    areas = (traces[1:] + traces[:-1]) / 2 * np.diff(times, axis=0)
+    missing = np.isnan(areas)
+    cumulative_areas = np.vstack([np.zeros(areas.shape[1]), np.cumsum(np.where(missing, 0.0, areas), axis=0)])
+    cumulative_missing = np.vstack([np.zeros(areas.shape[1], dtype=int), np.cumsum(missing, axis=0)])
+
+    cols = np.arange(traces.shape[1])
+    end = np.maximum(end, start)  # empty segments integrate to 0, like np.trapz
+    integrals = cumulative_areas[end, cols] - cumulative_areas[start, cols]
+    has_missing = cumulative_missing[end, cols] > cumulative_missing[start, cols]
+    return np.where(has_missing, np.nan, integrals)
+
+
+def calculate_post_peak_metrics(
+        trace_matrix: TraceMatrix,
+        onset_indexes: Sequence[int],
+        peak_indexes: Sequence[int],
+        last_indexes: Optional[Sequence[int]] = None,
+        baseline_return_indexes: Optional[Sequence[int]] = None
+) -> pd.DataFrame:
+    """
+    Computes the post-peak metrics of every ROI of the trace matrix in one pass.
+
+    Batch equivalent of `detect_baseline_return_idx`, `detect_eflux_end_index`, `ROI.calculate_amplitude`,
+    `ROI.calculate_tau` and `ROI.calculate_integral`: every frame scan is a threshold crossing search over
+    the whole (n_frames, n_rois) matrix, and the integrals are differences of cumulative trapezoid sums.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs, with consecutive frame indexes.
+    onset_indexes, peak_indexes : Sequence[int]
+        Onset and peak frame of every ROI (column) of the trace matrix.
+    last_indexes : Optional[Sequence[int]]
+        Last frame of every ROI's trace (`roi.trace.index[-1]`), defaults to its last non-NaN frame.
+    baseline_return_indexes : Optional[Sequence[int]]
+        Baseline return frames to use instead of detecting them, e.g. after `roi.set_baseline_return_idx`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per ROI with baseline_return_frame, eflux_start_frame, eflux_end_frame, amplitude,
+        tau and integral.
+    """
+    frames, traces, times = trace_matrix
+    if np.any(np.diff(frames) != 1):
+        raise ValueError("Post-peak metrics require a trace matrix with consecutive frame indexes.")
+    cols = np.arange(trace_matrix.n_rois)
+    onset = trace_matrix.frame_positions(onset_indexes)
+    peak = trace_matrix.frame_positions(peak_indexes)
+    if last_indexes is None:
+        last = trace_matrix.n_frames - 1 - np.argmax(~np.isnan(traces[::-1]), axis=0)
+    else:
+        last = trace_matrix.frame_positions(last_indexes)
+
+    # first frame at or below baseline from the eflux start, the trace's last frame is only the fallback
+    eflux_start = peak + EFLUX_START_INDEX_OFFSET_FROM_PEAK
+    if baseline_return_indexes is None:
+        baseline_return = _first_true_row(traces <= BASELINE_LEVEL, eflux_start, last - 1, default=last)
+    else:
+        baseline_return = trace_matrix.frame_positions(baseline_return_indexes)
+
+    # last frame still at or above baseline within the eflux window
+    eflux_window_end = np.minimum(eflux_start + EFLUX_END_INDEX_MAX_OFFSET_FROM_START, last)
+    eflux_end = _last_true_row(
+        traces >= BASELINE_LEVEL,
+        eflux_start + EFLUX_END_INDEX_MIN_OFFSET_FROM_START + 1,
+        eflux_window_end,
+        default=np.minimum(eflux_window_end, eflux_start + EFLUX_END_INDEX_MIN_OFFSET_FROM_START)
+    )
+
+    peak_values = traces[peak, cols]
+    target_values = BASELINE_LEVEL + (peak_values - BASELINE_LEVEL) * TAU_REMAINING_FRACTION
+    tau_crossing = _first_true_row(traces <= target_values, peak, last, default=baseline_return)
+
+    integral_end = np.minimum(baseline_return + 1, last)
+    return pd.DataFrame({
+        "baseline_return_frame": frames[0] + baseline_return,
+        "eflux_start_frame": frames[0] + eflux_start,
+        "eflux_end_frame": frames[0] + eflux_end,
+        "amplitude": peak_values - BASELINE_LEVEL,
+        "tau": times[tau_crossing, cols] - times[peak, cols],
+        "integral": _trapezoid_integrals(traces, times, onset, integral_end),
+    })
@@ -0,0 +1,147 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .trace_matrix import TraceMatrix
+
+RESAMPLING_AXES = ("frame", "time")
+RESAMPLING_SPANS = ("intersection", "union")
+
+
+class ResampledTraces(NamedTuple):
+    grid: np.ndarray  # (n_samples,) shared sample positions, in frames or in the time column's unit
+    traces: np.ndarray  # (n_samples, n_rois) fluorescence interpolated at the grid positions
+
+
+def _sample_positions(trace_matrix: TraceMatrix, on: str) -> np.ndarray:
+    """(n_frames, n_rois) position of every sample on the resampling axis, NaN where the ROI has no value."""
+    if on == "frame":
+        positions = np.broadcast_to(trace_matrix.frames.astype(float)[:, None], trace_matrix.traces.shape)
+    elif on == "time":
+        positions = trace_matrix.times
+    else:
+        raise ValueError(f"Unknown resampling axis '{on}', expected one of {RESAMPLING_AXES}.")
+    return np.where(np.isnan(trace_matrix.traces), np.nan, positions)
+
+
+def make_resampling_grid(
+        trace_matrix: TraceMatrix,
+        on: str = "time",
+        step: Optional[float] = None,
+        span: str = "intersection"
+) -> np.ndarray:
+    """
+    Evenly spaced grid over the sampled range of the ROIs.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs.
+    on : str
+        'frame' for frame indexes, 'time' for the time column.
+    step : Optional[float]
+        Grid spacing, defaults to the median sampling interval of all ROIs.
+    span : str
+        'intersection' covers only the range sampled by every ROI, so the resampled matrix is dense.
+        'union' covers the range sampled by any ROI, NaN where a ROI has no samples.
+
+    Returns
+    -------
+    np.ndarray
+        (n_samples,) grid positions.
+    """
+    positions = _sample_positions(trace_matrix, on)
+    sampled = ~np.all(np.isnan(positions), axis=0)
+    if not np.any(sampled):
+        raise ValueError("No ROI has any sample to resample.")
+    starts = np.nanmin(positions[:, sampled], axis=0)
+    ends = np.nanmax(positions[:, sampled], axis=0)
+    if span == "intersection":
+        start, end = starts.max(), ends.min()
+    elif span == "union":
+        start, end = starts.min(), ends.max()
+    else:
+        raise ValueError(f"Unknown span '{span}', expected one of {RESAMPLING_SPANS}.")
+    if end < start:
+        raise ValueError("The sampled ranges of the ROIs don't overlap, use span='union'.")
+
+    if step is None:
+        step = float(np.nanmedian(np.diff(positions, axis=0)))
+    if not step > 0:
+        raise ValueError(f"Resampling step must be positive, got {step}.")
+    n_samples = int(np.floor((end - start) / step + 1e-9)) + 1
+    return start + step * np.arange(n_samples)
+
+
+def resample_trace_matrix(trace_matrix: TraceMatrix, grid: np.ndarray, on: str = "time") -> np.ndarray:
+    """
+    Linearly interpolates every ROI of the trace matrix at the grid positions, all ROIs in one batch.
+
+    The samples of all ROIs are laid out column after column with an offset per column, so a single
+    binary search of the grid positions finds the bracketing samples of every (grid position, ROI)
+    pair at once. NaN samples are skipped, grid positions outside a ROI's sampled range are NaN.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs, increasing frame indexes and times within every ROI.
+    grid : np.ndarray
+        (n_samples,) positions to interpolate at.
+    on : str
+        'frame' for frame indexes, 'time' for the time column.
+
+    Returns
+    -------
+    np.ndarray
+        (n_samples, n_rois) resampled traces.
+    """
+    grid = np.asarray(grid, dtype=float)
+    positions = _sample_positions(trace_matrix, on)
+    cols, rows = np.nonzero(~np.isnan(positions).T)  # column-major, every ROI's samples are contiguous
+    x = positions[rows, cols]
+    y = trace_matrix.traces[rows, cols]
+    if len(x) == 0 or len(grid) == 0:
+        return np.full((len(grid), trace_matrix.n_rois), np.nan)
+    if np.any(np.diff(x)[cols[1:] == cols[:-1]] <= 0):
+        raise ValueError(f"Sample {on}s must be increasing within every ROI.")
+
+    # sorted keys: column * width + position, with a width wider than every position's range
+    low = min(x.min(), grid.min())
+    width = max(x.max(), grid.max()) - low + 1
+    roi_positions = np.arange(trace_matrix.n_rois)
+    keys = cols * width + (x - low)
+    grid_keys = roi_positions * width + (grid[:, None] - low)
+    right = np.searchsorted(keys, grid_keys)  # first sample at or after the grid position
+    left = right - 1
+    right_clipped = np.minimum(right, len(keys) - 1)
+    left_clipped = np.maximum(left, 0)
+
+    right_in_roi = (right < len(keys)) & (cols[right_clipped] == roi_positions)
+    left_in_roi = (left >= 0) & (cols[left_clipped] == roi_positions)
+    exact = right_in_roi & (x[right_clipped] == grid[:, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = (grid[:, None] - x[left_clipped]) / (x[right_clipped] - x[left_clipped])
+        interpolated = y[left_clipped] + fraction * (y[right_clipped] - y[left_clipped])
+    resampled = np.where(left_in_roi & right_in_roi, interpolated, np.nan)
+    return np.where(exact, y[right_clipped], resampled)
+
+
+def resample_traces(
+        trace_matrix: TraceMatrix,
+        on: str = "time",
+        step: Optional[float] = None,
+        span: str = "intersection",
+        grid: Optional[np.ndarray] = None
+) -> ResampledTraces:
+    """
+    Interpolates all ROIs onto one shared, evenly spaced grid, see `make_resampling_grid` for the
+    grid options (ignored if `grid` is given) and `resample_trace_matrix` for the interpolation.
+
+    Returns
+    -------
+    ResampledTraces
+        NamedTuple(grid, traces), one (n_samples, n_rois) matrix with columns ordered like the trace matrix.
+    """
+    if grid is None:
+        grid = make_resampling_grid(trace_matrix, on=on, step=step, span=span)
+    return ResampledTraces(grid=np.asarray(grid, dtype=float), traces=resample_trace_matrix(trace_matrix, grid, on=on))
@@ -0,0 +1,113 @@
+from typing import Dict, NamedTuple, Sequence
+
+import numpy as np
+
+from .trace_matrix import TraceMatrix
+
+SYNCHRONY_CHUNK_SIZE = 256  # ROIs per block of rows of the correlation matrices
+SYNCHRONY_MAX_LAG = 5  # frames
+SYNCHRONY_CORRELATION_THRESHOLD = 0.5
+
+
+class SynchronyMatrices(NamedTuple):
+    correlation: np.ndarray  # (n_rois, n_rois) zero-lag Pearson correlation, NaN for flat traces
+    peak_correlation: np.ndarray  # (n_rois, n_rois) largest correlation over lags in [-max_lag, max_lag]
+    peak_lag: np.ndarray  # (n_rois, n_rois) lag of the peak in frames, positive where ROI i follows ROI j
+
+
+def _standardize(traces: np.ndarray) -> np.ndarray:
+    """Z-scores every column, NaN samples become 0 so they don't contribute to the products. Flat columns are NaN."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered = traces - np.nanmean(traces, axis=0)
+        z = centered / np.sqrt(np.nanmean(centered ** 2, axis=0))
+    z = np.where(np.isnan(traces), 0.0, z)
+    return np.where(np.isfinite(z).all(axis=0), z, np.nan)
+
+
+def calculate_synchrony(
+        trace_matrix: TraceMatrix,
+        max_lag: int = SYNCHRONY_MAX_LAG,
+        chunk_size: int = SYNCHRONY_CHUNK_SIZE
+) -> SynchronyMatrices:
+    """
+    Pairwise zero-lag and lagged cross-correlation matrices of all ROIs.
+
+    The traces are z-scored once, and each matrix is built block of rows by block of rows from
+    matrix products of the shifted trace matrix with itself (BLAS), two per lag and block. Peak
+    memory is a few (chunk_size, n_rois) blocks on top of the outputs, whatever the number of ROIs,
+    and there is no Python loop over pairs. Correlations are normalized by the number of overlapping
+    frames at each lag, NaN samples count as the trace's mean.
+
+    Parameters
+    ----------
+    trace_matrix : TraceMatrix
+        Traces of the ROIs, e.g. of one coverslip.
+    max_lag : int
+        Largest shift in frames, in both directions, of the lagged cross-correlation.
+    chunk_size : int
+        Number of ROIs per block of rows.
+
+    Returns
+    -------
+    SynchronyMatrices
+        NamedTuple(correlation, peak_correlation, peak_lag)
+    """
+    n_frames, n_rois = trace_matrix.traces.shape
+    if not 0 <= max_lag < n_frames:
+        raise ValueError(f"max_lag must be in [0, {n_frames}), got {max_lag}.")
+    z = _standardize(trace_matrix.traces)
+    correlation = np.empty((n_rois, n_rois))
+    peak_correlation = np.empty((n_rois, n_rois))
+    peak_lag = np.zeros((n_rois, n_rois), dtype=np.int64)
+
+    for start in range(0, n_rois, chunk_size):
+        rows = slice(start, start + chunk_size)
+        correlation[rows] = z[:, rows].T @ z / n_frames
+        best, best_lag = correlation[rows].copy(), np.zeros_like(peak_lag[rows])
+        for lag in range(1, max_lag + 1):
+            overlap = n_frames - lag
+            follows = z[lag:, rows].T @ z[:overlap] / overlap  # ROI i at t + lag vs ROI j at t
+            leads = z[:overlap, rows].T @ z[lag:] / overlap  # ROI i at t vs ROI j at t + lag
+            for lagged, signed_lag in ((follows, lag), (leads, -lag)):
+                better = lagged > best
+                best[better] = lagged[better]
+                best_lag[better] = signed_lag
+        peak_correlation[rows] = best
+        peak_lag[rows] = best_lag
+    return SynchronyMatrices(correlation=correlation, peak_correlation=peak_correlation, peak_lag=peak_lag)
+
+
+def _off_diagonal(matrix: np.ndarray) -> np.ndarray:
+    return matrix[~np.eye(len(matrix), dtype=bool)]
+
+
+def summarize_synchrony(synchrony: SynchronyMatrices, onset_frames: Sequence[float]) -> Dict[str, float]:
+    """
+    Cheap summary metrics of a set of ROIs (e.g. one coverslip): mean and median pairwise correlation,
+    fraction of pairs correlated above SYNCHRONY_CORRELATION_THRESHOLD, mean peak lagged correlation and
+    its mean absolute lag, and the dispersion (std and IQR, in frames) of the onsets.
+    """
+    pairs = _off_diagonal(synchrony.correlation)
+    pairs = pairs[~np.isnan(pairs)]
+    peak_pairs = _off_diagonal(synchrony.peak_correlation)
+    valid_peaks = ~np.isnan(peak_pairs)
+    onset_frames = np.asarray(onset_frames, dtype=float)
+    has_pairs = len(pairs) > 0
+    return {
+        "num_rois": len(synchrony.correlation),
+        "mean_pairwise_correlation": float(pairs.mean()) if has_pairs else np.nan,
+        "median_pairwise_correlation": float(np.median(pairs)) if has_pairs else np.nan,
+        "fraction_correlated_pairs": float(np.mean(pairs > SYNCHRONY_CORRELATION_THRESHOLD)) if has_pairs else np.nan,
+        "mean_peak_correlation": float(peak_pairs[valid_peaks].mean()) if np.any(valid_peaks) else np.nan,
+        "mean_abs_peak_lag": float(np.abs(_off_diagonal(synchrony.peak_lag)[valid_peaks]).mean())
+        if np.any(valid_peaks) else np.nan,
+        "onset_std": float(np.std(onset_frames, ddof=1)) if len(onset_frames) > 1 else np.nan,
+        "onset_iqr": float(np.subtract(*np.percentile(onset_frames, [75, 25]))) if len(onset_frames) > 0 else np.nan,
+    }
+
+
+def mean_correlation_per_roi(correlation: np.ndarray) -> np.ndarray:
+    """(n_rois,) mean correlation of every ROI with the other ROIs."""
+    off_diagonal = np.where(np.eye(len(correlation), dtype=bool), np.nan, correlation)
+    counts = np.sum(~np.isnan(off_diagonal), axis=1)
+    return np.divide(np.nansum(off_diagonal, axis=1), counts, out=np.full(len(counts), np.nan), where=counts > 0)
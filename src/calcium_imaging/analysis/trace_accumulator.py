@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from .trace_matrix import TraceMatrix
+
+
+class TraceAccumulator:
+    """
+    Streaming per-frame count, mean and variance of traces.
+
+    Traces are added in batches (e.g. one coverslip at a time) and only three arrays of per-frame
+    statistics are kept, so mean +- SEM traces of any number of ROIs can be computed in one pass
+    without holding the traces. Each batch is reduced with NumPy and merged into the running
+    statistics with the parallel form of Welford's algorithm (Chan et al.), which is also how
+    accumulators of different workers are combined with `merge`.
+    """
+
+    def __init__(self) -> None:
+        self.frames = np.empty(0, dtype=np.int64)  # sorted frame index labels seen so far
+        self.count = np.empty(0, dtype=np.int64)  # number of non-NaN samples per frame
+        self.mean = np.empty(0)
+        self.m2 = np.empty(0)  # sum of squared deviations from the mean per frame
+
+    def __repr__(self) -> str:
+        return f"TraceAccumulator({len(self.frames)} frames, up to {self.count.max(initial=0)} traces per frame)"
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance per frame, NaN where fewer than 2 traces have a value."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    @property
+    def sem(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.std / np.sqrt(self.count)
+
+    def _merge_stats(self, frames: np.ndarray, count: np.ndarray, mean: np.ndarray, m2: np.ndarray) -> None:
+        all_frames = np.union1d(self.frames, frames)
+        merged_count = np.zeros(len(all_frames), dtype=np.int64)
+        merged_mean = np.zeros(len(all_frames))
+        merged_m2 = np.zeros(len(all_frames))
+        rows = np.searchsorted(all_frames, self.frames)
+        merged_count[rows], merged_mean[rows], merged_m2[rows] = self.count, self.mean, self.m2
+
+        rows = np.searchsorted(all_frames, frames)
+        count_a, mean_a, m2_a = merged_count[rows], merged_mean[rows], merged_m2[rows]
+        total = count_a + count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = mean - mean_a
+            merged_mean[rows] = np.where(total > 0, mean_a + delta * count / total, 0.0)
+            merged_m2[rows] = np.where(total > 0, m2_a + m2 + delta ** 2 * count_a * count / total, 0.0)
+        merged_count[rows] = total
+        self.frames, self.count, self.mean, self.m2 = all_frames, merged_count, merged_mean, merged_m2
+
+    def update(self, frames: np.ndarray, traces: np.ndarray) -> "TraceAccumulator":
+        """
+        Adds a batch of traces.
+
+        Parameters
+        ----------
+        frames : np.ndarray
+            (n_frames,) frame index labels of the rows.
+        traces : np.ndarray
+            (n_frames, n_traces) values, NaN samples are skipped.
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        traces = np.asarray(traces, dtype=float).reshape(len(frames), -1)
+        valid = ~np.isnan(traces)
+        count = valid.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, np.nansum(traces, axis=1) / count, 0.0)
+        m2 = np.sum(np.where(valid, traces - mean[:, None], 0.0) ** 2, axis=1)
+        self._merge_stats(frames, count, mean, m2)
+        return self
+
+    def update_trace_matrix(self, trace_matrix: TraceMatrix) -> "TraceAccumulator":
+        return self.update(trace_matrix.frames, trace_matrix.traces)
+
+    def merge(self, other: "TraceAccumulator") -> "TraceAccumulator":
+        """Adds the statistics of another accumulator, e.g. one filled by another worker."""
+        self._merge_stats(other.frames, other.count, other.mean, other.m2)
+        return self
+
+    def to_df(self) -> pd.DataFrame:
+        """Per frame count, mean, std and SEM, indexed by frame."""
+        return pd.DataFrame(
+            {"count": self.count, "mean": np.where(self.count > 0, self.mean, np.nan), "std": self.std, "sem": self.sem},
+            index=pd.Index(self.frames, name="frame"),
+        )
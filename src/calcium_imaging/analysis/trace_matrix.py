@@ -0,0 +1,88 @@
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class TraceMatrix(NamedTuple):
+    frames: np.ndarray  # (n_frames,) frame index labels shared by all ROIs
+    traces: np.ndarray  # (n_frames, n_rois) fluorescence, NaN where a ROI has no value
+    times: np.ndarray  # (n_frames, n_rois) time of every sample
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.frames)
+
+    @property
+    def n_rois(self) -> int:
+        return self.traces.shape[1]
+
+    def frame_positions(self, frame_indexes: Sequence[int]) -> np.ndarray:
+        """Converts frame index labels (e.g. `roi.peak_idx`) to row positions in the matrix."""
+        frame_indexes = np.asarray(frame_indexes)
+        positions = np.searchsorted(self.frames, frame_indexes)
+        found = (positions < self.n_frames) & (self.frames[np.minimum(positions, self.n_frames - 1)] == frame_indexes)
+        if not np.all(found):
+            raise KeyError(f"Frames {frame_indexes[~found].tolist()} are not in the trace matrix.")
+        return positions
+
+    def get_windows(self, start_positions: np.ndarray, end_positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gathers one window of rows per ROI into a (n_rois, max_window_length) matrix.
+
+        Window i spans rows `start_positions[i]` to `end_positions[i]` (inclusive) of column i.
+        Returns the windows and a mask of the valid (in-window, non-NaN) samples.
+        """
+        start_positions = np.asarray(start_positions)
+        end_positions = np.minimum(np.asarray(end_positions), self.n_frames - 1)
+        max_length = max(int((end_positions - start_positions).max()) + 1, 1)
+        rows = start_positions[:, None] + np.arange(max_length)
+        in_window = (rows >= 0) & (rows <= end_positions[:, None])
+        windows = self.traces[np.clip(rows, 0, self.n_frames - 1), np.arange(self.n_rois)[:, None]]
+        return windows, in_window & ~np.isnan(windows)
+
+
+def mean_over_rois(traces: np.ndarray) -> np.ndarray:
+    """(n_samples, n_rois) -> (n_samples,) mean over the ROIs with a value, NaN where none has one."""
+    counts = np.sum(~np.isnan(traces), axis=1)
+    return np.divide(np.nansum(traces, axis=1), counts, out=np.full(len(counts), np.nan), where=counts > 0)
+
+
+def build_trace_matrix(traces: Sequence[pd.Series], times: Sequence[pd.Series]) -> TraceMatrix:
+    """
+    Aligns ROI traces (and their time vectors) on their frame index into dense matrices.
+
+    Parameters
+    ----------
+    traces : Sequence[pd.Series]
+        One trace per ROI, indexed by frame.
+    times : Sequence[pd.Series]
+        One time vector per ROI, with the same index as the matching trace.
+
+    Returns
+    -------
+    TraceMatrix
+        NamedTuple(frames, traces, times), columns ordered like the input.
+    """
+    traces_df = pd.concat(list(traces), axis=1).sort_index()
+    times_df = pd.concat(list(times), axis=1).reindex(traces_df.index)
+    return TraceMatrix(
+        frames=traces_df.index.to_numpy(),
+        traces=traces_df.to_numpy(dtype=float),
+        times=times_df.to_numpy(dtype=float),
+    )
+
+
+def concat_trace_matrices(trace_matrices: List[TraceMatrix]) -> TraceMatrix:
+    """Stacks the ROIs of several trace matrices side by side, on the union of their frames."""
+    frames = np.unique(np.concatenate([tm.frames for tm in trace_matrices]))
+    n_rois = sum(tm.n_rois for tm in trace_matrices)
+    traces = np.full((len(frames), n_rois), np.nan)
+    times = np.full((len(frames), n_rois), np.nan)
+    col = 0
+    for tm in trace_matrices:
+        rows = np.searchsorted(frames, tm.frames)
+        traces[rows, col:col + tm.n_rois] = tm.traces
+        times[rows, col:col + tm.n_rois] = tm.times
+        col += tm.n_rois
+    return TraceMatrix(frames=frames, traces=traces, times=times)
@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from .data_models import Experiment
+from .instantiation import _get_provenance_metadata, _instantiate_coverslip
+from .io import load_vsi, validate_experiment_dir
+from .processing import Preprocessor, extract_coverslip_info_from_filename_stem
+
+
+class ExperimentLoader:
+    """
+    Loads an experiment in the background, see `load_experiment_async`.
+
+    `loader.experiment` is usable right away and gains coverslips as they finish loading.
+    The loader itself can be awaited (`exp = await loader`), or waited on (`exp = loader.result()`).
+    """
+
+    def __init__(
+            self,
+            experiment_dir: Union[str, Path],
+            preprocessor: Preprocessor,
+            max_prefetched_files: int = 4,
+            n_read_threads: int = 4
+    ) -> None:
+        if max_prefetched_files < 1 or n_read_threads < 1:
+            raise ValueError("max_prefetched_files and n_read_threads must be positive.")
+        experiment_dir_path = validate_experiment_dir(experiment_dir)
+        self.preprocessor = preprocessor
+        self.file_paths = sorted(p for p in experiment_dir_path.iterdir() if p.is_file())
+        self.experiment = Experiment(
+            name=experiment_dir_path.stem,
+            groups=[],
+            metadata=_get_provenance_metadata(experiment_dir_path, preprocessor)
+        )
+        self.errors: Dict[str, str] = {}  # file name -> error message
+        self.num_files_done = 0
+        self._max_prefetched_files = max_prefetched_files
+        self._n_read_threads = n_read_threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="experiment-loader")
+        self._future = self._executor.submit(self._load)
+        self._executor.shutdown(wait=False)
+
+    def __repr__(self) -> str:
+        status = "done" if self.done() else "loading"
+        return f"{self.experiment.name}: {status}, {self.num_files_done}/{len(self.file_paths)} files"
+
+    def __await__(self):
+        import asyncio  # only needed when awaited
+
+        return asyncio.wrap_future(self._future).__await__()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Experiment:
+        """Blocks until every file is loaded (or `timeout` seconds passed) and returns the experiment."""
+        return self._future.result(timeout=timeout)
+
+    def _load(self) -> Experiment:
+        # reads are I/O bound and run concurrently, the semaphore bounds how many read files wait to be parsed
+        buffer_slots = threading.Semaphore(self._max_prefetched_files)
+
+        def read(file_path: Path) -> bytes:
+            buffer_slots.acquire()
+            return file_path.read_bytes()
+
+        with ThreadPoolExecutor(max_workers=self._n_read_threads, thread_name_prefix="experiment-reader") as readers:
+            read_futures: Dict[Future, Path] = {readers.submit(read, p): p for p in self.file_paths}
+            try:
+                for read_future in as_completed(read_futures):
+                    file_path = read_futures[read_future]
+                    try:
+                        self._add_coverslip(file_path, read_future.result())
+                    except (OSError, ValueError) as e:
+                        self.errors[file_path.name] = str(e)
+                        print(f"Error loading {file_path.resolve()}, skipping.")
+                    finally:
+                        buffer_slots.release()
+                        self.num_files_done += 1
+            finally:
+                # on an unexpected error, don't leave readers blocked on the buffer when the pool shuts down
+                for read_future in read_futures:
+                    read_future.cancel()
+                for _ in range(self._n_read_threads):
+                    buffer_slots.release()
+        return self.experiment
+
+    def _add_coverslip(self, file_path: Path, file_contents: bytes) -> None:
+        processed_df = self.preprocessor.preprocess(load_vsi(file_path, file_contents=file_contents))
+        coverslip_info = extract_coverslip_info_from_filename_stem(file_path.stem)
+        print(f"\ninstantiating {file_path.stem}")
+        coverslip = _instantiate_coverslip(
+            coverslip_info=coverslip_info,
+            processed_df=processed_df,
+            time_col=self.preprocessor.time_col_name
+        )
+        self.experiment.add_coverslip(coverslip)
+
+
+def load_experiment_async(
+        experiment_dir: Union[str, Path],
+        preprocessor: Preprocessor,
+        max_prefetched_files: int = 4,
+        n_read_threads: int = 4
+) -> ExperimentLoader:
+    """
+    Non-blocking `load_experiment`, returns immediately.
+
+    File bytes are prefetched by `n_read_threads` concurrent readers (mostly I/O wait on a mounted
+    drive), with at most `max_prefetched_files` read but not yet parsed files held in memory.
+    Parsing and preprocessing run in one background thread, overlapped with the reads, and every
+    coverslip is added to `loader.experiment` as soon as it is ready, so the first groups can be
+    inspected while the rest is still loading.
+
+    Parameters
+    ----------
+    experiment_dir : Union[str, Path]
+        Experiment directory, as for `load_experiment`.
+    preprocessor : Preprocessor
+        Preprocessing settings.
+    max_prefetched_files : int
+        Bound on the read-ahead buffer.
+    n_read_threads : int
+        Concurrent file reads.
+
+    Returns
+    -------
+    ExperimentLoader
+        `loader.experiment` is the partially populated Experiment, `await loader` or
+        `loader.result()` returns it once complete.
+    """
+    return ExperimentLoader(
+        experiment_dir=experiment_dir,
+        preprocessor=preprocessor,
+        max_prefetched_files=max_prefetched_files,
+        n_read_threads=n_read_threads,
+    )
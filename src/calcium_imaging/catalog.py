@@ -0,0 +1,169 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+from .instantiation import _estimate_coverslip_nbytes
+from .io import read_vsi_header
+from .processing import Preprocessor, extract_coverslip_info_from_filename_stem, extract_roi_id_from_col_name
+
+CATALOG_FILE_NAME = "catalog.csv"
+CATALOG_COLUMNS = [
+    "experiment_name", "file_name", "path", "size_bytes", "mtime_ns", "sha256", "coverslip_id", "group_type",
+    "num_rois", "num_frames", "estimated_nbytes", "problems", "ok", "change", "settings_hash",
+]
+PROBLEMS_SEPARATOR = "; "
+_DUPLICATE_PROBLEM = "duplicate coverslip id"
+
+
+def _hash_settings(preprocessor: Preprocessor) -> str:
+    return hashlib.sha256(json.dumps(preprocessor.get_settings(), sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _scan_file(file_path: Path, preprocessor: Preprocessor, contents: bytes) -> Dict[str, Any]:
+    """Catalog record of one raw file from its name and header, problems that would break loading flagged."""
+    record: Dict[str, Any] = {"coverslip_id": None, "group_type": None, "num_rois": None, "num_frames": None,
+                              "estimated_nbytes": None}
+    problems = []
+    try:
+        coverslip_info = extract_coverslip_info_from_filename_stem(file_path.stem)
+        record.update(coverslip_id=coverslip_info.coverslip_id, group_type=coverslip_info.group_type)
+    except ValueError:
+        problems.append("file name doesn't match '<coverslip_id> - <group_type>'")
+    if file_path.suffix != ".xls":
+        problems.append(f"unsupported file type '{file_path.suffix}'")
+        return {**record, "problems": problems}
+    try:
+        header = read_vsi_header(file_path, contents)
+    except Exception as e:  # whatever the parser raises, the file can't be loaded
+        problems.append(f"unreadable ({type(e).__name__}: {e})")
+        return {**record, "problems": problems}
+
+    background_cols = preprocessor.background_fluorescence_cols_names
+    missing = [col for col in [preprocessor.time_col_name, *background_cols] if col not in header.columns]
+    if missing:
+        problems.append(f"missing columns {missing}")
+    roi_cols = [col for col in header.columns if extract_roi_id_from_col_name(col) is not None]
+    unexpected = [col for col in header.columns if col != preprocessor.time_col_name and col not in roi_cols]
+    if unexpected:
+        problems.append(f"unexpected columns {unexpected}")
+    num_rois = len([col for col in roi_cols if col not in background_cols])
+    if num_rois == 0:
+        problems.append("no ROI columns")
+    last_frame = header.num_frames - 1
+    if last_frame <= preprocessor.earliest_baseline_recovery_frame:
+        problems.append(
+            f"last frame {last_frame} isn't after earliest_baseline_recovery_frame "
+            f"{preprocessor.earliest_baseline_recovery_frame}"
+        )
+    record.update(
+        num_rois=num_rois,
+        num_frames=max(header.num_frames - preprocessor.first_n_points_to_discard, 0),
+        estimated_nbytes=_estimate_coverslip_nbytes(header.num_frames, len(header.columns), preprocessor),
+    )
+    return {**record, "problems": problems}
+
+
+def _flag_duplicate_coverslips(catalog: pd.DataFrame) -> None:
+    """Coverslips of an experiment are looked up by id, so two files with the same id can't both be loaded."""
+    with_id = catalog[catalog["coverslip_id"].notna()]
+    for _, files in with_id.groupby(["experiment_name", "coverslip_id"]):
+        if len(files) < 2:
+            continue
+        for idx in files.index:
+            others = [name for name in files["file_name"] if name != catalog.at[idx, "file_name"]]
+            problem = f"{_DUPLICATE_PROBLEM} {int(catalog.at[idx, 'coverslip_id'])} (also {others})"
+            catalog.at[idx, "problems"] = PROBLEMS_SEPARATOR.join(filter(None, [catalog.at[idx, "problems"], problem]))
+
+
+def load_catalog(catalog_path: Union[str, Path]) -> pd.DataFrame:
+    catalog = pd.read_csv(catalog_path, keep_default_na=False, na_values=[""])
+    catalog["problems"] = catalog["problems"].fillna("")
+    return catalog
+
+
+def build_catalog(
+        raw_data_root: Union[str, Path],
+        preprocessor: Optional[Preprocessor] = None,
+        previous_catalog: Optional[Union[str, Path, pd.DataFrame]] = None,
+        output_path: Optional[Union[str, Path]] = None
+) -> pd.DataFrame:
+    """
+    Index of every file of every experiment directory under `raw_data_root`, built from file names
+    and headers only (see `read_vsi_header`), so malformed files are flagged before anything is loaded.
+
+    Each file is read once, to hash its contents and parse its header. Files whose size and
+    modification time are unchanged since `previous_catalog` (built with the same settings) aren't
+    read again, so rescanning a large archive costs one stat per file.
+
+    Parameters
+    ----------
+    raw_data_root : Union[str, Path]
+        Directory with one sub-directory per experiment.
+    preprocessor : Optional[Preprocessor]
+        Settings the files are checked against (time and background columns, discarded frames,
+        earliest_baseline_recovery_frame), defaults to `Preprocessor()`.
+    previous_catalog : Optional[Union[str, Path, pd.DataFrame]]
+        Earlier catalog (or its CSV path, ignored if missing) to reuse unchanged rows from and to compare with.
+    output_path : Optional[Union[str, Path]]
+        CSV path to write the catalog to.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per file with CATALOG_COLUMNS: experiment_name, file_name, path, size_bytes, mtime_ns,
+        sha256 (of the contents, for cache keys that survive copies and touches), coverslip_id,
+        group_type, num_rois, num_frames (after the discarded ones), estimated_nbytes (RAM once loaded,
+        see `estimate_experiment_nbytes`), problems ('; ' separated, empty if none), ok, change
+        ('new', 'modified' or 'unchanged' relative to `previous_catalog`) and settings_hash.
+    """
+    preprocessor = Preprocessor() if preprocessor is None else preprocessor
+    settings_hash = _hash_settings(preprocessor)
+    if isinstance(previous_catalog, (str, Path)):
+        previous_catalog = load_catalog(previous_catalog) if Path(previous_catalog).exists() else None
+    previous_rows = {} if previous_catalog is None else {row["path"]: row for row in previous_catalog.to_dict("records")}
+
+    records: List[Dict[str, Any]] = []
+    experiment_dirs = sorted(p for p in Path(raw_data_root).iterdir() if p.is_dir())
+    for experiment_dir in experiment_dirs:
+        for file_path in sorted(p for p in experiment_dir.iterdir() if p.is_file()):
+            stat = file_path.stat()
+            path = str(file_path.resolve())
+            previous = previous_rows.get(path)
+            if (previous is not None and previous["size_bytes"] == stat.st_size
+                    and previous["mtime_ns"] == stat.st_mtime_ns and previous["settings_hash"] == settings_hash):
+                problems = [problem for problem in previous["problems"].split(PROBLEMS_SEPARATOR)
+                            if problem and not problem.startswith(_DUPLICATE_PROBLEM)]  # flagged again below
+                records.append({**previous, "problems": PROBLEMS_SEPARATOR.join(problems), "change": "unchanged"})
+                continue
+            contents = file_path.read_bytes()
+            sha256 = hashlib.sha256(contents).hexdigest()
+            record = _scan_file(file_path, preprocessor, contents)
+            if previous is None:
+                change = "new"
+            else:
+                change = "unchanged" if previous["sha256"] == sha256 else "modified"
+            records.append({
+                "experiment_name": experiment_dir.name,
+                "file_name": file_path.name,
+                "path": path,
+                "size_bytes": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                **record,
+                "problems": PROBLEMS_SEPARATOR.join(record["problems"]),
+                "change": change,
+                "settings_hash": settings_hash,
+            })
+
+    catalog = pd.DataFrame.from_records(records, columns=CATALOG_COLUMNS)
+    for col in ["coverslip_id", "num_rois", "num_frames", "estimated_nbytes"]:
+        catalog[col] = catalog[col].astype("Int64")
+    _flag_duplicate_coverslips(catalog)
+    catalog["ok"] = catalog["problems"] == ""
+    if output_path is not None:
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        catalog.to_csv(output_path, index=False)
+    return catalog
@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .catalog import CATALOG_FILE_NAME, build_catalog
+from .data_models import Coverslip
+from .instantiation import _get_provenance_metadata, _instantiate_coverslip, _instantiate_experiment, _instantiate_groups
+from .io import RESULTS_DATABASE_FILE_NAME, load_vsi
+from .parallel import run_in_pool
+from .processing import Preprocessor, extract_coverslip_info_from_filename_stem
+
+CHECKPOINT_FORMAT_VERSION = 2  # bump to invalidate existing checkpoints
+CHECKPOINTS_DIR_NAME = ".checkpoints"
+EXPERIMENT_MARKER_NAME = "experiment.json"
+FULL_ANALYSIS_FILE_NAME = "full_analysis.csv"
+
+
+class CoverslipResult(NamedTuple):
+    file_path: Path
+    coverslip: Optional[Coverslip]  # None if the file could not be loaded
+    status: str  # 'checkpoint', 'processed' or 'failed'
+    seconds: float
+
+
+def load_settings(settings_path: Optional[Path]) -> Preprocessor:
+    """Reads Preprocessor keyword arguments from a JSON file, defaults for settings it doesn't specify."""
+    if settings_path is None:
+        return Preprocessor()
+    settings = json.loads(Path(settings_path).read_text())
+    unknown = sorted(set(settings) - set(Preprocessor().get_settings()))
+    if unknown:
+        raise ValueError(f"Unknown Preprocessor settings {unknown} in '{settings_path}'.")
+    return Preprocessor(**settings)
+
+
+def _hash(obj: Any) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _coverslip_key(fingerprint: Tuple[str, str], settings_hash: str) -> str:
+    return _hash([CHECKPOINT_FORMAT_VERSION, fingerprint, settings_hash])
+
+
+def _experiment_key(fingerprints: Sequence[Tuple[str, str]], settings_hash: str) -> str:
+    return _hash([CHECKPOINT_FORMAT_VERSION, list(fingerprints), settings_hash])
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Writes via a temporary file, an interrupted write never leaves a truncated checkpoint behind."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _load_coverslip_checkpoint(checkpoint_path: Path, key: str) -> Optional[Coverslip]:
+    if not checkpoint_path.exists():
+        return None
+    try:
+        with open(checkpoint_path, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None  # unreadable or from an incompatible version, recompute
+    return checkpoint["coverslip"] if checkpoint.get("key") == key else None
+
+
+def _process_coverslip(
+        file_path: Path,
+        preprocessor: Preprocessor,
+        checkpoint_path: Path,
+        key: str,
+        verbose: bool
+) -> CoverslipResult:
+    """Loads one coverslip from its checkpoint if it is up to date, otherwise from the raw file, and checkpoints it."""
+    start = time.perf_counter()
+    coverslip = _load_coverslip_checkpoint(checkpoint_path, key)
+    if coverslip is not None:
+        return CoverslipResult(file_path, coverslip, "checkpoint", time.perf_counter() - start)
+
+    stdout = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with stdout:
+            coverslip = _instantiate_coverslip(
+                coverslip_info=extract_coverslip_info_from_filename_stem(file_path.stem),
+                processed_df=preprocessor.preprocess(load_vsi(file_path)),
+                time_col=preprocessor.time_col_name
+            )
+    except ValueError as e:
+        print(f"Error loading {file_path.resolve()}: {e}, skipping.")
+        return CoverslipResult(file_path, None, "failed", time.perf_counter() - start)
+    _atomic_write_bytes(checkpoint_path, pickle.dumps({"key": key, "coverslip": coverslip}))
+    return CoverslipResult(file_path, coverslip, "processed", time.perf_counter() - start)
+
+
+def _read_experiment_marker(marker_path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(marker_path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_experiment_results(
+        experiment_dir: Path,
+        coverslips: List[Coverslip],
+        preprocessor: Preprocessor,
+        output_dir: Path,
+        verbose: bool
+) -> None:
+    stdout = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with stdout:
+        experiment = _instantiate_experiment(
+            experiment_name=experiment_dir.name,
+            groups=_instantiate_groups(coverslips),
+            metadata=_get_provenance_metadata(experiment_dir, preprocessor)
+        )
+        experiment.save_mega_dfs(str(output_dir), results_database=False)
+        full_analysis_df = experiment.get_full_analysis_df()
+        experiment.save_to_results_database(output_dir / RESULTS_DATABASE_FILE_NAME, analysis_df=full_analysis_df)
+    full_analysis_df.to_csv(output_dir / experiment_dir.name / FULL_ANALYSIS_FILE_NAME, index=False)
+
+
+def run(
+        raw_data_root: Path,
+        preprocessor: Preprocessor,
+        output_dir: Path,
+        n_jobs: Optional[int] = None,
+        force: bool = False,
+        verbose: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Processes every experiment directory under `raw_data_root` and writes its results to `output_dir`.
+
+    The raw files are first indexed from their headers only into `catalog.csv` (see `build_catalog`),
+    and files flagged there are skipped with their problems listed upfront. Every coverslip is
+    checkpointed (pickled) as soon as it is loaded, and every experiment records a marker once its
+    results are written. Both are keyed by the raw files' names and content hashes and the Preprocessor
+    settings, so an interrupted run resumes where it stopped, a later run skips whatever is up to
+    date, and copying or touching the raw data doesn't invalidate anything.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        Timing summary, one record per experiment.
+    """
+    settings_hash = _hash(preprocessor.get_settings())
+    checkpoints_dir = output_dir / CHECKPOINTS_DIR_NAME
+    experiment_dirs = sorted(p for p in Path(raw_data_root).iterdir() if p.is_dir())
+    catalog_path = output_dir / CATALOG_FILE_NAME
+    catalog = build_catalog(raw_data_root, preprocessor, previous_catalog=catalog_path, output_path=catalog_path)
+    _print_catalog_problems(catalog)
+    fingerprints = {
+        (row.experiment_name, row.file_name): (row.file_name, row.sha256) for row in catalog.itertuples(index=False)
+    }
+    flagged = {(row.experiment_name, row.file_name) for row in catalog.itertuples(index=False) if not row.ok}
+
+    # experiments whose results are up to date are skipped without loading anything
+    pending = []
+    summary = []
+    for experiment_dir in experiment_dirs:
+        file_paths = sorted(p for p in experiment_dir.iterdir() if p.is_file())
+        # flagged files are part of the key too, fixing one reruns its experiment
+        key = _experiment_key([fingerprints[(experiment_dir.name, p.name)] for p in file_paths], settings_hash)
+        marker_path = checkpoints_dir / experiment_dir.name / EXPERIMENT_MARKER_NAME
+        up_to_date = _read_experiment_marker(marker_path).get("key") == key
+        if not force and up_to_date and (output_dir / experiment_dir.name / FULL_ANALYSIS_FILE_NAME).exists():
+            summary.append({"experiment": experiment_dir.name, "status": "up to date", "coverslips": len(file_paths)})
+            continue
+        pending.append((experiment_dir, file_paths, key, marker_path))
+
+    # all coverslips of all pending experiments in one pool, each one checkpointed as soon as it is done
+    tasks = []
+    for experiment_dir, file_paths, _, _ in pending:
+        for file_path in file_paths:
+            if (experiment_dir.name, file_path.name) in flagged:
+                continue
+            checkpoint_path = checkpoints_dir / experiment_dir.name / f"{file_path.name}.pkl"
+            if force and checkpoint_path.exists():
+                checkpoint_path.unlink()
+            key = _coverslip_key(fingerprints[(experiment_dir.name, file_path.name)], settings_hash)
+            tasks.append((file_path, preprocessor, checkpoint_path, key, verbose))
+    print(f"{len(experiment_dirs) - len(pending)} experiments up to date, loading {len(tasks)} coverslips "
+          f"of {len(pending)} experiments")
+    results = run_in_pool(_process_coverslip, tasks, n_jobs=n_jobs)
+
+    for experiment_dir, file_paths, key, marker_path in pending:
+        experiment_results = [r for r in results if r.file_path.parent == experiment_dir]
+        coverslips = [r.coverslip for r in experiment_results if r.coverslip is not None]
+        record = {
+            "experiment": experiment_dir.name,
+            "coverslips": len(file_paths),
+            "from_checkpoint": sum(r.status == "checkpoint" for r in experiment_results),
+            "processed": sum(r.status == "processed" for r in experiment_results),
+            "failed": sum(r.status == "failed" for r in experiment_results),
+            "flagged": sum((experiment_dir.name, p.name) in flagged for p in file_paths),
+            "load_seconds": sum(r.seconds for r in experiment_results),
+        }
+        if len(coverslips) == 0:
+            summary.append({**record, "status": "failed"})
+            continue
+        start = time.perf_counter()
+        _write_experiment_results(experiment_dir, coverslips, preprocessor, output_dir, verbose)
+        record["analysis_seconds"] = time.perf_counter() - start
+        # files that failed are part of the key too, they are retried only once they change
+        _atomic_write_bytes(marker_path, json.dumps({"key": key, "settings": preprocessor.get_settings()}).encode())
+        summary.append({**record, "status": "done"})
+    return sorted(summary, key=lambda record: record["experiment"])
+
+
+def _print_catalog_problems(catalog: pd.DataFrame) -> None:
+    flagged = catalog[~catalog["ok"]]
+    print(f"{len(catalog)} raw files indexed, {len(flagged)} flagged and skipped")
+    for row in flagged.itertuples(index=False):
+        print(f"  {row.experiment_name}/{row.file_name}: {row.problems}")
+
+
+def _print_summary(summary: List[Dict[str, Any]], total_seconds: float) -> None:
+    print("\nSummary")
+    for record in summary:
+        if record["status"] == "up to date":
+            print(f"  {record['experiment']}: up to date ({record['coverslips']} coverslips), skipped")
+            continue
+        print(
+            f"  {record['experiment']}: {record['status']}, {record['coverslips']} coverslips "
+            f"({record['processed']} processed, {record['from_checkpoint']} from checkpoint, {record['failed']} failed, "
+            f"{record['flagged']} flagged), "
+            f"loading {record['load_seconds']:.1f}s (CPU), analysis {record.get('analysis_seconds', 0.0):.1f}s"
+        )
+    print(f"Total {total_seconds:.1f}s")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="calcium-imaging",
+        description="Analyses every experiment directory under a raw-data root, resuming from checkpoints."
+    )
+    parser.add_argument("raw_data_root", type=Path, help="Directory with one sub-directory per experiment.")
+    parser.add_argument("--settings", type=Path, default=None,
+                        help="JSON file of Preprocessor keyword arguments, defaults for the missing ones.")
+    parser.add_argument("--output-dir", type=Path, default=Path("./results"), help="Results directory.")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes, all CPUs by default.")
+    parser.add_argument("--force", action="store_true", help="Ignore checkpoints and recompute everything.")
+    parser.add_argument("--verbose", action="store_true", help="Show per-ROI preprocessing and detection messages.")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.raw_data_root.is_dir():
+        parser.error(f"raw_data_root '{args.raw_data_root}' is not a directory.")
+    try:
+        preprocessor = load_settings(args.settings)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(f"invalid settings file: {e}")
+    start = time.perf_counter()
+    summary = run(
+        raw_data_root=args.raw_data_root,
+        preprocessor=preprocessor,
+        output_dir=args.output_dir,
+        n_jobs=args.jobs,
+        force=args.force,
+        verbose=args.verbose,
+    )
+    _print_summary(summary, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from .coverslip import Coverslip
 from .experiment import Experiment
 from .group import Group
+from .memory_usage import MemoryUsage
 from .research import Research
 from .roi import ROI
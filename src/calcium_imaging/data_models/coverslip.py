@@ -1,12 +1,54 @@
-from typing import Dict, List, Iterator, Union, Callable, Optional
+from typing import Dict, Iterable, List, Iterator, Optional, Sequence
 
 import numpy as np
 import pandas as pd
 
+from calcium_imaging.analysis import (
+    EVENT_COLUMNS,
+    EVENT_HIGH_THRESHOLD_SIGMAS,
+    EVENT_LOW_THRESHOLD_SIGMAS,
+    EVENT_MIN_AMPLITUDE,
+    EVENT_MIN_DURATION_FRAMES,
+    SYNCHRONY_MAX_LAG,
+    SynchronyMatrices,
+    TraceAccumulator,
+    RoiIndexes,
+    TraceMatrix,
+    build_trace_matrix,
+    calculate_metrics,
+    calculate_post_peak_metrics,
+    calculate_synchrony,
+    detect_events,
+    fit_kinetics,
+    mean_correlation_per_roi,
+    mean_over_rois,
+    summarize_synchrony,
+)
 from calcium_imaging.viz import create_traces_figure
+from .memory_usage import MemoryUsage, attributes_getsizeof, sum_memory_usages
 from .roi import ROI
 
 
+def _calculate_roi_metrics(
+        trace_matrix: TraceMatrix,
+        rois: List[ROI],
+        names: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """Registered metrics of the ROIs (the trace matrix columns), see `calcium_imaging.analysis.calculate_metrics`."""
+    indexes = RoiIndexes.from_frames(
+        trace_matrix,
+        onset=[roi.onset_idx for roi in rois],
+        peak=[roi.peak_idx for roi in rois],
+        influx_start=[roi.influx_start_idx for roi in rois],
+        influx_end=[roi.influx_end_idx for roi in rois],
+        eflux_start=[roi.eflux_start_idx for roi in rois],
+        eflux_end=[roi.eflux_end_idx for roi in rois],
+        baseline_return=[roi.baseline_return_idx for roi in rois],
+        last=[roi.trace.index[-1] for roi in rois],
+    )
+    return calculate_metrics(trace_matrix, indexes, names)
+
+
 class Coverslip:
     """One plate"""
 
@@ -38,9 +80,24 @@ class Coverslip:
         except KeyError:
             print(f"ROI with id {roi_id} not found in '{self.name}'")
 
+    def drop_rois(self, roi_ids: Iterable[int]) -> None:
+        """Drops several ROIs at once, rebuilding the ROI list once rather than per ROI."""
+        roi_ids = set(roi_ids)
+        self.rois = [roi for roi in self.rois if roi.roi_id not in roi_ids]
+        self._id2roi = {roi.roi_id: roi for roi in self.rois}
+        self.title = f"Coverslip {self.id} (ROIs {', '.join(str(roi.roi_id) for roi in self.rois)})"
+
     def get_df(self) -> pd.DataFrame:
         return pd.concat([roi.trace for roi in self.rois], axis=1)
 
+    def memory_usage(self) -> MemoryUsage:
+        """Deep byte count of the coverslip and its ROIs, see `ROI.memory_usage`."""
+        own = MemoryUsage(0, 0, 0, attributes_getsizeof(self, exclude=("rois", "_id2roi")))
+        return sum_memory_usages([own, *(roi.memory_usage() for roi in self.rois)])
+
+    def get_trace_matrix(self) -> TraceMatrix:
+        return build_trace_matrix([roi.trace for roi in self.rois], [roi.time for roi in self.rois])
+
     def visualize(self, title_prefix: Optional[str] = None) -> None:
         rois_traces = [roi.trace for roi in self.rois]
         rois_peak_indexes = [roi.peak_idx for roi in self.rois]
@@ -59,49 +116,127 @@ class Coverslip:
             yaxis_title="Fluorescence relative to background",
         ).show()
     
+    def accumulate_traces(self, accumulator: Optional[TraceAccumulator] = None) -> TraceAccumulator:
+        """Adds the ROI traces to the per-frame mean / variance accumulator (a new one by default)."""
+        accumulator = TraceAccumulator() if accumulator is None else accumulator
+        return accumulator.update_trace_matrix(self.get_trace_matrix())
+
     def get_mean_trace(self) -> pd.Series:
-        mean_trace = pd.Series(pd.concat([roi.trace for roi in self.rois], axis=1).mean(axis=1))
+        trace_matrix = self.get_trace_matrix()
+        mean_trace = pd.Series(mean_over_rois(trace_matrix.traces), index=trace_matrix.frames)
         mean_trace.name = f"Coverslip {self.id} mean"
         return mean_trace
     
-    def _calculate_metric(
-            self,
-            metric_calculation_func: Callable[['ROI'], float],
-            metric_name: str,
-    ) -> Union[List[float], List[Dict[str, float]]]:
-        return [
-            {
-                "group_type": self.group_type,
-                "coverslip": roi.coverslip_id,
-                "roi": roi.roi_id,
-                metric_name: metric_calculation_func(roi)
-            }
-            for roi in self.rois
-        ]
+    def calculate_metrics(self, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Registered metrics (all by default) of all ROIs, one batch call per metric, see `register_metric`."""
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": self.id,
+            "roi": [roi.roi_id for roi in self.rois],
+        })
+        return pd.concat([keys_df, _calculate_roi_metrics(self.get_trace_matrix(), self.rois, names)], axis=1)
+
+    def _calculate_metric(self, metric_name: str) -> List[Dict[str, float]]:
+        return self.calculate_metrics([metric_name]).to_dict("records")
 
     def calculate_eflux_rates(self) -> List[Dict[str, float]]:
-        return self._calculate_metric(
-            lambda roi: roi.calculate_eflux(),
-            metric_name="eflux",
-        )
+        return self._calculate_metric("eflux")
 
     def calculate_amplitudes(self) -> List[Dict[str, float]]:
-        return self._calculate_metric(
-            lambda roi: roi.calculate_amplitude(),
-            metric_name="amplitude",
-        )
+        return self._calculate_metric("amplitude")
 
     def calculate_integrals(self) -> List[Dict[str, float]]:
-        return self._calculate_metric(
-            lambda roi: roi.calculate_integral(),
-            metric_name="integral",
-        )
+        return self._calculate_metric("integral")
 
     def calculate_taus(self) -> List[Dict[str, float]]:
-        return self._calculate_metric(
-            lambda roi: roi.calculate_tau(),
-            metric_name="tau",
+        return self._calculate_metric("tau")
+
+    def fit_kinetics(self, rise_model: str = "sigmoid") -> pd.DataFrame:
+        """Fits decay and rise kinetics for all ROIs in one batch, see `calcium_imaging.analysis.fit_kinetics`."""
+        kinetics_df = fit_kinetics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in self.rois],
+            peak_indexes=[roi.peak_idx for roi in self.rois],
+            rise_model=rise_model,
+        )
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": self.id,
+            "roi": [roi.roi_id for roi in self.rois],
+        })
+        return pd.concat([keys_df, kinetics_df], axis=1)
+
+    def calculate_post_peak_metrics(self) -> pd.DataFrame:
+        """Baseline return, eflux window, amplitude, tau and integral for all ROIs in one batch."""
+        metrics_df = calculate_post_peak_metrics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in self.rois],
+            peak_indexes=[roi.peak_idx for roi in self.rois],
+            last_indexes=[roi.trace.index[-1] for roi in self.rois],
+            baseline_return_indexes=[roi.baseline_return_idx for roi in self.rois],
         )
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": self.id,
+            "roi": [roi.roi_id for roi in self.rois],
+        })
+        return pd.concat([keys_df, metrics_df], axis=1)
+
+    def detect_events(
+            self,
+            low_threshold_sigmas: float = EVENT_LOW_THRESHOLD_SIGMAS,
+            high_threshold_sigmas: float = EVENT_HIGH_THRESHOLD_SIGMAS,
+            min_amplitude: float = EVENT_MIN_AMPLITUDE,
+            min_duration_frames: int = EVENT_MIN_DURATION_FRAMES
+    ) -> pd.DataFrame:
+        """
+        Detects every transient of all ROIs in one batch, see `calcium_imaging.analysis.detect_events`.
+        Each ROI's own events are stored in `roi.events`.
+        """
+        events_df = detect_events(
+            self.get_trace_matrix(),
+            low_threshold_sigmas=low_threshold_sigmas,
+            high_threshold_sigmas=high_threshold_sigmas,
+            min_amplitude=min_amplitude,
+            min_duration_frames=min_duration_frames,
+        )
+        roi_events = dict(list(events_df.groupby("roi_position")))
+        for position, roi in enumerate(self.rois):
+            roi.events = roi_events.get(position, events_df.iloc[:0])[EVENT_COLUMNS].reset_index(drop=True)
+
+        events_df.insert(0, "roi", [self.rois[position].roi_id for position in events_df.pop("roi_position")])
+        events_df.insert(0, "coverslip", self.id)
+        events_df.insert(0, "group_type", self.group_type)
+        return events_df
+
+    def calculate_synchrony(self, max_lag: int = SYNCHRONY_MAX_LAG) -> SynchronyMatrices:
+        """
+        Pairwise correlation and lagged cross-correlation matrices of the ROIs, in ROI order, computed
+        with blocked matrix products. See `calcium_imaging.analysis.calculate_synchrony`.
+        """
+        return calculate_synchrony(self.get_trace_matrix(), max_lag=max_lag)
+
+    def get_synchrony_summary(self, max_lag: int = SYNCHRONY_MAX_LAG) -> Dict[str, float]:
+        """How coordinated the ROIs are, see `calcium_imaging.analysis.summarize_synchrony`."""
+        summary = summarize_synchrony(self.calculate_synchrony(max_lag), [roi.onset_idx for roi in self.rois])
+        return {"group_type": self.group_type, "coverslip": self.id, **summary}
+
+    def calculate_synchrony_metrics(self, max_lag: int = SYNCHRONY_MAX_LAG) -> pd.DataFrame:
+        """
+        One row per ROI: its mean correlation with the other ROIs of the coverslip, and the coverslip's
+        mean pairwise correlation, mean peak lagged correlation and onset dispersion.
+        """
+        synchrony = self.calculate_synchrony(max_lag)
+        summary = summarize_synchrony(synchrony, [roi.onset_idx for roi in self.rois])
+        return pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": self.id,
+            "roi": [roi.roi_id for roi in self.rois],
+            "mean_correlation": mean_correlation_per_roi(synchrony.correlation),
+            "coverslip_mean_correlation": summary["mean_pairwise_correlation"],
+            "coverslip_mean_peak_correlation": summary["mean_peak_correlation"],
+            "coverslip_onset_std": summary["onset_std"],
+        })
 
     def align_onsets(self, target_onset_idx: Optional[int] = None) -> int:
         if target_onset_idx is None:
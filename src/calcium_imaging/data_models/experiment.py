@@ -1,28 +1,94 @@
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Iterator, Union
+from typing import Any, Callable, List, Dict, Iterator, Optional, Sequence, Tuple, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
-from calcium_imaging.ui import get_bool_input, get_int_input
-from calcium_imaging.viz import create_traces_figure, get_n_colors_from_palette
+from calcium_imaging.analysis import (
+    DECONVOLUTION_BASELINE_PERCENTILE,
+    DECONVOLUTION_MIN_SPIKE_SIGMAS,
+    SYNCHRONY_MAX_LAG,
+    DeconvolvedTrace,
+    ResampledTraces,
+    TraceMatrix,
+    calculate_post_peak_metrics,
+    concat_trace_matrices,
+    deconvolve_trace,
+    fit_kinetics,
+    mean_over_rois,
+    resample_traces,
+)
+from calcium_imaging.io import RESULTS_DATABASE_FILE_NAME, ResultsDatabase
+from calcium_imaging.parallel import RoiView, map_rois
+from calcium_imaging.stats import hierarchical_bootstrap
+from calcium_imaging.ui import get_bool_input, get_int_input, run_review_app
+from calcium_imaging.viz import create_heatmap_figure, create_traces_figure, get_n_colors_from_palette
+from .coverslip import Coverslip, _calculate_roi_metrics
 from .group import Group
+from .memory_usage import MemoryUsage, attributes_getsizeof, deep_getsizeof, sum_memory_usages
 from .roi import ROI
+from .snapshot import load_snapshot, save_snapshot
+
+
+def _map_results_to_df(rois: List[ROI], results: List[Any]) -> pd.DataFrame:
+    """One row per ROI, dict (or Series) results become columns, anything else a `result` column."""
+    keys_df = pd.DataFrame({
+        "group_type": [roi.group_type for roi in rois],
+        "coverslip": [roi.coverslip_id for roi in rois],
+        "roi": [roi.roi_id for roi in rois],
+    })
+    if len(results) > 0 and all(isinstance(result, (dict, pd.Series)) for result in results):
+        results_df = pd.DataFrame.from_records([dict(result) for result in results])
+    else:
+        results_df = pd.DataFrame({"result": results})
+    return pd.concat([keys_df, results_df], axis=1)
+
+
+def _deconvolve_roi_view(view: RoiView, **kwargs) -> DeconvolvedTrace:
+    return deconvolve_trace(view.trace, **kwargs)
+
+
+def _deconvolve_rois(
+        rois: List[ROI],
+        n_jobs: Optional[int],
+        sparsity: float,
+        min_spike_sigmas: float,
+        baseline_percentile: float
+) -> pd.DataFrame:
+    """Deconvolves the ROIs in parallel, stores their activity and denoised trace, returns one row per ROI."""
+    func = partial(
+        _deconvolve_roi_view, sparsity=sparsity, min_spike_sigmas=min_spike_sigmas, baseline_percentile=baseline_percentile
+    )
+    results = map_rois(func, rois, n_jobs=n_jobs)
+    for roi, result in zip(rois, results):
+        roi.activity = pd.Series(result.activity, index=roi.trace.index, name=roi.name)
+        roi.denoised_trace = pd.Series(result.calcium, index=roi.trace.index, name=roi.name)
+    decays = np.array([result.decay for result in results], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        decay_frames = np.where(decays > 0, -1 / np.log(decays), 0.0)
+    return _map_results_to_df(rois, [
+        {
+            "decay": result.decay,
+            "decay_frames": decay_frames_value,
+            "baseline": result.baseline,
+            "noise_sigma": result.noise_sigma,
+            "num_active_frames": int(np.sum(result.activity > 0)),
+            "total_activity": float(np.nansum(result.activity)),
+        }
+        for result, decay_frames_value in zip(results, decay_frames)
+    ])
 
 
 class Experiment:
     """A folder containing multiple Conditions, e.g., 'SI_SH_check'."""
 
-    def __init__(self, name: str, groups: List[Group]) -> None:
-        """Holds multiple groups of the same experiment."""
+    def __init__(self, name: str, groups: List[Group], metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Holds multiple groups of the same experiment, `metadata` is free-form JSON serializable notes."""
         self.name = name
-        self.groups = sorted(groups, key=lambda g: g.group_type)
-        self._id2group = {g.group_type: g for g in self.groups}
-        self.num_groups = len(self.groups)
-        self.num_rois = len([roi for roi in self.iter_rois()])
-        self.title = f"{name} (Groups {', '.join([str(group.group_type) for group in self.groups])})"
+        self.metadata = {} if metadata is None else dict(metadata)
+        self._set_groups(groups)
+        self._roi_index_cache: Optional[Tuple[List[tuple], pd.DataFrame]] = None
 
     def __getitem__(self, group_type: str) -> Group:
         return self._id2group[group_type]
@@ -36,7 +102,144 @@ class Experiment:
     def __repr__(self) -> str:
         return self.title
 
+    def _set_groups(self, groups: List[Group]) -> None:
+        # new list rather than in-place changes, so ongoing iterations over the experiment are unaffected
+        self.groups = sorted(groups, key=lambda g: g.group_type)
+        self._id2group = {g.group_type: g for g in self.groups}
+        self.num_groups = len(self.groups)
+        self.num_rois = len([roi for roi in self.iter_rois()])
+        self.title = f"{self.name} (Groups {', '.join([str(group.group_type) for group in self.groups])})"
+
+    def add_coverslip(self, coverslip: Coverslip) -> None:
+        """Adds a coverslip to its group (created if needed), e.g. while the experiment is loading in the background."""
+        if coverslip.group_type in self._id2group:
+            self._id2group[coverslip.group_type].add_coverslip(coverslip)
+            self._set_groups(self.groups)
+        else:
+            self._set_groups(self.groups + [Group(coverslips=[coverslip])])
+
+    def memory_usage(self) -> MemoryUsage:
+        """
+        Deep byte count of the experiment, its groups and ROIs, broken down by traces, time vectors,
+        cached aggregates (detected events, the ROI index) and the rest (objects, names, metadata).
+        pandas' own bookkeeping objects aren't counted, they add a few KB per ROI on top (see
+        `estimate_experiment_nbytes`). See `get_memory_usage_df` for the per group breakdown.
+        """
+        own = MemoryUsage(
+            traces=0,
+            time=0,
+            cached=0 if self._roi_index_cache is None else deep_getsizeof(self._roi_index_cache),
+            metadata=attributes_getsizeof(self, exclude=("groups", "_id2group", "_roi_index_cache")),
+        )
+        return sum_memory_usages([own, *(group.memory_usage() for group in self.groups)])
+
+    def get_memory_usage_df(self) -> pd.DataFrame:
+        """One row of `memory_usage()` bytes per group, without the experiment's own cache and metadata."""
+        return pd.DataFrame.from_records([
+            {"experiment_name": self.name, "group_type": group.group_type, **group.memory_usage().to_dict()}
+            for group in self.groups
+        ], columns=["experiment_name", "group_type", *MemoryUsage._fields, "total"])
+
+    def get_roi_index(self) -> pd.DataFrame:
+        """
+        Columnar index of all ROIs, one row per ROI in `iter_rois()` order: ids, onset and peak frames and
+        the batch post-peak metrics (see `calculate_post_peak_metrics`).
+
+        Cached, and recomputed only once ROIs are added or dropped, or an ROI's trace, onset, peak or
+        baseline return changes.
+        """
+        rois = list(self.iter_rois())
+        if len(rois) == 0:
+            raise ValueError(f"Experiment '{self.name}' has no ROIs.")
+        state = [(id(roi), id(roi.trace), roi.onset_idx, roi.peak_idx, roi.baseline_return_idx) for roi in rois]
+        if self._roi_index_cache is None or self._roi_index_cache[0] != state:
+            roi_index = self.calculate_post_peak_metrics()
+            roi_index.insert(4, "onset_frame", [roi.onset_idx for roi in rois])
+            roi_index.insert(5, "peak_frame", [roi.peak_idx for roi in rois])
+            self._roi_index_cache = (state, roi_index)
+        return self._roi_index_cache[1].copy()
+
+    def _get_roi_mask(self, selection: Union[str, Sequence[bool]]) -> np.ndarray:
+        """Boolean mask over `iter_rois()` from a `get_roi_index().query` expression or a mask."""
+        if isinstance(selection, str):
+            if self.num_rois == 0:
+                return np.zeros(0, dtype=bool)
+            roi_index = self.get_roi_index()
+            return roi_index.index.isin(roi_index.query(selection).index)
+        mask = np.asarray(selection)
+        if mask.dtype != bool or mask.shape != (self.num_rois,):
+            raise ValueError(f"Expected a boolean mask of {self.num_rois} ROIs, got {mask.dtype} of shape {mask.shape}.")
+        return mask
+
+    def query(self, expr: str) -> List[ROI]:
+        """
+        ROIs whose row of `get_roi_index()` satisfies `expr`, in `pandas.DataFrame.query` syntax,
+        e.g. `exp.query("amplitude > 0.3 and group_type == 'siNCLX'")`.
+        """
+        rois = list(self.iter_rois())
+        return [rois[position] for position in np.flatnonzero(self._get_roi_mask(expr))]
+
+    def drop_rois(self, selection: Union[str, Sequence[bool]]) -> None:
+        """
+        Drops all selected ROIs in one operation, coverslips and groups left without ROIs are dropped too.
+
+        Parameters
+        ----------
+        selection : Union[str, Sequence[bool]]
+            A `query` expression, or a boolean mask aligned with the rows of `get_roi_index()`.
+        """
+        mask = self._get_roi_mask(selection)
+        roi_ids_to_drop: Dict[Tuple[str, int], List[int]] = {}
+        for roi, drop in zip(list(self.iter_rois()), mask):
+            if drop:
+                roi_ids_to_drop.setdefault((roi.group_type, roi.coverslip_id), []).append(roi.roi_id)
+
+        groups = []
+        for group in self.groups:
+            for coverslip in group.coverslips:
+                if (group.group_type, coverslip.id) in roi_ids_to_drop:
+                    coverslip.drop_rois(roi_ids_to_drop[(group.group_type, coverslip.id)])
+            empty_coverslip_ids = [cs.id for cs in group.coverslips if len(cs) == 0]
+            if len(empty_coverslip_ids) < len(group.coverslips):
+                if len(empty_coverslip_ids) > 0:
+                    group.drop_coverslips(empty_coverslip_ids)
+                groups.append(group)
+        self._set_groups(groups)
+        print(f"Dropped {int(mask.sum())} ROIs from '{self.name}', {self.num_rois} left")
+
+    def keep_rois(self, selection: Union[str, Sequence[bool]]) -> None:
+        """Drops all ROIs but the selected ones, see `drop_rois`."""
+        self.drop_rois(~self._get_roi_mask(selection))
+
+    def save_snapshot(self, path: Union[str, Path], compress: bool = False) -> Path:
+        """
+        Saves the ROIs, with their current (possibly manually edited or aligned) indexes and events,
+        to a single .npz file, restored with `Experiment.load_snapshot` without re-running any detection.
+        See `calcium_imaging.data_models.snapshot.save_snapshot`.
+        """
+        return save_snapshot(path, [self], compress=compress)
+
+    @classmethod
+    def load_snapshot(cls, path: Union[str, Path]) -> "Experiment":
+        snapshot = load_snapshot(path)
+        if len(snapshot.experiments) != 1:
+            raise ValueError(f"'{path}' holds {len(snapshot.experiments)} experiments, use Research.load_snapshot.")
+        name, metadata, groups = snapshot.experiments[0]
+        return cls(name=name, groups=groups, metadata=metadata)
+
+    def visualize_heatmap(self, sort_by: Optional[str] = "onset_frame", ascending: bool = True) -> None:
+        """
+        All ROIs as one raster heatmap per group (ROIs x frames) on a shared frame axis, rows sorted by an
+        analysis column within each group. See `Group.get_heatmap_panel`.
+        """
+        create_heatmap_figure(
+            [group.get_heatmap_panel(sort_by=sort_by, ascending=ascending) for group in self.groups],
+            title=f"{self.name} (sorted by {sort_by})" if sort_by is not None else self.name,
+        ).show()
+
     def visualize(self) -> None:
+        import plotly.graph_objects as go  # plotting libraries are imported on first use, they are slow to import
+
         colors = get_n_colors_from_palette(self.num_groups)
 
         all_traces = []
@@ -83,12 +286,41 @@ class Experiment:
         for group in self.groups:
             group.align_onsets(target_onset_idx)
 
-    def get_mean_traces_df(self) -> pd.DataFrame:
-        mean_traces = [group.get_mean_trace() for group in self.groups]
-        df = pd.concat(mean_traces, axis=1)
-        return df
+    def get_mean_traces_df(
+            self,
+            on: Optional[str] = None,
+            step: Optional[float] = None,
+            span: str = "intersection"
+    ) -> pd.DataFrame:
+        """
+        Mean trace per group. By default traces are aligned on their frame indexes, with `on='frame'`
+        or `on='time'` all ROIs are first resampled onto one shared grid (see `get_resampled_traces`),
+        which becomes the index.
+        """
+        if on is None:
+            mean_traces = [group.get_mean_trace() for group in self.groups]
+            df = pd.concat(mean_traces, axis=1)
+            return df
+        grid, traces = self.get_resampled_traces(on=on, step=step, span=span)
+        group_ends = np.cumsum([sum(len(cs) for cs in group) for group in self.groups])
+        group_traces = np.split(traces, group_ends[:-1], axis=1)
+        return pd.DataFrame(
+            {f"{group.group_type} mean": mean_over_rois(t) for group, t in zip(self.groups, group_traces)},
+            index=pd.Index(grid, name=on)
+        )
+
+    def get_mean_trace_stats(self) -> pd.DataFrame:
+        """Per group and frame count, mean, std and SEM of the traces, one row per (group, frame)."""
+        dfs = []
+        for group in self.groups:
+            df = group.get_mean_trace_stats().reset_index()
+            df.insert(0, "group_type", group.group_type)
+            dfs.append(df)
+        return pd.concat(dfs, ignore_index=True)
 
     def visualize_all_rois(self) -> None:
+        import matplotlib.pyplot as plt
+
         for roi in self.iter_rois():
             try:
                 roi.visualize()
@@ -101,6 +333,8 @@ class Experiment:
                 plt.show()
 
     def run_manual_analysis(self) -> None:
+        import matplotlib.pyplot as plt
+
         for i, roi in enumerate(self.iter_rois()):
             try:
                 print(f"ROI {i}/{self.num_rois}")
@@ -119,6 +353,20 @@ class Experiment:
                 else:
                     self._ask_to_update_params(roi)
 
+    def run_review_app(
+            self,
+            port: int = 0,
+            prefetch: int = 5,
+            batch_size: int = 10,
+            open_browser: bool = True
+    ) -> pd.DataFrame:
+        """
+        Reviews the ROIs in a local browser page instead of `input()` prompts: keyboard shortcuts accept
+        or drop a ROI, or set its peak/onset at the frame under the cursor. The next ROIs are prefetched
+        and edits are written to the experiment in batches. See `calcium_imaging.ui.run_review_app`.
+        """
+        return run_review_app(self, port=port, prefetch=prefetch, batch_size=batch_size, open_browser=open_browser)
+
     @staticmethod
     def _ask_to_update_params(roi: ROI):
         while True:
@@ -153,25 +401,29 @@ class Experiment:
         df = df.sort_values(by=["coverslip", "roi"], ascending=True)
         return df
 
-    def visualize_eflux_bar_chart(self) -> None:
+    def visualize_eflux_bar_chart(self, n_resamples: int = 10_000, n_jobs: Optional[int] = None) -> None:
+        import plotly.graph_objects as go
+
         df = self._get_eflux_rates_df()
-        group_stats = df.groupby('group_type')['eflux'].agg(['mean', 'std', 'count'])
 
-        # Compute SEM and 95% CI (approx)
-        group_stats['sem'] = group_stats['std'] / group_stats['count'] ** 0.5
-        group_stats['ci95'] = 1.96 * group_stats['sem']
+        # 95% CI from a hierarchical bootstrap, ROIs are resampled within resampled coverslips
+        group_stats = hierarchical_bootstrap(df, "eflux", n_resamples=n_resamples, n_jobs=n_jobs)
 
         # Plot with 95% CI as error bars
         fig = go.Figure([
             go.Bar(
                 x=group_stats.index,
                 y=group_stats['mean'],
-                error_y=dict(type='data', array=group_stats['ci95']),
+                error_y=dict(
+                    type='data',
+                    array=group_stats['ci_high'] - group_stats['mean'],
+                    arrayminus=group_stats['mean'] - group_stats['ci_low'],
+                ),
                 name='Mean ± 95% CI'
             )
         ])
         fig.update_layout(
-            title="Eflux mean with 95% Confidence Interval",
+            title="Eflux mean with 95% Confidence Interval (hierarchical bootstrap)",
             xaxis_title="Group Type",
             yaxis_title="Eflux",
             template="plotly_white"
@@ -199,17 +451,172 @@ class Experiment:
             for tau in group.calculate_taus()
         ]
 
+    def map_rois(self, func: Callable[[RoiView], Any], n_jobs: Optional[int] = None) -> pd.DataFrame:
+        """
+        Runs a custom per-ROI analysis in parallel, see `calcium_imaging.parallel.map_rois`.
+
+        `func` gets a `RoiView` (ids, indexes and zero-copy NumPy views of frames, trace and time)
+        and must be a module level function. Returns one row per ROI in `iter_rois()` order, with
+        one column per key if `func` returns dicts, otherwise a `result` column.
+        """
+        rois = list(self.iter_rois())
+        df = _map_results_to_df(rois, map_rois(func, rois, n_jobs=n_jobs))
+        df.insert(0, "experiment_name", self.name)
+        return df
+
+    def get_trace_matrix(self) -> TraceMatrix:
+        return concat_trace_matrices([cs.get_trace_matrix() for group in self.groups for cs in group])
+
+    def get_resampled_traces(
+            self,
+            on: str = "time",
+            step: Optional[float] = None,
+            span: str = "intersection",
+            grid: Optional[np.ndarray] = None
+    ) -> ResampledTraces:
+        """All ROIs on one shared grid, columns in `iter_rois()` order, see `Group.get_resampled_traces`."""
+        return resample_traces(self.get_trace_matrix(), on=on, step=step, span=span, grid=grid)
+
+    def calculate_metrics(self, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Registered metrics (all by default) of all ROIs of the experiment, one batch call per metric over
+        the experiment's trace matrix, see `calcium_imaging.analysis.register_metric`.
+        """
+        rois = list(self.iter_rois())
+        keys_df = pd.DataFrame({
+            "experiment_name": self.name,
+            "group_type": [roi.group_type for roi in rois],
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, _calculate_roi_metrics(self.get_trace_matrix(), rois, names)], axis=1)
+
+    def fit_kinetics(self, rise_model: str = "sigmoid") -> pd.DataFrame:
+        """Fits decay and rise kinetics for all ROIs of the experiment in one batch."""
+        rois = list(self.iter_rois())
+        kinetics_df = fit_kinetics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in rois],
+            peak_indexes=[roi.peak_idx for roi in rois],
+            rise_model=rise_model,
+        )
+        keys_df = pd.DataFrame({
+            "experiment_name": self.name,
+            "group_type": [roi.group_type for roi in rois],
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, kinetics_df], axis=1)
+
+    def calculate_post_peak_metrics(self) -> pd.DataFrame:
+        """Baseline return, eflux window, amplitude, tau and integral for all ROIs of the experiment in one batch."""
+        rois = list(self.iter_rois())
+        metrics_df = calculate_post_peak_metrics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in rois],
+            peak_indexes=[roi.peak_idx for roi in rois],
+            last_indexes=[roi.trace.index[-1] for roi in rois],
+            baseline_return_indexes=[roi.baseline_return_idx for roi in rois],
+        )
+        keys_df = pd.DataFrame({
+            "experiment_name": self.name,
+            "group_type": [roi.group_type for roi in rois],
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, metrics_df], axis=1)
+
+    def calculate_synchrony_metrics(self, max_lag: int = SYNCHRONY_MAX_LAG) -> pd.DataFrame:
+        """
+        Per ROI synchrony metrics within each coverslip: the ROI's mean correlation with the other ROIs,
+        and the coverslip's mean pairwise and peak lagged correlation and onset dispersion.
+        """
+        df = pd.concat([group.calculate_synchrony_metrics(max_lag) for group in self.groups], ignore_index=True)
+        df.insert(0, "experiment_name", self.name)
+        return df
+
+    def get_synchrony_summary_df(self, max_lag: int = SYNCHRONY_MAX_LAG) -> pd.DataFrame:
+        """
+        One row per coverslip with how coordinated its ROIs are: mean / median pairwise correlation,
+        fraction of correlated pairs, mean peak lagged correlation and lag, and onset dispersion.
+        """
+        df = pd.concat([group.get_synchrony_summary_df(max_lag) for group in self.groups], ignore_index=True)
+        df.insert(0, "experiment_name", self.name)
+        return df
+
+    def detect_events(self, **kwargs) -> pd.DataFrame:
+        """Event tables of all coverslips, see `Coverslip.detect_events` for the detection parameters."""
+        df = pd.concat([group.detect_events(**kwargs) for group in self.groups], ignore_index=True)
+        df.insert(0, "experiment_name", self.name)
+        return df
+
+    def deconvolve(
+            self,
+            sparsity: float = 0.0,
+            min_spike_sigmas: float = DECONVOLUTION_MIN_SPIKE_SIGMAS,
+            baseline_percentile: float = DECONVOLUTION_BASELINE_PERCENTILE,
+            n_jobs: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Infers every ROI's underlying activity with OASIS for an AR(1) calcium model, the decay estimated
+        per ROI, the ROIs in parallel as in `map_rois`. See `deconvolve_trace` for the parameters.
+
+        Each ROI's activity and denoised trace are stored in `roi.activity` and `roi.denoised_trace`,
+        indexed like its trace. Returns one row per ROI with the decay per frame, the decay time in
+        frames (-1 / ln decay), baseline, noise_sigma, num_active_frames and total_activity.
+        """
+        df = _deconvolve_rois(
+            list(self.iter_rois()),
+            n_jobs=n_jobs,
+            sparsity=sparsity,
+            min_spike_sigmas=min_spike_sigmas,
+            baseline_percentile=baseline_percentile,
+        )
+        df.insert(0, "experiment_name", self.name)
+        return df
+
     def get_group_type_to_df(self) -> Dict[str, pd.DataFrame]:
         return {g.group_type: g.get_df() for g in self.groups}
 
-    def save_mega_dfs(self, results_output_dir_path: str = "./results") -> None:  # todo handle i/o better
-        results_output_dir_path = Path(results_output_dir_path) / self.name
-        results_output_dir_path.mkdir(parents=True, exist_ok=True)
+    def save_mega_dfs(self, results_output_dir_path: str = "./results", results_database: bool = True) -> None:  # todo handle i/o better
+        """
+        Saves every group's traces to `<results_output_dir_path>/<experiment>/<group>.xlsx/.csv`, and
+        appends the full analysis table as a new run to the `results.sqlite` results database in
+        `results_output_dir_path` unless `results_database` is False.
+        """
+        experiment_output_dir_path = Path(results_output_dir_path) / self.name
+        experiment_output_dir_path.mkdir(parents=True, exist_ok=True)
         for group_type, df in self.get_group_type_to_df().items():
-            base = results_output_dir_path / group_type
+            base = experiment_output_dir_path / group_type
             df.to_excel(base.with_suffix(".xlsx"), index=False)
             df.to_csv(base.with_suffix(".csv"), index=False)
-        print(f"Successfully saved {self.num_groups} mega dfs to {results_output_dir_path.resolve()}")
+        print(f"Successfully saved {self.num_groups} mega dfs to {experiment_output_dir_path.resolve()}")
+        if results_database:
+            self.save_to_results_database(Path(results_output_dir_path) / RESULTS_DATABASE_FILE_NAME)
+
+    def save_to_results_database(
+            self,
+            database_path: Union[str, Path] = RESULTS_DATABASE_FILE_NAME,
+            analysis_df: Optional[pd.DataFrame] = None,
+            research_name: Optional[str] = None
+    ) -> int:
+        """
+        Appends the full analysis table (computed if not given) as a new run of the SQLite results
+        database, with the Preprocessor settings and provenance from `metadata`. See
+        `calcium_imaging.io.ResultsDatabase` for querying the history. Returns the run id.
+        """
+        metadata = dict(self.metadata)
+        settings = metadata.pop("preprocessor_settings", {})
+        analysis_df = self.get_full_analysis_df() if analysis_df is None else analysis_df
+        run_id = ResultsDatabase(database_path).add_run(
+            analysis_df,
+            experiment_name=self.name,
+            settings=settings,
+            provenance=metadata,
+            research_name=research_name,
+        )
+        print(f"Saved {len(analysis_df)} ROIs of '{self.name}' as run {run_id} of {Path(database_path).resolve()}")
+        return run_id
 
     def iter_rois(self) -> Iterator[ROI]:
         for group in self.groups:
@@ -217,51 +624,33 @@ class Experiment:
                 for roi in coverslip.rois:
                     yield roi
 
-    def get_full_analysis_df(self) -> pd.DataFrame:
-        records = []
-        for group in self.groups:
-            for coverslip in group.coverslips:
-                for roi in coverslip.rois:
-                    try:
-                        eflux = roi.calculate_eflux()
-                    except RuntimeError:
-                        eflux = np.nan
-
-                    try:
-                        influx = roi.calculate_influx()
-                    except RuntimeError:
-                        influx = np.nan
-
-                    try:
-                        amplitude = roi.calculate_amplitude()
-                    except RuntimeError:
-                        amplitude = np.nan
-
-                    try:
-                        integral = roi.calculate_integral()
-                    except RuntimeError:
-                        integral = np.nan
-
-                    try:
-                        tau = roi.calculate_tau()
-                    except RuntimeError:
-                        tau = np.nan
-
-                    records.append({
-                        "experiment_name": self.name,
-                        "group_type": group.group_type,
-                        "coverslip": coverslip.id,
-                        "roi": roi.roi_id,
-                        "onset_frame": roi.onset_idx,
-                        "peak_frame": roi.peak_idx,
-                        "eflux": eflux,
-                        "influx": influx,
-                        "amplitude": amplitude,
-                        "integral": integral,
-                        "tau": tau,
-                    })
-
-        df = pd.DataFrame.from_records(records)
+    def get_full_analysis_df(
+            self,
+            include_kinetics: bool = False,
+            rise_model: str = "sigmoid",
+            include_synchrony: bool = False
+    ) -> pd.DataFrame:
+        """
+        One row per ROI with its onset and peak frames and every registered metric (eflux, influx,
+        amplitude, integral, tau and any added with `register_metric`), each computed for all ROIs in
+        one batch, optionally with the kinetic fits and synchrony metrics.
+        """
+        rois = list(self.iter_rois())
+        df = self.calculate_metrics()
+        df.insert(4, "onset_frame", [roi.onset_idx for roi in rois])
+        df.insert(5, "peak_frame", [roi.peak_idx for roi in rois])
+        if include_kinetics:
+            df = df.merge(
+                self.fit_kinetics(rise_model=rise_model),
+                on=["experiment_name", "group_type", "coverslip", "roi"],
+                how="left"
+            )
+        if include_synchrony:
+            df = df.merge(
+                self.calculate_synchrony_metrics(),
+                on=["experiment_name", "group_type", "coverslip", "roi"],
+                how="left"
+            )
         df = df.sort_values(by=["experiment_name", "coverslip", "roi"], ascending=True)
         df = df.reset_index(drop=True)
         return df
@@ -1,10 +1,23 @@
-from typing import List, Iterator, Dict, Optional
+from typing import Iterable, List, Iterator, Dict, Optional, Sequence
 
 import numpy as np
 import pandas as pd
 
-from calcium_imaging.viz import create_traces_figure
-from .coverslip import Coverslip
+from calcium_imaging.analysis import (
+    SYNCHRONY_MAX_LAG,
+    ResampledTraces,
+    TraceAccumulator,
+    TraceMatrix,
+    calculate_post_peak_metrics,
+    concat_trace_matrices,
+    fit_kinetics,
+    get_registered_metrics,
+    mean_over_rois,
+    resample_traces,
+)
+from calcium_imaging.viz import HeatmapPanel, create_heatmap_figure, create_traces_figure
+from .coverslip import Coverslip, _calculate_roi_metrics
+from .memory_usage import MemoryUsage, attributes_getsizeof, sum_memory_usages
 
 
 class Group:
@@ -20,6 +33,27 @@ class Group:
     def get_df(self) -> pd.DataFrame:
         return pd.concat([cs.get_df() for cs in self.coverslips], axis=1)
 
+    def memory_usage(self) -> MemoryUsage:
+        """Deep byte count of the group and its coverslips, see `ROI.memory_usage`."""
+        own = MemoryUsage(0, 0, 0, attributes_getsizeof(self, exclude=("coverslips", "_id2coverslip")))
+        return sum_memory_usages([own, *(cs.memory_usage() for cs in self.coverslips)])
+
+    def get_trace_matrix(self) -> TraceMatrix:
+        return concat_trace_matrices([cs.get_trace_matrix() for cs in self.coverslips])
+
+    def get_resampled_traces(
+            self,
+            on: str = "time",
+            step: Optional[float] = None,
+            span: str = "intersection",
+            grid: Optional[np.ndarray] = None
+    ) -> ResampledTraces:
+        """
+        All ROIs of the group interpolated onto one shared grid, in frames or in time, as one dense
+        (n_samples, n_rois) matrix. See `calcium_imaging.analysis.resample_traces`.
+        """
+        return resample_traces(self.get_trace_matrix(), on=on, step=step, span=span, grid=grid)
+
     def __repr__(self) -> str:
         return self.title
 
@@ -50,8 +84,69 @@ class Group:
             yaxis_title="Fluorescence relative to background",
         ).show()
 
+    def _get_roi_values(self, column: str) -> np.ndarray:
+        """
+        Per ROI values of an analysis column, in ROI order: 'onset_frame', 'peak_frame', any registered
+        metric (e.g. 'amplitude', 'eflux' or one added with `register_metric`) or a post-peak frame.
+        """
+        rois = [roi for cs in self.coverslips for roi in cs]
+        if column == "onset_frame":
+            return np.array([roi.onset_idx for roi in rois], dtype=float)
+        if column == "peak_frame":
+            return np.array([roi.peak_idx for roi in rois], dtype=float)
+        metric_names = get_registered_metrics()["name"].tolist()
+        if column in metric_names:
+            return self.calculate_metrics([column])[column].to_numpy(dtype=float)
+        post_peak_df = self.calculate_post_peak_metrics()
+        post_peak_columns = [col for col in post_peak_df.columns if col not in ("group_type", "coverslip", "roi")]
+        if column not in post_peak_columns:
+            raise ValueError(
+                f"Can't sort ROIs by '{column}', expected 'onset_frame', 'peak_frame' or one of "
+                f"{metric_names + [col for col in post_peak_columns if col not in metric_names]}."
+            )
+        return post_peak_df[column].to_numpy(dtype=float)
+
+    def get_heatmap_panel(self, sort_by: Optional[str] = "onset_frame", ascending: bool = True) -> HeatmapPanel:
+        """
+        The group's traces as one ROIs x frames raster, rows sorted by an analysis column (NaNs last),
+        or in coverslip order if `sort_by` is None. See `calcium_imaging.viz.create_heatmap_figure`.
+        """
+        rois = [roi for cs in self.coverslips for roi in cs]
+        trace_matrix = self.get_trace_matrix()
+        order = np.arange(len(rois))
+        if sort_by is not None:
+            values = self._get_roi_values(sort_by)
+            order = np.argsort(values if ascending else -values, kind="stable")
+        return HeatmapPanel(
+            title=self.title,
+            frames=trace_matrix.frames,
+            traces=trace_matrix.traces[:, order],
+            row_labels=[rois[position].name for position in order],
+            onset_frames=np.array([rois[position].onset_idx for position in order]),
+            peak_frames=np.array([rois[position].peak_idx for position in order]),
+        )
+
+    def visualize_heatmap(self, sort_by: Optional[str] = "onset_frame", ascending: bool = True) -> None:
+        """Raster heatmap of all ROIs, readable where `visualize` line overlays are not, see `get_heatmap_panel`."""
+        create_heatmap_figure(
+            [self.get_heatmap_panel(sort_by=sort_by, ascending=ascending)],
+            title=f"{self.group_type} (sorted by {sort_by})" if sort_by is not None else self.group_type,
+        ).show()
+
+    def accumulate_traces(self, accumulator: Optional[TraceAccumulator] = None) -> TraceAccumulator:
+        """Adds the traces to the per-frame accumulator one coverslip at a time, see `TraceAccumulator`."""
+        accumulator = TraceAccumulator() if accumulator is None else accumulator
+        for coverslip in self.coverslips:
+            coverslip.accumulate_traces(accumulator)
+        return accumulator
+
+    def get_mean_trace_stats(self) -> pd.DataFrame:
+        """Per frame count, mean, std and SEM of the group's traces, for mean +- SEM bands."""
+        return self.accumulate_traces().to_df()
+
     def get_mean_trace(self) -> pd.Series:
-        mean_trace = pd.Series(pd.concat([roi.trace for cs in self.coverslips for roi in cs], axis=1).mean(axis=1))
+        trace_matrix = self.get_trace_matrix()
+        mean_trace = pd.Series(mean_over_rois(trace_matrix.traces), index=trace_matrix.frames)
         mean_trace.name = f"{self.group_type} mean"
         return mean_trace
 
@@ -83,6 +178,77 @@ class Group:
             for tau in cs.calculate_taus()
         ]
 
+    def calculate_metrics(self, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Registered metrics (all by default) of all ROIs of the group, see `Coverslip.calculate_metrics`."""
+        rois = [roi for cs in self.coverslips for roi in cs]
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, _calculate_roi_metrics(self.get_trace_matrix(), rois, names)], axis=1)
+
+    def fit_kinetics(self, rise_model: str = "sigmoid") -> pd.DataFrame:
+        """Fits decay and rise kinetics for all ROIs of the group in one batch."""
+        rois = [roi for cs in self.coverslips for roi in cs]
+        kinetics_df = fit_kinetics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in rois],
+            peak_indexes=[roi.peak_idx for roi in rois],
+            rise_model=rise_model,
+        )
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, kinetics_df], axis=1)
+
+    def calculate_post_peak_metrics(self) -> pd.DataFrame:
+        """Baseline return, eflux window, amplitude, tau and integral for all ROIs of the group in one batch."""
+        rois = [roi for cs in self.coverslips for roi in cs]
+        metrics_df = calculate_post_peak_metrics(
+            self.get_trace_matrix(),
+            onset_indexes=[roi.onset_idx for roi in rois],
+            peak_indexes=[roi.peak_idx for roi in rois],
+            last_indexes=[roi.trace.index[-1] for roi in rois],
+            baseline_return_indexes=[roi.baseline_return_idx for roi in rois],
+        )
+        keys_df = pd.DataFrame({
+            "group_type": self.group_type,
+            "coverslip": [roi.coverslip_id for roi in rois],
+            "roi": [roi.roi_id for roi in rois],
+        })
+        return pd.concat([keys_df, metrics_df], axis=1)
+
+    def calculate_synchrony_metrics(self, max_lag: int = SYNCHRONY_MAX_LAG) -> pd.DataFrame:
+        """Per ROI synchrony metrics, within each coverslip, see `Coverslip.calculate_synchrony_metrics`."""
+        return pd.concat([cs.calculate_synchrony_metrics(max_lag) for cs in self.coverslips], ignore_index=True)
+
+    def get_synchrony_summary_df(self, max_lag: int = SYNCHRONY_MAX_LAG) -> pd.DataFrame:
+        """One row of synchrony summary metrics per coverslip, see `Coverslip.get_synchrony_summary`."""
+        return pd.DataFrame.from_records([cs.get_synchrony_summary(max_lag) for cs in self.coverslips])
+
+    def detect_events(self, **kwargs) -> pd.DataFrame:
+        """Event tables of all coverslips, see `Coverslip.detect_events` for the detection parameters."""
+        return pd.concat([cs.detect_events(**kwargs) for cs in self.coverslips], ignore_index=True)
+
+    def add_coverslip(self, coverslip: Coverslip) -> None:
+        """Adds a coverslip of the same group type, e.g. while the experiment is still loading."""
+        if coverslip.id in self._id2coverslip:
+            raise ValueError(f"Coverslip {coverslip.id} already exists in group '{self.group_type}'.")
+        # new list rather than in-place insertion, so ongoing iterations over the group are unaffected
+        self.coverslips = self._init_coverslips(self.coverslips + [coverslip])
+        self._id2coverslip = {cs.id: cs for cs in self.coverslips}
+        self.title = f"{self.group_type} (Coverslips {', '.join([str(cs.id) for cs in self.coverslips])})"
+
+    def drop_coverslips(self, coverslip_ids: Iterable[int]) -> None:
+        """Drops several coverslips at once, e.g. the ones left without ROIs by `Experiment.drop_rois`."""
+        coverslip_ids = set(coverslip_ids)
+        self.coverslips = [cs for cs in self.coverslips if cs.id not in coverslip_ids]
+        self._id2coverslip = {cs.id: cs for cs in self.coverslips}
+        self.title = f"{self.group_type} (Coverslips {', '.join([str(cs.id) for cs in self.coverslips])})"
+
     def align_onsets(self, target_onset_idx: Optional[int] = None) -> int:
         if target_onset_idx is None:
             onset_indexes = [roi.onset_idx for cs in self.coverslips for roi in cs]
@@ -0,0 +1,76 @@
+import sys
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Set
+
+import pandas as pd
+
+# bytes of a Series' pandas objects (block manager, block, copy-on-write references, flags) that
+# `Series.memory_usage(deep=True)` leaves out, measured with tracemalloc on loaded ROIs (pandas 2.x)
+SERIES_OVERHEAD_NBYTES = 2560
+
+
+class MemoryUsage(NamedTuple):
+    traces: int  # bytes of the fluorescence traces, with their index
+    time: int  # bytes of the time vectors, with their index
+    cached: int  # bytes of derived tables kept for reuse, e.g. detected events and the ROI index
+    metadata: int  # bytes of everything else: the objects themselves, names, indices, containers, metadata
+
+    @property
+    def total(self) -> int:
+        return self.traces + self.time + self.cached + self.metadata
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**self._asdict(), "total": self.total}
+
+    def __repr__(self) -> str:
+        return "MemoryUsage(" + ", ".join(f"{name}={_format_nbytes(nbytes)}" for name, nbytes in self.to_dict().items()) + ")"
+
+
+def _format_nbytes(nbytes: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.2f} GB"
+
+
+def sum_memory_usages(usages: Iterable[MemoryUsage]) -> MemoryUsage:
+    return MemoryUsage(*(sum(values) for values in zip(MemoryUsage(0, 0, 0, 0), *usages)))
+
+
+def deep_getsizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    Bytes of `obj` and everything it holds, pandas and numpy buffers included, shared objects counted once.
+    pandas objects are counted as their `memory_usage(deep=True)` plus SERIES_OVERHEAD_NBYTES.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum()) + SERIES_OVERHEAD_NBYTES
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True)) + SERIES_OVERHEAD_NBYTES
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage(deep=True))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(key, seen) + deep_getsizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    return size
+
+
+def attributes_getsizeof(obj: Any, exclude: Iterable[str] = ()) -> int:
+    """
+    Bytes of an object and of its attributes, except the `exclude` ones which are accounted for separately
+    (of those, only list and dict containers are counted, without their items).
+    """
+    exclude = set(exclude)
+    seen = {id(obj)}
+    size = sys.getsizeof(obj) + sys.getsizeof(vars(obj))
+    for name, value in vars(obj).items():
+        if name not in exclude:
+            size += deep_getsizeof(value, seen)
+        elif isinstance(value, (list, dict)):
+            size += sys.getsizeof(value)
+    return size
@@ -1,21 +1,29 @@
-from typing import List, Iterator, Dict
+from typing import Any, Callable, List, Iterator, Dict, Optional, Sequence, Union
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-from .experiment import Experiment
+from calcium_imaging.analysis import DECONVOLUTION_BASELINE_PERCENTILE, DECONVOLUTION_MIN_SPIKE_SIGMAS
+from calcium_imaging.io import RESULTS_DATABASE_FILE_NAME
+from calcium_imaging.parallel import RoiView, map_rois
+from calcium_imaging.viz import create_heatmap_figure
+from .experiment import Experiment, _deconvolve_rois, _map_results_to_df
+from .memory_usage import MemoryUsage, attributes_getsizeof, sum_memory_usages
+from .roi import ROI
+from .snapshot import load_snapshot, save_snapshot
 
 
 class Research:
     """A collection of multiple experiments."""
 
-    def __init__(self, name: str, experiments: List[Experiment]) -> None:
+    def __init__(self, name: str, experiments: List[Experiment], metadata: Optional[Dict[str, Any]] = None) -> None:
         """Holds multiple experiments of the same research project."""
         self.name = name
+        self.metadata = {} if metadata is None else dict(metadata)
         self.experiments = sorted(experiments, key=lambda e: e.name)
         self._id2experiment = {e.name: e for e in self.experiments}
         self.num_experiments = len(self.experiments)
-        self.num_groups = sum(e.num_groups for e in self.experiments)
-        self.num_rois = sum(e.num_rois for e in self.experiments)
+        self._update_counts()
         self.title = f"{name} (Experiments {', '.join([e.name for e in self.experiments])})"
 
     def __getitem__(self, experiment_name: str) -> Experiment:
@@ -30,26 +38,158 @@ class Research:
     def __repr__(self) -> str:
         return self.title
 
-    def get_full_analysis_df(self) -> pd.DataFrame:
+    def _update_counts(self) -> None:
+        self.num_groups = sum(e.num_groups for e in self.experiments)
+        self.num_rois = sum(e.num_rois for e in self.experiments)
+
+    def memory_usage(self) -> MemoryUsage:
+        """Deep byte count of all experiments, see `Experiment.memory_usage`."""
+        own = MemoryUsage(0, 0, 0, attributes_getsizeof(self, exclude=("experiments", "_id2experiment")))
+        return sum_memory_usages([own, *(experiment.memory_usage() for experiment in self.experiments)])
+
+    def get_memory_usage_df(self) -> pd.DataFrame:
+        """One row of `memory_usage()` bytes per experiment, largest first, to find what fills the RAM."""
+        df = pd.DataFrame.from_records([
+            {"experiment_name": experiment.name, "num_rois": experiment.num_rois, **experiment.memory_usage().to_dict()}
+            for experiment in self.experiments
+        ], columns=["experiment_name", "num_rois", *MemoryUsage._fields, "total"])
+        return df.sort_values(by="total", ascending=False, ignore_index=True)
+
+    def get_roi_index(self) -> pd.DataFrame:
+        """Columnar index of the ROIs of all experiments, see `Experiment.get_roi_index`."""
+        return pd.concat(
+            [experiment.get_roi_index() for experiment in self.experiments if experiment.num_rois > 0],
+            ignore_index=True
+        )
+
+    def _split_roi_mask(self, selection: Union[str, Sequence[bool]]) -> List[np.ndarray]:
+        """Per experiment boolean masks, from a `get_roi_index().query` expression or a research-wide mask."""
+        if isinstance(selection, str):
+            return [experiment._get_roi_mask(selection) for experiment in self.experiments]
+        mask = np.asarray(selection)
+        if mask.dtype != bool or mask.shape != (self.num_rois,):
+            raise ValueError(f"Expected a boolean mask of {self.num_rois} ROIs, got {mask.dtype} of shape {mask.shape}.")
+        return np.split(mask, np.cumsum([experiment.num_rois for experiment in self.experiments])[:-1])
+
+    def query(self, expr: str) -> List[ROI]:
+        """ROIs of all experiments whose row of `get_roi_index()` satisfies `expr`, see `Experiment.query`."""
+        return [roi for experiment in self.experiments for roi in experiment.query(expr)]
+
+    def drop_rois(self, selection: Union[str, Sequence[bool]]) -> None:
+        """Drops the selected ROIs of all experiments, see `Experiment.drop_rois`."""
+        for experiment, mask in zip(self.experiments, self._split_roi_mask(selection)):
+            experiment.drop_rois(mask)
+        self._update_counts()
+
+    def keep_rois(self, selection: Union[str, Sequence[bool]]) -> None:
+        """Drops all ROIs but the selected ones, see `Experiment.drop_rois`."""
+        self.drop_rois(~np.concatenate(self._split_roi_mask(selection)))
+
+    def get_mean_trace_stats(self) -> pd.DataFrame:
+        """Per experiment, group and frame count, mean, std and SEM, see `Experiment.get_mean_trace_stats`."""
+        dfs = []
+        for experiment in self.experiments:
+            df = experiment.get_mean_trace_stats()
+            df.insert(0, "experiment_name", experiment.name)
+            dfs.append(df)
+        return pd.concat(dfs, ignore_index=True)
+
+    def visualize_heatmap(self, sort_by: Optional[str] = "onset_frame", ascending: bool = True) -> None:
+        """Overview of all ROIs, one raster heatmap per (experiment, group), see `Experiment.visualize_heatmap`."""
+        panels = []
+        for experiment in self.experiments:
+            for group in experiment.groups:
+                panel = group.get_heatmap_panel(sort_by=sort_by, ascending=ascending)
+                panels.append(panel._replace(title=f"{experiment.name}: {panel.title}"))
+        create_heatmap_figure(
+            panels,
+            title=f"{self.name} (sorted by {sort_by})" if sort_by is not None else self.name,
+        ).show()
+
+    def map_rois(self, func: Callable[[RoiView], Any], n_jobs: Optional[int] = None) -> pd.DataFrame:
+        """Runs a custom per-ROI analysis over all experiments in one pool, see `Experiment.map_rois`."""
+        rois = [roi for experiment in self.experiments for roi in experiment.iter_rois()]
+        df = _map_results_to_df(rois, map_rois(func, rois, n_jobs=n_jobs))
+        df.insert(0, "experiment_name", [experiment.name for experiment in self.experiments for _ in experiment.iter_rois()])
+        return df
+
+    def calculate_metrics(self, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Registered metrics of all experiments' ROIs, see `Experiment.calculate_metrics`."""
+        return pd.concat([experiment.calculate_metrics(names) for experiment in self.experiments], ignore_index=True)
+
+    def deconvolve(
+            self,
+            sparsity: float = 0.0,
+            min_spike_sigmas: float = DECONVOLUTION_MIN_SPIKE_SIGMAS,
+            baseline_percentile: float = DECONVOLUTION_BASELINE_PERCENTILE,
+            n_jobs: Optional[int] = None
+    ) -> pd.DataFrame:
+        """Deconvolves all experiments' ROIs in one pool, see `Experiment.deconvolve`."""
+        rois = [roi for experiment in self.experiments for roi in experiment.iter_rois()]
+        df = _deconvolve_rois(
+            rois, n_jobs=n_jobs, sparsity=sparsity, min_spike_sigmas=min_spike_sigmas, baseline_percentile=baseline_percentile
+        )
+        df.insert(0, "experiment_name", [experiment.name for experiment in self.experiments for _ in experiment.iter_rois()])
+        return df
+
+    def save_snapshot(self, path: Union[str, Path], compress: bool = False) -> Path:
+        """Saves all experiments to a single .npz file, see `Experiment.save_snapshot`."""
+        return save_snapshot(
+            path, self.experiments, research_name=self.name, research_metadata=self.metadata, compress=compress
+        )
+
+    @classmethod
+    def load_snapshot(cls, path: Union[str, Path]) -> "Research":
+        snapshot = load_snapshot(path)
+        experiments = [
+            Experiment(name=name, groups=groups, metadata=metadata)
+            for name, metadata, groups in snapshot.experiments
+        ]
+        return cls(name=snapshot.research_name, experiments=experiments, metadata=snapshot.research_metadata)
+
+    def get_full_analysis_df(
+            self,
+            include_kinetics: bool = False,
+            rise_model: str = "sigmoid",
+            include_synchrony: bool = False
+    ) -> pd.DataFrame:
         """Get a combined DataFrame of all experiments' analysis results."""
-        dfs = [experiment.get_full_analysis_df() for experiment in self.experiments]
+        dfs = [
+            experiment.get_full_analysis_df(
+                include_kinetics=include_kinetics,
+                rise_model=rise_model,
+                include_synchrony=include_synchrony
+            )
+            for experiment in self.experiments
+        ]
         df = pd.concat(dfs, axis=0)
         df = df.sort_values(by=["experiment_name", "group_type", "coverslip", "roi"], ascending=True)
         df = df.reset_index(drop=True)
         return df
 
-    def save_mega_dfs(self, results_output_dir_path: str = "./results") -> None:
-        """Save analysis results for all experiments."""
-        results_output_dir_path = Path(results_output_dir_path) / self.name
-        results_output_dir_path.mkdir(parents=True, exist_ok=True)
+    def save_mega_dfs(self, results_output_dir_path: str = "./results", results_database: bool = True) -> None:
+        """
+        Save analysis results for all experiments, and append every experiment as a new run to the
+        `results.sqlite` results database in `results_output_dir_path` unless `results_database` is False.
+        """
+        research_output_dir_path = Path(results_output_dir_path) / self.name
+        research_output_dir_path.mkdir(parents=True, exist_ok=True)
         
         # Save individual experiment results
         for experiment in self.experiments:
-            experiment.save_mega_dfs(results_output_dir_path)
+            experiment.save_mega_dfs(research_output_dir_path, results_database=False)
         
         # Save combined results
         combined_df = self.get_full_analysis_df()
-        base = results_output_dir_path / "combined_analysis"
+        base = research_output_dir_path / "combined_analysis"
         combined_df.to_excel(base.with_suffix(".xlsx"), index=False)
         combined_df.to_csv(base.with_suffix(".csv"), index=False)
-        print(f"Successfully saved combined analysis to {results_output_dir_path.resolve()}") 
\ No newline at end of file
+        print(f"Successfully saved combined analysis to {research_output_dir_path.resolve()}") 
+
+        if results_database:
+            for experiment in self.experiments:
+                experiment.save_to_results_database(
+                    Path(results_output_dir_path) / RESULTS_DATABASE_FILE_NAME,
+                    analysis_df=combined_df[combined_df["experiment_name"] == experiment.name],
+                    research_name=self.name,
+                )
@@ -12,6 +12,7 @@ from calcium_imaging.analysis import (
     detect_eflux_end_index,
 )
 from calcium_imaging.viz import create_traces_figure
+from .memory_usage import SERIES_OVERHEAD_NBYTES, MemoryUsage, attributes_getsizeof, deep_getsizeof
 
 
 class ROI:
@@ -35,6 +36,12 @@ class ROI:
         eflux_start_idx (int): Start index for eflux calculation.
         eflux_end_idx (int): End index for eflux calculation.
         baseline_return_idx (int): Index where the trace returns to baseline.
+        events (Optional[pd.DataFrame]): Table of all transients of the trace, one row per event,
+            set by `Coverslip.detect_events`. None until events are detected.
+        activity (Optional[pd.Series]): Inferred non-negative activity (spikes) per frame, indexed like
+            the trace, set by `Experiment.deconvolve`. None until deconvolved.
+        denoised_trace (Optional[pd.Series]): Trace fitted by the deconvolution's AR(1) calcium model,
+            set by `Experiment.deconvolve`. None until deconvolved.
     """
     EFLUX_START_INDEX_OFFSET_FROM_PEAK = 5
 
@@ -63,14 +70,17 @@ class ROI:
         self.time = time.copy(deep=True).rename(f"time_{self.name}")
         self.trace = trace.copy(deep=True).rename(self.name)
         self.onset_idx = detect_onset_index(self.trace)
-        self.peak_idx = detect_peak_index(self.trace)
+        self.peak_idx = detect_peak_index(self.trace, start_bound=self.onset_idx)
         self.influx_start_idx = self.onset_idx
         self.influx_end_idx = self.peak_idx
         self.eflux_start_idx = self.peak_idx + self.EFLUX_START_INDEX_OFFSET_FROM_PEAK
-        self.eflux_end_idx = detect_eflux_end_index(self.trace)
+        self.eflux_end_idx = detect_eflux_end_index(self.trace, self.peak_idx)
         self.baseline_return_idx = detect_baseline_return_idx(
             self.trace, self.eflux_start_idx
         )
+        self.events: Optional[pd.DataFrame] = None
+        self.activity: Optional[pd.Series] = None
+        self.denoised_trace: Optional[pd.Series] = None
 
     def shift_trace(self, periods: int) -> None:
         """Shift the trace and all associated indices by a specified number of periods.
@@ -87,6 +97,12 @@ class ROI:
         self.eflux_start_idx = self.eflux_start_idx + periods
         self.eflux_end_idx = self.eflux_end_idx + periods
         self.baseline_return_idx = min(self.baseline_return_idx + periods, self.trace.index[-1])
+        if self.events is not None:
+            frame_cols = ["onset_frame", "peak_frame", "end_frame"]
+            self.events[frame_cols] = self.events[frame_cols] + periods
+        if self.activity is not None:
+            self.activity = self.activity.shift(periods)
+            self.denoised_trace = self.denoised_trace.shift(periods)
 
     def calculate_influx(self) -> float:
         """Calculate the influx rate of calcium for this ROI.
@@ -150,7 +166,7 @@ class ROI:
         target_value = 1 + (peak_value - 1) * 0.368  # 63.2% decay from peak
         
         # Search forward from peak to find where trace crosses target value
-        for idx in range(self.peak_idx, len(self.trace)):
+        for idx in range(self.peak_idx, self.trace.index[-1] + 1):
             if self.trace.loc[idx] <= target_value:
                 return self.time.loc[idx] - self.time.loc[self.peak_idx]
             
@@ -214,6 +230,22 @@ class ROI:
         """
         self.baseline_return_idx = baseline_return_idx
 
+    def memory_usage(self) -> MemoryUsage:
+        """Deep byte count of this ROI, broken down by trace, time vector, cached results (events,
+        deconvolution) and the rest, which includes the pandas objects of the trace and time series.
+
+        Returns:
+            MemoryUsage: Bytes of each component, `.total` for their sum.
+        """
+        return MemoryUsage(
+            traces=int(self.trace.memory_usage(index=True, deep=True)),
+            time=int(self.time.memory_usage(index=True, deep=True)),
+            cached=sum(0 if cached is None else deep_getsizeof(cached)
+                       for cached in (self.events, self.activity, self.denoised_trace)),
+            metadata=attributes_getsizeof(self, exclude=("trace", "time", "events", "activity", "denoised_trace"))
+                     + 2 * SERIES_OVERHEAD_NBYTES,  # pandas objects of the trace and time series
+        )
+
     def __repr__(self) -> str:
         """Return a string representation of the ROI.
         
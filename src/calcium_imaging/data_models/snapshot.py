@@ -0,0 +1,237 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from calcium_imaging.analysis import EVENT_COLUMNS
+from .coverslip import Coverslip
+from .group import Group
+from .roi import ROI
+
+SNAPSHOT_FORMAT_VERSION = 2
+SUPPORTED_SNAPSHOT_FORMAT_VERSIONS = (1, 2)  # version 1 has no deconvolution arrays
+ROI_INDEX_ATTRIBUTES = (
+    "onset_idx",
+    "peak_idx",
+    "influx_start_idx",
+    "influx_end_idx",
+    "eflux_start_idx",
+    "eflux_end_idx",
+    "baseline_return_idx",
+)
+EVENT_DTYPES = {col: np.int64 if col == "event" or col.endswith("_frame") else np.float64 for col in EVENT_COLUMNS}
+
+
+class ExperimentSnapshot(NamedTuple):
+    name: str
+    metadata: Dict[str, Any]
+    groups: List[Group]
+
+
+class Snapshot(NamedTuple):
+    research_name: str
+    research_metadata: Dict[str, Any]
+    experiments: List[ExperimentSnapshot]
+
+
+def save_snapshot(
+        path: Union[str, Path],
+        experiments: Sequence[Any],
+        research_name: str = "",
+        research_metadata: Optional[Dict[str, Any]] = None,
+        compress: bool = False
+) -> Path:
+    """
+    Saves the experiments' ROIs, with their current indexes, events and deconvolved activity, to a
+    single .npz file.
+
+    All traces are concatenated into one flat array (plus their times and frame labels), and every
+    ROI is one row of an index table of offsets, ids and indexes, so saving and restoring are a
+    handful of contiguous array copies rather than per-object serialization. Nothing is pickled.
+
+    Parameters
+    ----------
+    path : Union[str, Path]
+        Output file, the .npz suffix is added if missing.
+    experiments : Sequence[Experiment]
+        Experiments to save.
+    research_name : str
+        Name of the Research the experiments belong to, if any.
+    research_metadata : Dict[str, Any]
+        JSON serializable metadata of the Research.
+    compress : bool
+        Deflate the arrays, smaller files at the cost of slower saving and restoring.
+
+    Returns
+    -------
+    Path
+        The written file.
+    """
+    path = Path(path).with_suffix(".npz")
+    rois = [(experiment_position, roi) for experiment_position, experiment in enumerate(experiments)
+            for roi in experiment.iter_rois()]
+    for _, roi in rois:
+        if not roi.time.index.equals(roi.trace.index):
+            raise ValueError(f"{roi.title}: trace and time are not aligned, can't save a snapshot.")
+    lengths = np.array([len(roi.trace) for _, roi in rois], dtype=np.int64)
+    events = [(roi_position, roi.events) for roi_position, (_, roi) in enumerate(rois) if roi.events is not None]
+    events_counts = np.array([len(roi_events) for _, roi_events in events], dtype=np.int64)
+    deconvolved = [(roi_position, roi) for roi_position, (_, roi) in enumerate(rois) if roi.activity is not None]
+
+    def concat(arrays: List[np.ndarray], dtype: type) -> np.ndarray:
+        return np.concatenate(arrays).astype(dtype, copy=False) if len(arrays) > 0 else np.empty(0, dtype=dtype)
+
+    arrays = {
+        "format_version": np.array(SNAPSHOT_FORMAT_VERSION),
+        "research_name": np.array(research_name),
+        "research_metadata": np.array(json.dumps(research_metadata or {})),
+        "experiment_names": np.array([experiment.name for experiment in experiments], dtype=str),
+        "experiment_metadata": np.array([json.dumps(experiment.metadata) for experiment in experiments], dtype=str),
+        # index table, one row per ROI
+        "roi_experiment": np.array([experiment_position for experiment_position, _ in rois], dtype=np.int64),
+        "roi_group_type": np.array([roi.group_type for _, roi in rois], dtype=str),
+        "roi_coverslip_id": np.array([roi.coverslip_id for _, roi in rois], dtype=np.int64),
+        "roi_id": np.array([roi.roi_id for _, roi in rois], dtype=np.int64),
+        "roi_name": np.array([roi.name for _, roi in rois], dtype=str),
+        "roi_title": np.array([roi.title for _, roi in rois], dtype=str),
+        "roi_offset": np.cumsum(lengths) - lengths,
+        "roi_length": lengths,
+        **{f"roi_{attribute}": np.array([getattr(roi, attribute) for _, roi in rois], dtype=np.int64)
+           for attribute in ROI_INDEX_ATTRIBUTES},
+        # samples of all ROIs, back to back
+        "frames": concat([roi.trace.index.to_numpy() for _, roi in rois], np.int64),
+        "trace_values": concat([roi.trace.to_numpy() for _, roi in rois], np.float64),
+        "time_values": concat([roi.time.to_numpy() for _, roi in rois], np.float64),
+        # events of the ROIs that have them, back to back
+        "events_roi": np.array([roi_position for roi_position, _ in events], dtype=np.int64),
+        "events_count": events_counts,
+        **{f"events_{col}": concat([roi_events[col].to_numpy() for _, roi_events in events], dtype)
+           for col, dtype in EVENT_DTYPES.items()},
+        # activity and denoised trace of the deconvolved ROIs, back to back, aligned with their traces
+        "deconvolved_roi": np.array([roi_position for roi_position, _ in deconvolved], dtype=np.int64),
+        "activity_values": concat([roi.activity.to_numpy() for _, roi in deconvolved], np.float64),
+        "denoised_values": concat([roi.denoised_trace.to_numpy() for _, roi in deconvolved], np.float64),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    (np.savez_compressed if compress else np.savez)(path, **arrays)
+    return path
+
+
+def _restore_roi(
+        trace: pd.Series,
+        time: pd.Series,
+        roi_id: int,
+        coverslip_id: int,
+        group_type: str,
+        name: str,
+        title: str,
+        indexes: Dict[str, int]
+) -> ROI:
+    """ROI with saved indexes, bypassing `ROI.__init__` and thus the detection."""
+    roi = ROI.__new__(ROI)
+    roi.coverslip_id = coverslip_id
+    roi.roi_id = roi_id
+    roi.group_type = group_type
+    roi.name = name
+    roi.title = title
+    roi.time = time
+    roi.trace = trace
+    for attribute, value in indexes.items():
+        setattr(roi, attribute, value)
+    roi.events = None
+    roi.activity = None
+    roi.denoised_trace = None
+    return roi
+
+
+def _frame_index(frames: np.ndarray) -> pd.Index:
+    if len(frames) > 0 and frames[-1] - frames[0] == len(frames) - 1 and np.all(np.diff(frames) == 1):
+        return pd.RangeIndex(int(frames[0]), int(frames[-1]) + 1)
+    return pd.Index(frames)
+
+
+def _group_coverslips(coverslips: List[Coverslip]) -> List[Group]:
+    group_types = sorted(set(cs.group_type for cs in coverslips))
+    return [Group(coverslips=[cs for cs in coverslips if cs.group_type == group_type]) for group_type in group_types]
+
+
+def load_snapshot(path: Union[str, Path]) -> Snapshot:
+    """
+    Restores the experiments saved by `save_snapshot`, without re-running any detection.
+
+    Returns
+    -------
+    Snapshot
+        Research name and metadata, and every experiment's name, metadata and groups.
+    """
+    with np.load(Path(path), allow_pickle=False) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    if int(arrays["format_version"]) not in SUPPORTED_SNAPSHOT_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported snapshot format version {int(arrays['format_version'])} in '{path}'.")
+
+    roi_offsets = arrays["roi_offset"].tolist()
+    roi_lengths = arrays["roi_length"].tolist()
+    indexes = {attribute: arrays[f"roi_{attribute}"].tolist() for attribute in ROI_INDEX_ATTRIBUTES}
+    group_types = arrays["roi_group_type"].tolist()
+    coverslip_ids = arrays["roi_coverslip_id"].tolist()
+    roi_ids = arrays["roi_id"].tolist()
+    names = arrays["roi_name"].tolist()
+    titles = arrays["roi_title"].tolist()
+
+    rois = []
+    for roi_position, (offset, length) in enumerate(zip(roi_offsets, roi_lengths)):
+        samples = slice(offset, offset + length)
+        index = _frame_index(arrays["frames"][samples])
+        name = names[roi_position]
+        rois.append(_restore_roi(
+            trace=pd.Series(arrays["trace_values"][samples], index=index, name=name),
+            time=pd.Series(arrays["time_values"][samples], index=index, name=f"time_{name}"),
+            roi_id=roi_ids[roi_position],
+            coverslip_id=coverslip_ids[roi_position],
+            group_type=group_types[roi_position],
+            name=name,
+            title=titles[roi_position],
+            indexes={attribute: values[roi_position] for attribute, values in indexes.items()},
+        ))
+
+    events_counts = arrays["events_count"]
+    events_offsets = np.cumsum(events_counts) - events_counts
+    for roi_position, offset, count in zip(arrays["events_roi"].tolist(), events_offsets.tolist(), events_counts.tolist()):
+        rois[roi_position].events = pd.DataFrame({
+            col: arrays[f"events_{col}"][offset:offset + count] for col in EVENT_COLUMNS
+        })
+
+    offset = 0
+    for roi_position in arrays.get("deconvolved_roi", np.empty(0, dtype=np.int64)).tolist():
+        roi = rois[roi_position]
+        samples = slice(offset, offset + len(roi.trace))
+        roi.activity = pd.Series(arrays["activity_values"][samples], index=roi.trace.index, name=roi.name)
+        roi.denoised_trace = pd.Series(arrays["denoised_values"][samples], index=roi.trace.index, name=roi.name)
+        offset += len(roi.trace)
+
+    # ROIs -> coverslips -> groups, per experiment
+    coverslip_rois: Dict[Tuple[int, str, int], List[ROI]] = {}
+    for experiment_position, roi in zip(arrays["roi_experiment"].tolist(), rois):
+        coverslip_rois.setdefault((experiment_position, roi.group_type, roi.coverslip_id), []).append(roi)
+    experiment_coverslips: Dict[int, List[Coverslip]] = {}
+    for (experiment_position, group_type, coverslip_id), cs_rois in coverslip_rois.items():
+        coverslip = Coverslip(coverslip_id=coverslip_id, group_type=group_type, rois=cs_rois)
+        experiment_coverslips.setdefault(experiment_position, []).append(coverslip)
+
+    experiments = [
+        ExperimentSnapshot(
+            name=str(name),
+            metadata=json.loads(str(metadata)),
+            groups=_group_coverslips(experiment_coverslips.get(experiment_position, []))
+        )
+        for experiment_position, (name, metadata) in enumerate(
+            zip(arrays["experiment_names"], arrays["experiment_metadata"])
+        )
+    ]
+    return Snapshot(
+        research_name=str(arrays["research_name"]),
+        research_metadata=json.loads(str(arrays["research_metadata"])),
+        experiments=experiments
+    )
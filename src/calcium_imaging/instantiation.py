@@ -1,11 +1,17 @@
 from pathlib import Path
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Union
 
+import numpy as np
 import pandas as pd
 
 from .processing import Preprocessor, CoverslipInfo, extract_roi_id_from_col_name, extract_coverslip_info_from_filename_stem
 from .data_models import ROI, Coverslip, Group, Experiment
-from .io import load_vsi, validate_experiment_dir
+from .data_models.memory_usage import SERIES_OVERHEAD_NBYTES
+from .io import load_vsi, read_vsi_shape, validate_experiment_dir
+
+# per ROI bytes besides its trace and time values: the ROI object, its attributes and the pandas
+# containers of its two series (measured with tracemalloc, pandas 2.x)
+ROI_OVERHEAD_NBYTES = 1024 + 2 * SERIES_OVERHEAD_NBYTES
 
 
 def _instantiate_rois(coverslip_info: CoverslipInfo, processed_df: pd.DataFrame, time_col: str) -> List[ROI]:
@@ -21,6 +27,19 @@ def _instantiate_rois(coverslip_info: CoverslipInfo, processed_df: pd.DataFrame,
     ], key=lambda x: x.roi_id)
 
 
+def _instantiate_coverslip(coverslip_info: CoverslipInfo, processed_df: pd.DataFrame, time_col: str) -> Coverslip:
+    rois = _instantiate_rois(
+        coverslip_info=coverslip_info,
+        processed_df=processed_df,
+        time_col=time_col
+    )
+    return Coverslip(
+        coverslip_id=coverslip_info.coverslip_id,
+        group_type=coverslip_info.group_type,
+        rois=rois
+    )
+
+
 def _instantiate_coverslips(experiment_dir_path: Path, preprocessor: Preprocessor) -> List[Coverslip]:
     coverslips = []
     for coverslip_file_path in experiment_dir_path.iterdir():
@@ -29,16 +48,11 @@ def _instantiate_coverslips(experiment_dir_path: Path, preprocessor: Preprocesso
             processed_df = preprocessor.preprocess(df)
             coverslip_info = extract_coverslip_info_from_filename_stem(coverslip_file_path.stem)
             print(f"\ninstantiating {coverslip_file_path.stem}")
-            rois = _instantiate_rois(
+            coverslip = _instantiate_coverslip(
                 coverslip_info=coverslip_info,
                 processed_df=processed_df,
                 time_col=preprocessor.time_col_name
             )
-            coverslip = Coverslip(
-                coverslip_id=coverslip_info.coverslip_id,
-                group_type=coverslip_info.group_type,
-                rois=rois
-            )
             coverslips.append(coverslip)
         except ValueError:
             print(f"Error loading {coverslip_file_path.resolve()}, skipping.")
@@ -58,21 +72,75 @@ def _instantiate_groups(coverslips: List[Coverslip]) -> List[Group]:
     return groups
 
 
-def _instantiate_experiment(experiment_name: str, groups: List[Group]) -> Experiment:
+def _instantiate_experiment(
+        experiment_name: str,
+        groups: List[Group],
+        metadata: Optional[Dict[str, Any]] = None
+) -> Experiment:
     experiment = Experiment(
         name=experiment_name,
-        groups=groups
+        groups=groups,
+        metadata=metadata
     )
     return experiment
 
 
-def load_experiment(experiment_dir: Union[str, Path], preprocessor: Preprocessor) -> Experiment:
-    """Reads an experiment directory and parses it into an Experiment class object"""
+def _get_provenance_metadata(experiment_dir_path: Path, preprocessor: Preprocessor) -> Dict[str, Any]:
+    """Where and how an experiment was loaded, kept in `Experiment.metadata` and saved with its results."""
+    return {
+        "experiment_dir": str(experiment_dir_path.resolve()),
+        "preprocessor_settings": preprocessor.get_settings(),
+    }
+
+
+def _estimate_coverslip_nbytes(num_rows: int, num_cols: int, preprocessor: Preprocessor) -> int:
+    """RAM of a loaded coverslip from the shape of its raw df, see `estimate_experiment_nbytes`."""
+    num_non_roi_cols = 1 + (len(preprocessor.background_fluorescence_cols_names)
+                            if preprocessor.drop_background_fluorescence_cols else 0)
+    num_frames = max(num_rows - preprocessor.first_n_points_to_discard, 0)
+    num_rois = max(num_cols - num_non_roi_cols, 0)
+    return num_rois * (2 * num_frames * np.dtype(np.float64).itemsize + ROI_OVERHEAD_NBYTES)
+
+
+def estimate_experiment_nbytes(experiment_dir: Union[str, Path], preprocessor: Preprocessor) -> int:
+    """
+    Estimated RAM of the experiment `load_experiment` would return, from the coverslip file headers only
+    (see `read_vsi_shape`): frames left after the discarded ones, ROIs without the time and dropped
+    background columns, and per ROI a float64 trace and time vector plus ROI_OVERHEAD_NBYTES.
+    """
+    experiment_dir_path = validate_experiment_dir(experiment_dir)
+    nbytes = 0
+    for coverslip_file_path in experiment_dir_path.iterdir():
+        try:
+            num_rows, num_cols = read_vsi_shape(coverslip_file_path)
+        except ValueError:  # skipped by load_experiment as well
+            continue
+        nbytes += _estimate_coverslip_nbytes(num_rows, num_cols, preprocessor)
+    return nbytes
+
+
+def load_experiment(
+        experiment_dir: Union[str, Path],
+        preprocessor: Preprocessor,
+        memory_budget_mb: Optional[float] = None
+) -> Experiment:
+    """
+    Reads an experiment directory and parses it into an Experiment class object. With `memory_budget_mb`,
+    warns before loading if the experiment is estimated to exceed it (see `estimate_experiment_nbytes`).
+    """
     experiment_dir_path = validate_experiment_dir(experiment_dir)
+    if memory_budget_mb is not None:
+        estimated_mb = estimate_experiment_nbytes(experiment_dir_path, preprocessor) / 2 ** 20
+        if estimated_mb > memory_budget_mb:
+            print(
+                f"Warning: '{experiment_dir_path.stem}' is estimated to take {estimated_mb:.1f} MB once loaded, "
+                f"more than the {memory_budget_mb:g} MB budget. Consider `analyze_research_out_of_core`."
+            )
     coverslips = _instantiate_coverslips(experiment_dir_path, preprocessor)
     groups = _instantiate_groups(coverslips)
     experiment = _instantiate_experiment(
         experiment_name=experiment_dir_path.stem,
-        groups=groups
+        groups=groups,
+        metadata=_get_provenance_metadata(experiment_dir_path, preprocessor)
     )
     return experiment
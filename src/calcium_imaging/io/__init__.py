@@ -1,2 +1,3 @@
-from .load_vsi import load_vsi
+from .load_vsi import VsiHeader, load_vsi, read_vsi_header, read_vsi_shape
+from .results_database import RESULTS_DATABASE_FILE_NAME, ResultsDatabase
 from .validate_experiment_dir import validate_experiment_dir
@@ -1,17 +1,116 @@
 import os
+import struct
 from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import pandas as pd
-import xlrd
 
+_BIFF_EOF = 0x000A
+_BIFF_CONTINUE = 0x003C
+_BIFF_SST = 0x00FC
+_BIFF_LABELSST = 0x00FD
+_BIFF_DIMENSIONS = 0x0200
+_BIFF_BLANK = 0x0201
+_BIFF_MULBLANK = 0x00BE
+# records of a single cell or a run of cells, all starting with the row number
+_BIFF_CELL_RECORDS = {0x0006, 0x00BD, 0x00BE, 0x00FD, 0x0201, 0x0203, 0x0204, 0x0205, 0x027E}
 
-def _load_xls(xls_path: Path) -> pd.DataFrame:
-    wb = xlrd.open_workbook(xls_path, logfile=open(os.devnull, "w"))  # to supress OLE2 inconsistency warning
+
+class VsiHeader(NamedTuple):
+    num_frames: int  # rows below the header row, an upper bound if the file reserves empty rows
+    columns: List[str]  # header row, in column order
+
+
+def _load_xls(xls_path: Path, file_contents: Optional[bytes] = None) -> pd.DataFrame:
+    import xlrd  # imported on first use, only .xls parsing needs it
+
+    wb = xlrd.open_workbook(
+        xls_path,
+        file_contents=file_contents,
+        logfile=open(os.devnull, "w")  # to supress OLE2 inconsistency warning
+    )
     df = pd.read_excel(wb, engine="xlrd")
     return df
 
 
-def load_vsi(path: Path) -> pd.DataFrame:
+def _read_xls_header(xls_path: Path, file_contents: Optional[bytes] = None) -> Optional[VsiHeader]:
+    """
+    Header of the first sheet of a BIFF8 workbook without decoding its cells: record headers are
+    skipped over, and only the shared string table, the DIMENSIONS record and the cells of the first
+    row are read. None if the workbook isn't laid out as expected (e.g. older BIFF versions).
+    """
+    from xlrd import compdoc
+    from xlrd.book import unpack_SST_table
+
+    with open(os.devnull, "w") as logfile:
+        doc = compdoc.CompDoc(xls_path.read_bytes() if file_contents is None else file_contents, logfile=logfile)
+        stream, position, size = doc.locate_named_stream("Workbook")
+    if stream is None:
+        return None
+    end = position + size
+    sst_chunks: List[bytes] = []
+    num_rows = None
+    header_sst_indexes: Dict[int, int] = {}
+    in_first_sheet = False  # the globals substream ends with the first EOF, the first sheet follows
+    previous_code = None
+    while position + 4 <= end:
+        code, length = struct.unpack_from("<HH", stream, position)
+        data = stream[position + 4:position + 4 + length]
+        position += 4 + length
+        if not in_first_sheet:
+            if code == _BIFF_SST or (code == _BIFF_CONTINUE and previous_code in (_BIFF_SST, _BIFF_CONTINUE)):
+                sst_chunks.append(data)
+            elif code == _BIFF_EOF:
+                in_first_sheet = True
+            previous_code = code if code in (_BIFF_SST, _BIFF_CONTINUE) else None
+            continue
+        if code == _BIFF_DIMENSIONS and length >= 14:
+            num_rows = struct.unpack_from("<IIHH", data)[1]
+        elif code in _BIFF_CELL_RECORDS:
+            row = struct.unpack_from("<H", data)[0]
+            if row > 0:
+                break  # cells are stored row by row, the header row is complete
+            if code in (_BIFF_BLANK, _BIFF_MULBLANK):
+                continue  # formatted but empty, e.g. trailing columns pandas doesn't read
+            if code != _BIFF_LABELSST:
+                return None  # header cell of another type, let xlrd decode it
+            col, sst_index = struct.unpack_from("<H2xI", data, 2)
+            header_sst_indexes[col] = sst_index
+        elif code == _BIFF_EOF:
+            break
+    if num_rows is None or len(sst_chunks) == 0:
+        return None
+    num_strings = max(header_sst_indexes.values(), default=-1) + 1  # header strings only
+    strings, _ = unpack_SST_table(sst_chunks, num_strings)
+    columns = [strings[header_sst_indexes[col]] for col in sorted(header_sst_indexes)]
+    return VsiHeader(num_frames=max(num_rows - 1, 0), columns=columns)
+
+
+def read_vsi_header(path: Path, file_contents: Optional[bytes] = None) -> VsiHeader:
+    """
+    Frame count and column names of the df `load_vsi` would return, read from the file headers only
+    where the format allows (well under a ms whatever the size of the file), so files can be checked
+    and memory planned before loading. Otherwise the file is parsed.
+    """
+    if path.suffix == ".xls":
+        try:
+            header = _read_xls_header(path, file_contents)
+        except Exception:  # malformed header, parsing the file below raises the meaningful error
+            header = None
+        if header is not None:
+            return header
+    df = load_vsi(path, file_contents)
+    return VsiHeader(num_frames=len(df), columns=[str(col) for col in df.columns])
+
+
+def read_vsi_shape(path: Path) -> Tuple[int, int]:
+    """(n_frames, n_columns) of the df `load_vsi` would return, see `read_vsi_header`."""
+    header = read_vsi_header(path)
+    return header.num_frames, len(header.columns)
+
+
+def load_vsi(path: Path, file_contents: Optional[bytes] = None) -> pd.DataFrame:
+    """Parses a coverslip file, from `file_contents` if its bytes were already read (e.g. prefetched)."""
     if path.suffix == ".xls":
-        return _load_xls(path)
+        return _load_xls(path, file_contents)
     raise ValueError(f"Unsupported file type '{path.suffix}' for file '{path.resolve()}'")
@@ -0,0 +1,233 @@
+import contextlib
+import json
+import platform
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+RESULTS_DATABASE_FILE_NAME = "results.sqlite"
+KEY_COLUMNS = ("experiment_name", "group_type", "coverslip", "roi")
+_RUN_COLUMNS = ("created_at", "research_name")  # run columns added to the analysis rows by `query`
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    experiment_name TEXT NOT NULL,
+    research_name TEXT,
+    num_rois INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    provenance TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    experiment_name TEXT NOT NULL,
+    group_type TEXT NOT NULL,
+    coverslip INTEGER NOT NULL,
+    roi INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_experiment ON runs (experiment_name, run_id);
+CREATE INDEX IF NOT EXISTS analysis_run ON analysis (run_id);
+CREATE INDEX IF NOT EXISTS analysis_experiment ON analysis (experiment_name, group_type, coverslip, run_id);
+CREATE INDEX IF NOT EXISTS analysis_group ON analysis (group_type, run_id);
+"""
+
+
+def _sql_type(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_numeric_dtype(series):
+        return "REAL"
+    return "TEXT"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _package_version() -> str:
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+        return version("calcium_imaging")
+    except (ImportError, PackageNotFoundError):
+        return "unknown"
+
+
+class ResultsDatabase:
+    """
+    History of analysis results in a local SQLite file, for queries across runs and experiments.
+
+    Every save is a run: one row in `runs` with its time, settings and provenance, and one row per ROI
+    in `analysis` with the full analysis table's columns (new metric columns are added as they appear).
+    `analysis` is indexed on experiment, group, coverslip and run, so filtering the whole history is
+    an index lookup rather than re-reading spreadsheets.
+    """
+
+    def __init__(self, path: Union[str, Path] = RESULTS_DATABASE_FILE_NAME) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    def __repr__(self) -> str:
+        return f"ResultsDatabase('{self.path}')"
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:  # one transaction, rolled back on error
+                yield connection
+        finally:
+            connection.close()
+
+    def _get_analysis_columns(self, connection: sqlite3.Connection) -> List[str]:
+        return [row[1] for row in connection.execute("PRAGMA table_info(analysis)")]
+
+    def add_run(
+            self,
+            analysis_df: pd.DataFrame,
+            experiment_name: str,
+            settings: Optional[Dict[str, Any]] = None,
+            provenance: Optional[Dict[str, Any]] = None,
+            research_name: Optional[str] = None
+    ) -> int:
+        """
+        Appends one experiment's full analysis table as a new run.
+
+        Parameters
+        ----------
+        analysis_df : pd.DataFrame
+            One row per ROI, with the experiment_name, group_type, coverslip and roi columns, as returned
+            by `Experiment.get_full_analysis_df`.
+        experiment_name : str
+            Experiment the rows belong to.
+        settings : Optional[Dict[str, Any]]
+            JSON serializable settings of the run, e.g. the Preprocessor settings.
+        provenance : Optional[Dict[str, Any]]
+            JSON serializable notes, e.g. the raw data directory. The package and Python versions and
+            the host are added.
+        research_name : Optional[str]
+            Research the experiment was saved with, if any.
+
+        Returns
+        -------
+        int
+            The run id.
+        """
+        missing = [col for col in KEY_COLUMNS if col not in analysis_df.columns]
+        if missing:
+            raise ValueError(f"The analysis table has no {missing} columns.")
+        reserved = [col for col in _RUN_COLUMNS if col in analysis_df.columns]
+        if reserved:
+            raise ValueError(f"Analysis columns {reserved} are reserved for the run of each row.")
+        provenance = {
+            "package_version": _package_version(),
+            "python_version": sys.version.split()[0],
+            "host": platform.node(),
+            **(provenance or {}),
+        }
+        with self._connect() as connection:
+            run_id = connection.execute(
+                "INSERT INTO runs (created_at, experiment_name, research_name, num_rois, settings, provenance) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    experiment_name,
+                    research_name,
+                    len(analysis_df),
+                    json.dumps(settings or {}, default=str),
+                    json.dumps(provenance, default=str),
+                ),
+            ).lastrowid
+
+            existing_columns = set(self._get_analysis_columns(connection))
+            for col in analysis_df.columns:
+                if col not in existing_columns:
+                    connection.execute(f"ALTER TABLE analysis ADD COLUMN {_quote(col)} {_sql_type(analysis_df[col])}")
+
+            columns = ["run_id", *analysis_df.columns]
+            values = analysis_df.astype(object).where(analysis_df.notna(), None)
+            values = [
+                (run_id, *(v.item() if isinstance(v, np.generic) else v for v in row))
+                for row in values.itertuples(index=False, name=None)
+            ]
+            connection.executemany(
+                f"INSERT INTO analysis ({', '.join(map(_quote, columns))}) VALUES ({', '.join('?' * len(columns))})",
+                values,
+            )
+        return run_id
+
+    def get_runs(self) -> pd.DataFrame:
+        """One row per run, settings and provenance as JSON strings."""
+        with self._connect() as connection:
+            return pd.read_sql_query("SELECT * FROM runs ORDER BY run_id", connection)
+
+    def query(
+            self,
+            where: Optional[str] = None,
+            params: Sequence[Any] = (),
+            columns: Optional[Sequence[str]] = None,
+            latest_only: bool = True
+    ) -> pd.DataFrame:
+        """
+        Analysis rows across the whole history, with the time and research of their run.
+
+        Parameters
+        ----------
+        where : Optional[str]
+            SQL condition with ? placeholders, on the unqualified names of the result's columns: run_id,
+            the analysis columns (experiment_name, group_type, coverslip, roi and the metrics), created_at
+            and research_name, e.g. "group_type = ? AND created_at >= ?". Any column can be filtered on,
+            whether or not it's in `columns`.
+        params : Sequence[Any]
+            Values of the placeholders.
+        columns : Optional[Sequence[str]]
+            Analysis columns to return besides the keys, all by default.
+        latest_only : bool
+            Only the latest run of every experiment, so experiments saved several times aren't counted
+            twice. False returns every run.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per ROI and run.
+        """
+        with self._connect() as connection:
+            if columns is None:
+                selected = "*"
+            else:
+                available = set(self._get_analysis_columns(connection))
+                unknown = sorted(set(columns) - available)
+                if unknown:
+                    raise ValueError(f"Unknown analysis columns {unknown}, expected any of {sorted(available)}.")
+                keys = ["run_id", *KEY_COLUMNS]
+                selected = ", ".join(map(_quote, [*keys, *(c for c in columns if c not in keys), *_RUN_COLUMNS]))
+            # the join is a subquery with one column per name, so `where` needs no table prefixes
+            rows = (
+                f"SELECT analysis.*, {', '.join(f'runs.{col}' for col in _RUN_COLUMNS)} "
+                "FROM analysis JOIN runs ON runs.run_id = analysis.run_id"
+            )
+            if latest_only:
+                rows += (
+                    " WHERE analysis.run_id = (SELECT MAX(latest.run_id) FROM runs AS latest "
+                    "WHERE latest.experiment_name = analysis.experiment_name)"
+                )
+            sql = (
+                f"SELECT {selected} FROM ({rows}) AS rows"
+                + (f" WHERE ({where})" if where else "")
+                + " ORDER BY run_id, experiment_name, coverslip, roi"
+            )
+            return pd.read_sql_query(sql, connection, params=list(params))
+
+    def sql(self, query: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """Any read-only SQL over the `runs` and `analysis` tables."""
+        with self._connect() as connection:
+            return pd.read_sql_query(query, connection, params=list(params))
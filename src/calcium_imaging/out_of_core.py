@@ -0,0 +1,210 @@
+import contextlib
+import gc
+import io
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .analysis import TraceAccumulator
+from .data_models import Coverslip, Experiment
+from .instantiation import _instantiate_coverslip, _instantiate_groups
+from .io import load_vsi, validate_experiment_dir
+from .processing import Preprocessor, extract_coverslip_info_from_filename_stem
+
+FULL_ANALYSIS_FILE_NAME = "full_analysis.csv"
+EVENTS_FILE_NAME = "events.csv"
+SUMMARY_FILE_NAME = "summary.csv"
+MEAN_TRACES_FILE_NAME = "mean_traces.csv"
+SUMMARY_KEYS = ["experiment_name", "group_type"]
+NON_METRIC_COLUMNS = ["experiment_name", "group_type", "coverslip", "roi"]
+
+
+class OutOfCoreResult(NamedTuple):
+    full_analysis_path: Path
+    events_path: Optional[Path]  # None unless events were detected
+    summary: pd.DataFrame  # per (experiment, group, metric) count, mean, std, min and max
+    mean_trace_stats: pd.DataFrame  # per (experiment, group, frame) count, mean, std and SEM of the traces
+    num_rois: int
+    num_chunks: int
+    failed_files: List[str]
+
+
+class _RunningSummary:
+    """Per group count, mean, std, min and max of every metric, merged chunk by chunk (Chan et al.)."""
+
+    def __init__(self) -> None:
+        self._stats: Dict[Tuple[str, str, str], np.ndarray] = {}  # key -> [count, mean, M2, min, max]
+        self._coverslips: Dict[Tuple[str, str], set] = {}
+
+    def update(self, df: pd.DataFrame) -> None:
+        for key, coverslip_ids in df.groupby(SUMMARY_KEYS)["coverslip"].unique().items():
+            self._coverslips.setdefault(key, set()).update(coverslip_ids.tolist())
+        metric_columns = [col for col in df.columns if col not in NON_METRIC_COLUMNS]
+        long_df = df.melt(id_vars=SUMMARY_KEYS, value_vars=metric_columns, var_name="metric").dropna()
+        chunk_stats = long_df.groupby(SUMMARY_KEYS + ["metric"])["value"].agg(["count", "mean", "var", "min", "max"])
+        for key, (count, mean, var, min_value, max_value) in chunk_stats.iterrows():
+            m2 = (var if count > 1 else 0.0) * (count - 1)
+            if key not in self._stats:
+                self._stats[key] = np.array([count, mean, m2, min_value, max_value], dtype=float)
+                continue
+            n_a, mean_a, m2_a, min_a, max_a = self._stats[key]
+            n = n_a + count
+            delta = mean - mean_a
+            self._stats[key] = np.array([
+                n,
+                mean_a + delta * count / n,
+                m2_a + m2 + delta ** 2 * n_a * count / n,
+                min(min_a, min_value),
+                max(max_a, max_value),
+            ])
+
+    def to_df(self) -> pd.DataFrame:
+        records = []
+        for (experiment_name, group_type, metric), (count, mean, m2, min_value, max_value) in self._stats.items():
+            records.append({
+                "experiment_name": experiment_name,
+                "group_type": group_type,
+                "num_coverslips": len(self._coverslips[(experiment_name, group_type)]),
+                "metric": metric,
+                "count": int(count),
+                "mean": mean,
+                "std": np.sqrt(m2 / (count - 1)) if count > 1 else np.nan,
+                "min": min_value,
+                "max": max_value,
+            })
+        df = pd.DataFrame.from_records(records)
+        if len(df) > 0:
+            df = df.sort_values(by=["experiment_name", "group_type", "metric"]).reset_index(drop=True)
+        return df
+
+
+def _append_csv(df: pd.DataFrame, path: Path) -> None:
+    df.to_csv(path, mode="a", header=not path.exists(), index=False)
+
+
+def analyze_research_out_of_core(
+        experiment_dirs: Union[str, Path, List[Union[str, Path]]],
+        preprocessor: Preprocessor,
+        output_dir: Union[str, Path],
+        memory_budget_mb: float = 512,
+        include_kinetics: bool = False,
+        detect_events: bool = False,
+        verbose: bool = False
+) -> OutOfCoreResult:
+    """
+    Analyses any number of experiments with a bounded amount of traces in memory.
+
+    Coverslip files are loaded one at a time and collected into a chunk until the chunk's
+    `memory_usage()` reaches `memory_budget_mb`. The chunk is then analysed as one (partial) experiment with the batch
+    kernels, its rows are appended to the output tables on disk, the per group summary statistics
+    are merged with the ones of the previous chunks, and the chunk is released before the next one
+    is loaded. Peak memory is thus the budget plus one coverslip, whatever the size of the archive.
+    Per ROI results are independent of the other ROIs, so they are the same as with `load_experiment`.
+
+    Parameters
+    ----------
+    experiment_dirs : Union[str, Path, List[Union[str, Path]]]
+        One or more experiment directories, as passed to `load_experiment`.
+    preprocessor : Preprocessor
+        Preprocessing settings.
+    output_dir : Union[str, Path]
+        Tables are written to `full_analysis.csv`, `summary.csv`, `mean_traces.csv` (per group mean +- SEM
+        traces, see `TraceAccumulator`) and optionally `events.csv` in it, existing ones are overwritten.
+        Analysis and event rows are in processing order, not sorted.
+    memory_budget_mb : float
+        Bound on the coverslips held in memory at once.
+    include_kinetics : bool
+        Add the kinetic fits to the analysis table, see `Experiment.get_full_analysis_df`.
+    detect_events : bool
+        Also write the table of all transients, see `Experiment.detect_events`.
+    verbose : bool
+        Show the preprocessing and detection messages.
+
+    Returns
+    -------
+    OutOfCoreResult
+        Output paths, the summary table, and counts.
+    """
+    if not isinstance(experiment_dirs, list):
+        experiment_dirs = [experiment_dirs]
+    if memory_budget_mb <= 0:
+        raise ValueError(f"memory_budget_mb must be positive, got {memory_budget_mb}.")
+    memory_budget_bytes = memory_budget_mb * 2 ** 20
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    full_analysis_path = output_dir / FULL_ANALYSIS_FILE_NAME
+    events_path = output_dir / EVENTS_FILE_NAME if detect_events else None
+    for path in (full_analysis_path, events_path):
+        if path is not None and path.exists():
+            path.unlink()
+
+    summary = _RunningSummary()
+    trace_accumulators: Dict[Tuple[str, str], TraceAccumulator] = {}
+    num_rois = 0
+    num_chunks = 0
+    failed_files = []
+    stdout = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    def flush(experiment_name: str, chunk: List[Coverslip]) -> None:
+        nonlocal num_rois, num_chunks
+        with stdout:
+            experiment = Experiment(name=experiment_name, groups=_instantiate_groups(chunk))
+            analysis_df = experiment.get_full_analysis_df(include_kinetics=include_kinetics)
+            events_df = experiment.detect_events() if detect_events else None
+        _append_csv(analysis_df, full_analysis_path)
+        if events_df is not None:
+            _append_csv(events_df, events_path)
+        summary.update(analysis_df)
+        for group in experiment.groups:
+            group.accumulate_traces(trace_accumulators.setdefault((experiment_name, group.group_type), TraceAccumulator()))
+        num_rois += len(analysis_df)
+        num_chunks += 1
+        print(f"chunk {num_chunks}: {experiment_name}, {len(chunk)} coverslips, {len(analysis_df)} ROIs")
+
+    for experiment_dir_path in map(validate_experiment_dir, experiment_dirs):
+        chunk: List[Coverslip] = []
+        chunk_nbytes = 0
+        for coverslip_file_path in sorted(p for p in experiment_dir_path.iterdir() if p.is_file()):
+            try:
+                with stdout:
+                    coverslip = _instantiate_coverslip(
+                        coverslip_info=extract_coverslip_info_from_filename_stem(coverslip_file_path.stem),
+                        processed_df=preprocessor.preprocess(load_vsi(coverslip_file_path)),
+                        time_col=preprocessor.time_col_name
+                    )
+            except ValueError as e:
+                print(f"Error loading {coverslip_file_path.resolve()}: {e}, skipping.")
+                failed_files.append(str(coverslip_file_path))
+                continue
+            chunk.append(coverslip)
+            chunk_nbytes += coverslip.memory_usage().total
+            if chunk_nbytes >= memory_budget_bytes:
+                flush(experiment_dir_path.stem, chunk)
+                chunk, chunk_nbytes = [], 0
+                gc.collect()
+        if len(chunk) > 0:
+            flush(experiment_dir_path.stem, chunk)
+            chunk = []
+            gc.collect()
+
+    summary_df = summary.to_df()
+    summary_df.to_csv(output_dir / SUMMARY_FILE_NAME, index=False)
+    mean_trace_dfs = []
+    for (experiment_name, group_type), accumulator in sorted(trace_accumulators.items()):
+        df = accumulator.to_df().reset_index()
+        df.insert(0, "group_type", group_type)
+        df.insert(0, "experiment_name", experiment_name)
+        mean_trace_dfs.append(df)
+    mean_trace_stats = pd.concat(mean_trace_dfs, ignore_index=True) if mean_trace_dfs else pd.DataFrame()
+    mean_trace_stats.to_csv(output_dir / MEAN_TRACES_FILE_NAME, index=False)
+    return OutOfCoreResult(
+        full_analysis_path=full_analysis_path,
+        events_path=events_path,
+        summary=summary_df,
+        mean_trace_stats=mean_trace_stats,
+        num_rois=num_rois,
+        num_chunks=num_chunks,
+        failed_files=failed_files,
+    )
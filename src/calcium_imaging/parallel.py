@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+MAP_ROIS_CHUNKS_PER_WORKER = 4  # more chunks than workers, so uneven ROIs still balance
+
+
+def resolve_n_jobs(n_jobs: Optional[int] = None) -> int:
+    """
+    Translates an `n_jobs` argument into a concrete number of worker processes.
+
+    Parameters
+    ----------
+    n_jobs : Optional[int]
+        None or -1 for all available CPUs, a positive integer for an explicit count.
+
+    Returns
+    -------
+    int
+        Number of worker processes (at least 1).
+    """
+    cpu_count = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == -1:
+        return cpu_count
+    if n_jobs < 1:
+        raise ValueError(f"Illegal n_jobs={n_jobs}, expected a positive integer, -1 or None.")
+    return n_jobs
+
+
+def run_in_pool(func: Callable[..., Any], tasks: Sequence[tuple], n_jobs: Optional[int] = None) -> List[Any]:
+    """
+    Runs `func(*task)` for every task and returns the results in task order.
+
+    Tasks are executed in a process pool when more than one worker is requested and there is
+    more than one task, otherwise they run inline (no pool start-up cost).
+    `func` must be a module level function so it can be pickled.
+    """
+    n_workers = min(resolve_n_jobs(n_jobs), len(tasks))
+    if n_workers <= 1:
+        return [func(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+class RoiView(NamedTuple):
+    """
+    Read-only view of one ROI, as passed to the function of `map_rois`.
+
+    `frames`, `trace` and `time` are NumPy views into shared memory, not copies: the function
+    should return results computed from them (scalars, dicts, copies), never the views themselves.
+    """
+    group_type: str
+    coverslip_id: int
+    roi_id: int
+    onset_idx: int
+    peak_idx: int
+    eflux_start_idx: int
+    eflux_end_idx: int
+    baseline_return_idx: int
+    frames: np.ndarray  # frame index labels
+    trace: np.ndarray
+    time: np.ndarray
+
+    def get_trace(self) -> pd.Series:
+        """The trace as a Series indexed by frame, like `roi.trace`, e.g. for the `calcium_imaging.analysis` functions."""
+        return pd.Series(self.trace, index=self.frames, name=f"cs-{self.coverslip_id}_roi-{self.roi_id}")
+
+
+_ROI_METADATA_FIELDS = RoiView._fields[:-3]
+_ATTACHED_BLOCKS: Dict[str, SharedMemory] = {}  # worker side shared memory attachments, by name
+
+
+def _attach_samples(shm: SharedMemory, n_samples: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Frames, traces and times of all ROIs, back to back in one shared memory block."""
+    frames = np.ndarray((n_samples,), dtype=np.int64, buffer=shm.buf)
+    traces = np.ndarray((n_samples,), dtype=np.float64, buffer=shm.buf, offset=8 * n_samples)
+    times = np.ndarray((n_samples,), dtype=np.float64, buffer=shm.buf, offset=16 * n_samples)
+    return frames, traces, times
+
+
+def _map_rois_chunk(
+        func: Callable[[RoiView], Any],
+        samples: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        metadata: List[tuple],
+        offsets: List[int],
+        lengths: List[int]
+) -> List[Any]:
+    views = []
+    for array in samples:
+        view = array.view()
+        view.flags.writeable = False
+        views.append(view)
+    frames, traces, times = views
+    return [
+        func(RoiView(*roi_metadata, frames[o:o + n], traces[o:o + n], times[o:o + n]))
+        for roi_metadata, o, n in zip(metadata, offsets, lengths)
+    ]
+
+
+def _map_rois_shared_chunk(
+        func: Callable[[RoiView], Any],
+        shm_name: str,
+        n_samples: int,
+        metadata: List[tuple],
+        offsets: List[int],
+        lengths: List[int]
+) -> List[Any]:
+    """Worker side of `map_rois`: attaches to the shared samples (no copy) and maps a chunk of ROIs."""
+    # kept attached for the worker's lifetime: results are pickled back after this returns and may
+    # still reference the block, it is unmapped when the pool shuts the worker down
+    if shm_name not in _ATTACHED_BLOCKS:
+        _ATTACHED_BLOCKS[shm_name] = SharedMemory(name=shm_name)
+    return _map_rois_chunk(func, _attach_samples(_ATTACHED_BLOCKS[shm_name], n_samples), metadata, offsets, lengths)
+
+
+def map_rois(func: Callable[[RoiView], Any], rois: Iterable[Any], n_jobs: Optional[int] = None) -> List[Any]:
+    """
+    Runs `func(roi_view)` for every ROI and returns the results in ROI order.
+
+    The frames, traces and times of all ROIs are copied once into a single shared memory block,
+    and every worker process gets the block's name plus a chunk of ROI metadata instead of pickled
+    ROI objects, so each worker reads the traces in place. With one worker everything runs inline
+    on views of local arrays. `func` must be a module level function so it can be pickled.
+
+    Parameters
+    ----------
+    func : Callable[[RoiView], Any]
+        Per-ROI function, gets a `RoiView`.
+    rois : Iterable[ROI]
+        ROIs to map over.
+    n_jobs : Optional[int]
+        Number of worker processes, None or -1 for all CPUs.
+
+    Returns
+    -------
+    List[Any]
+        `func`'s result for every ROI.
+    """
+    rois = list(rois)
+    metadata = [tuple(getattr(roi, field) for field in _ROI_METADATA_FIELDS) for roi in rois]
+    lengths = [len(roi.trace) for roi in rois]
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int).tolist() if rois else []
+    n_samples = sum(lengths)
+    n_workers = min(resolve_n_jobs(n_jobs), len(rois))
+
+    def fill(frames: np.ndarray, traces: np.ndarray, times: np.ndarray) -> None:
+        for roi, o, n in zip(rois, offsets, lengths):
+            frames[o:o + n] = roi.trace.index.to_numpy()
+            traces[o:o + n] = roi.trace.to_numpy()
+            times[o:o + n] = roi.time.to_numpy()
+
+    if n_workers <= 1 or n_samples == 0:
+        samples = (np.empty(n_samples, dtype=np.int64), np.empty(n_samples), np.empty(n_samples))
+        fill(*samples)
+        return _map_rois_chunk(func, samples, metadata, offsets, lengths)
+
+    n_chunks = min(n_workers * MAP_ROIS_CHUNKS_PER_WORKER, len(rois))
+    bounds = np.linspace(0, len(rois), n_chunks + 1).astype(int)
+    shm = SharedMemory(create=True, size=24 * n_samples)
+    try:
+        samples = _attach_samples(shm, n_samples)
+        fill(*samples)
+        del samples
+        tasks = [
+            (func, shm.name, n_samples, metadata[start:end], offsets[start:end], lengths[start:end])
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        chunk_results = run_in_pool(_map_rois_shared_chunk, tasks, n_jobs=n_workers)
+    finally:
+        shm.close()
+        shm.unlink()
+    return [result for chunk in chunk_results for result in chunk]
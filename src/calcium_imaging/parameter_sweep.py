@@ -0,0 +1,122 @@
+import contextlib
+import io
+import itertools
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+
+from .data_models import Experiment, Group
+from .instantiation import _instantiate_coverslip
+from .io import load_vsi, validate_experiment_dir
+from .parallel import run_in_pool
+from .processing import Preprocessor, extract_coverslip_info_from_filename_stem
+
+
+def _expand_param_grid(param_grid: Dict[str, Sequence[Any]], base_preprocessor: Preprocessor) -> List[Dict[str, Any]]:
+    base_settings = base_preprocessor.get_settings()
+    unknown = sorted(set(param_grid) - set(base_settings))
+    if unknown:
+        raise ValueError(f"Unknown Preprocessor settings {unknown}, expected any of {sorted(base_settings)}.")
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def _sweep_coverslip(
+        experiment_name: str,
+        coverslip_file_path: Path,
+        preprocessors: List[Preprocessor],
+        verbose: bool
+) -> List[Optional[pd.DataFrame]]:
+    """Parses one coverslip file once and analyses it with every preprocessor, sharing common stages."""
+    stdout = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with stdout:
+        try:
+            df = load_vsi(coverslip_file_path)
+            coverslip_info = extract_coverslip_info_from_filename_stem(coverslip_file_path.stem)
+        except ValueError:
+            print(f"Error loading {coverslip_file_path.resolve()}, skipping.")
+            return [None for _ in preprocessors]
+
+        cache = {}
+        results = []
+        for preprocessor in preprocessors:
+            try:
+                coverslip = _instantiate_coverslip(
+                    coverslip_info=coverslip_info,
+                    processed_df=preprocessor.preprocess(df, cache=cache),
+                    time_col=preprocessor.time_col_name
+                )
+                experiment = Experiment(name=experiment_name, groups=[Group(coverslips=[coverslip])])
+                results.append(experiment.get_full_analysis_df())
+            except ValueError as e:
+                print(f"Error analysing {coverslip_file_path.stem} with {preprocessor.get_settings()}: {e}, skipping.")
+                results.append(None)
+    return results
+
+
+def sweep_preprocessor_settings(
+        experiment_dirs: Union[str, Path, List[Union[str, Path]]],
+        param_grid: Dict[str, Sequence[Any]],
+        base_preprocessor: Optional[Preprocessor] = None,
+        n_jobs: Optional[int] = None,
+        verbose: bool = False
+) -> pd.DataFrame:
+    """
+    Analyses the experiments with every combination of Preprocessor settings in `param_grid`.
+
+    Every raw coverslip file is parsed once. All settings are then run on it in the same worker,
+    sharing a cache of intermediate dfs keyed by `Preprocessor.get_stage_key`, so e.g. all settings
+    with the same discard and smoothing reuse that work and only redo the stages that differ.
+    Coverslip files are processed in parallel.
+
+    Parameters
+    ----------
+    experiment_dirs : Union[str, Path, List[Union[str, Path]]]
+        One or more experiment directories, as passed to `load_experiment`.
+    param_grid : Dict[str, Sequence[Any]]
+        Values to try per Preprocessor setting, e.g. {"smoothing_windows_size": [1, 2, 3]}.
+    base_preprocessor : Optional[Preprocessor]
+        Settings not in `param_grid` are taken from it, defaults to `Preprocessor()`.
+    n_jobs : Optional[int]
+        Number of worker processes, None or -1 for all CPUs.
+    verbose : bool
+        Show the preprocessing and detection messages of every setting.
+
+    Returns
+    -------
+    pd.DataFrame
+        Tidy table of the full analysis df of every setting: one row per (setting, ROI), with a
+        `setting_id` column and one column per swept setting.
+    """
+    if not isinstance(experiment_dirs, list):
+        experiment_dirs = [experiment_dirs]
+    if base_preprocessor is None:
+        base_preprocessor = Preprocessor()
+    settings = _expand_param_grid(param_grid, base_preprocessor)
+    preprocessors = [Preprocessor(**{**base_preprocessor.get_settings(), **overrides}) for overrides in settings]
+
+    tasks = [
+        (experiment_dir_path.stem, coverslip_file_path, preprocessors, verbose)
+        for experiment_dir_path in map(validate_experiment_dir, experiment_dirs)
+        for coverslip_file_path in sorted(experiment_dir_path.iterdir())
+    ]
+    results = run_in_pool(_sweep_coverslip, tasks, n_jobs=n_jobs)
+
+    dfs = []
+    for setting_id, overrides in enumerate(settings):
+        setting_dfs = [coverslip_results[setting_id] for coverslip_results in results]
+        setting_dfs = [setting_df for setting_df in setting_dfs if setting_df is not None]
+        if len(setting_dfs) == 0:
+            continue
+        setting_df = pd.concat(setting_dfs, ignore_index=True)
+        for name, value in reversed(list(overrides.items())):
+            setting_df.insert(0, name, [value] * len(setting_df))
+        setting_df.insert(0, "setting_id", setting_id)
+        dfs.append(setting_df)
+    if len(dfs) == 0:
+        raise RuntimeError("No coverslip could be analysed with any of the settings.")
+    df = pd.concat(dfs, ignore_index=True)
+    df = df.sort_values(by=["setting_id", "experiment_name", "group_type", "coverslip", "roi"], ascending=True)
+    df = df.reset_index(drop=True)
+    return df
@@ -1,3 +1,14 @@
+from .baseline import NORMALIZATION_METHODS, sliding_percentile_baseline
+from .detrending import (
+    DETRENDING_MIN_RECOVERY_FRAMES,
+    DETRENDING_MODELS,
+    BleachingTrends,
+    DetrendedTraces,
+    detect_recovery_rows,
+    detrend_traces,
+    fit_bleaching_trends,
+)
 from .extract_coverslip_info_from_filename import CoverslipInfo, extract_coverslip_info_from_filename_stem
 from .extract_roi_id_from_col_name import extract_roi_id_from_col_name
+from .filters import FILTER_METHODS, filter_traces
 from .preprocessor import Preprocessor
@@ -0,0 +1,47 @@
+import numpy as np
+
+from .filters import _fill_nan
+
+NORMALIZATION_METHODS = ("fixed_window", "sliding_percentile")
+
+
+def sliding_percentile_baseline(values: np.ndarray, window_size: int = 101, percentile: float = 10.0) -> np.ndarray:
+    """
+    Running low percentile of every column of a (n_frames, n_traces) matrix, over a centered window,
+    as an adaptive F0 that follows drift and isn't biased by early responses.
+
+    All columns are padded by half a window at both ends (edge values repeated), laid end to end and
+    filtered with a single 1D rank filter call, so windows never span two traces. scipy's 1D rank
+    filter (1.15+) keeps a sorted window updated sample by sample, O(n_frames log window_size) per
+    trace rather than re-sorting every window.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        (n_frames, n_traces) fluorescence. NaNs are bridged by linear interpolation.
+    window_size : int
+        Window in frames, should be several times longer than a response so the low percentile
+        stays on the baseline. Shrunk to the trace length if longer.
+    percentile : float
+        Percentile in [0, 100] of each window.
+
+    Returns
+    -------
+    np.ndarray
+        (n_frames, n_traces) F0.
+    """
+    from scipy.ndimage import percentile_filter  # imported on first use, scipy is slow to import
+
+    if not 0 <= percentile <= 100:
+        raise ValueError(f"Percentile must be in [0, 100], got {percentile}.")
+    if window_size < 1:
+        raise ValueError(f"Normalization window size must be at least 1, got {window_size}.")
+    values = np.asarray(values, dtype=float)
+    n_frames, n_traces = values.shape
+    if n_frames == 0 or n_traces == 0:
+        return values.copy()
+    window_size = min(window_size, n_frames)
+    half_window = window_size // 2
+    padded = np.pad(_fill_nan(values), ((half_window, half_window), (0, 0)), mode="edge")
+    filtered = percentile_filter(padded.T.ravel(), percentile, size=window_size, mode="nearest")
+    return filtered.reshape(n_traces, -1)[:, half_window:half_window + n_frames].T
@@ -0,0 +1,162 @@
+import warnings
+from typing import NamedTuple
+
+import numpy as np
+
+DETRENDING_MODELS = ("exponential", "polynomial")
+EXPONENTIAL_RATES = np.geomspace(0.05, 20, 64)  # candidate decay rates, per recording length
+DETRENDING_MIN_RECOVERY_FRAMES = 10  # post-recovery frames a trend needs, otherwise it's extrapolated from the pre-onset
+
+
+class BleachingTrends(NamedTuple):
+    trends: np.ndarray  # (n_frames, n_traces) fitted bleaching model, NaN where a trace couldn't be fitted
+    residual_std: np.ndarray  # (n_traces,) std of the baseline samples around the fit
+
+
+class DetrendedTraces(NamedTuple):
+    values: np.ndarray  # (n_frames, n_traces) corrected fluorescence
+    corrected: np.ndarray  # (n_traces,) False where the trace was left as is
+
+
+def _weighted_sums(weights: np.ndarray, values: np.ndarray, basis: np.ndarray) -> tuple:
+    """Per trace sums for the normal equations of all traces at once, basis is (n_frames, n_basis)."""
+    weighted_values = weights * values
+    return weights.T @ basis, weighted_values.T @ basis, weights.sum(axis=0), weighted_values.sum(axis=0)
+
+
+def _fit_exponential(t: np.ndarray, values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    a * exp(-k t) + c per trace. For a fixed rate k the model is linear in (a, c), so the 2 x 2 normal
+    equations of every (trace, candidate rate) pair are solved in closed form with a few matrix products,
+    and each trace keeps the rate with the smallest residual (variable projection on a rate grid).
+    """
+    basis = np.exp(-np.outer(t, EXPONENTIAL_RATES))  # (n_frames, n_rates)
+    sum_e, sum_ey, sum_1, sum_y = _weighted_sums(weights, values, basis)
+    sum_ee = weights.T @ basis ** 2
+    sum_yy = (weights * values ** 2).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        det = sum_ee * sum_1[:, None] - sum_e ** 2
+        a = (sum_ey * sum_1[:, None] - sum_e * sum_y[:, None]) / det
+        c = (sum_ee * sum_y[:, None] - sum_e * sum_ey) / det
+        sse = sum_yy[:, None] - a * sum_ey - c * sum_y[:, None]
+    sse = np.where(np.isfinite(sse) & (np.abs(det) > 1e-12), sse, np.inf)
+    best = np.argmin(sse, axis=1)
+    traces = np.arange(values.shape[1])
+    trends = a[traces, best] * basis[:, best] + c[traces, best]
+    return np.where(np.isfinite(sse[traces, best]), trends, np.nan)
+
+
+def _fit_polynomial(t: np.ndarray, values: np.ndarray, weights: np.ndarray, degree: int) -> np.ndarray:
+    """Least squares polynomial per trace, all (degree + 1) x (degree + 1) normal equations solved as one batch."""
+    basis = np.vander(t, degree + 1, increasing=True)  # (n_frames, degree + 1), t in [0, 1] keeps it well conditioned
+    n_basis = basis.shape[1]
+    gram = (weights.T @ (basis[:, :, None] * basis[:, None, :]).reshape(len(t), -1)).reshape(-1, n_basis, n_basis)
+    moments = (weights * values).T @ basis
+    coefficients = np.einsum("tij,tj->ti", np.linalg.pinv(gram), moments)
+    return basis @ coefficients.T
+
+
+def detect_recovery_rows(values: np.ndarray, pre_onset_mask: np.ndarray) -> np.ndarray:
+    """
+    (n_traces,) first row after every trace's response peak at which it's back at or below its pre-onset
+    mean, n_frames if it doesn't return within the recording. Later rows hold no response.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        (n_frames, n_traces) fluorescence.
+    pre_onset_mask : np.ndarray
+        (n_frames,) frames before the earliest onset.
+    """
+    values = np.asarray(values, dtype=float)
+    pre_onset_mask = np.asarray(pre_onset_mask, dtype=bool)
+    n_frames, n_traces = values.shape
+    if not np.any(pre_onset_mask) or np.all(pre_onset_mask):
+        return np.full(n_traces, n_frames)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN pre-onset columns have no baseline
+        baseline = np.nanmean(values[pre_onset_mask], axis=0)
+    response = np.where(pre_onset_mask[:, None] | np.isnan(values), -np.inf, values)
+    peak = np.argmax(response, axis=0)
+    rows = np.arange(n_frames)[:, None]
+    returned = (values <= baseline) & (rows > peak)
+    return np.where(returned.any(axis=0), returned.argmax(axis=0), n_frames)
+
+
+def fit_bleaching_trends(
+        frames: np.ndarray,
+        values: np.ndarray,
+        baseline_mask: np.ndarray,
+        model: str = "exponential",
+        degree: int = 2
+) -> BleachingTrends:
+    """
+    Fits a slow bleaching / drift model to the baseline frames of every trace, all traces in one batch.
+
+    Parameters
+    ----------
+    frames : np.ndarray
+        (n_frames,) frame index labels.
+    values : np.ndarray
+        (n_frames, n_traces) fluorescence, NaN samples are ignored.
+    baseline_mask : np.ndarray
+        (n_frames,) or (n_frames, n_traces) frames without a response to fit to, e.g. pre-onset and
+        post-recovery (see `detect_recovery_rows`).
+    model : str
+        'exponential' for a * exp(-k t) + c, or 'polynomial'.
+    degree : int
+        Polynomial degree.
+
+    Returns
+    -------
+    BleachingTrends
+        NamedTuple(trends, residual_std), trends evaluated on all frames.
+    """
+    if model not in DETRENDING_MODELS:
+        raise ValueError(f"Unknown detrending model '{model}', expected one of {DETRENDING_MODELS}.")
+    values = np.asarray(values, dtype=float)
+    frames = np.asarray(frames, dtype=float)
+    span = frames[-1] - frames[0] if len(frames) > 1 else 1.0
+    t = (frames - frames[0]) / span
+    baseline_mask = np.asarray(baseline_mask, dtype=bool)
+    baseline_mask = baseline_mask[:, None] if baseline_mask.ndim == 1 else baseline_mask
+    weights = (baseline_mask & ~np.isnan(values)).astype(float)
+    filled = np.where(weights > 0, values, 0.0)
+
+    n_parameters = 3 if model == "exponential" else degree + 1
+    if model == "exponential":
+        trends = _fit_exponential(t, filled, weights)
+    else:
+        trends = _fit_polynomial(t, filled, weights, degree)
+    trends[:, weights.sum(axis=0) < n_parameters + 1] = np.nan
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        residuals = np.where(weights > 0, filled - trends, 0.0)
+        residual_std = np.sqrt((residuals ** 2).sum(axis=0) / (weights.sum(axis=0) - n_parameters))
+    return BleachingTrends(trends=trends, residual_std=residual_std)
+
+
+def detrend_traces(
+        frames: np.ndarray,
+        values: np.ndarray,
+        baseline_mask: np.ndarray,
+        model: str = "exponential",
+        degree: int = 2
+) -> DetrendedTraces:
+    """
+    Divides every trace by its fitted bleaching trend, relative to the trend's value at the first frame,
+    so the multiplicative loss of signal is undone and later F0 normalization is unaffected.
+
+    Returns
+    -------
+    DetrendedTraces
+        NamedTuple(values, corrected). Traces whose trend couldn't be fitted, or isn't positive throughout,
+        are left as is. See `fit_bleaching_trends` for the parameters.
+    """
+    trends, _ = fit_bleaching_trends(frames, values, baseline_mask, model=model, degree=degree)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relative_trends = trends / trends[:1]
+    corrected = np.all(np.isfinite(relative_trends) & (relative_trends > 0), axis=0)
+    result = np.array(values, dtype=float, copy=True)
+    result[:, corrected] /= relative_trends[:, corrected]
+    return DetrendedTraces(values=result, corrected=corrected)
@@ -0,0 +1,128 @@
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+FILTER_METHODS = ("rolling_mean", "savgol", "butterworth", "median", "fft_gaussian")
+
+
+def _fill_nan(values: np.ndarray) -> np.ndarray:
+    """Linearly interpolates NaNs along axis 0 of every column (edges held), so filters don't spread them."""
+    nan_mask = np.isnan(values)
+    if not np.any(nan_mask):
+        return values
+    filled = values.copy()
+    rows = np.arange(len(values))
+    for col in np.flatnonzero(np.any(nan_mask, axis=0)):
+        valid = ~nan_mask[:, col]
+        if np.any(valid):
+            filled[:, col] = np.interp(rows, rows[valid], values[valid, col])
+    return filled
+
+
+def _odd(window_size: int) -> int:
+    return window_size if window_size % 2 == 1 else window_size + 1
+
+
+def _rolling_mean(values: np.ndarray, window_size: int) -> np.ndarray:
+    return pd.DataFrame(values).rolling(window=window_size, min_periods=1, center=True).mean().to_numpy()
+
+
+def _savgol(values: np.ndarray, window_size: int, polyorder: int = 2) -> np.ndarray:
+    from scipy.signal import savgol_filter  # imported on first use, scipy is slow to import
+
+    longest_window = len(values) if len(values) % 2 == 1 else len(values) - 1
+    window_length = min(_odd(max(window_size, polyorder + 1)), longest_window)
+    if window_length <= polyorder:
+        return values
+    return savgol_filter(values, window_length=window_length, polyorder=polyorder, axis=0, mode="interp")
+
+
+def _butterworth(values: np.ndarray, window_size: int, order: int = 4, cutoff: Optional[float] = None) -> np.ndarray:
+    from scipy.signal import butter, sosfiltfilt
+
+    # a moving average of `window_size` samples first reaches zero gain at 1 / window_size cycles per
+    # sample, i.e. 2 / window_size of the Nyquist frequency
+    cutoff = min(2.0 / window_size, 0.99) if cutoff is None else cutoff
+    if not 0 < cutoff < 1:
+        raise ValueError(f"Butterworth cutoff must be in (0, 1) of the Nyquist frequency, got {cutoff}.")
+    sos = butter(order, cutoff, btype="lowpass", output="sos")
+    padlen = min(3 * (2 * len(sos) + 1), len(values) - 1)
+    return sosfiltfilt(sos, values, axis=0, padlen=padlen)
+
+
+def _median(values: np.ndarray, window_size: int) -> np.ndarray:
+    from scipy.ndimage import median_filter
+
+    # columns padded and laid end to end for scipy's 1D median filter, which updates a sorted window
+    # sample by sample instead of re-sorting it (see sliding_percentile_baseline)
+    window_size = _odd(window_size)
+    half_window = window_size // 2
+    n_frames, n_traces = values.shape
+    padded = np.pad(values, ((half_window, half_window), (0, 0)), mode="edge")
+    filtered = median_filter(padded.T.ravel(), size=window_size, mode="nearest")
+    return filtered.reshape(n_traces, -1)[:, half_window:half_window + n_frames].T
+
+
+def _fft_gaussian(values: np.ndarray, window_size: int, sigma: Optional[float] = None) -> np.ndarray:
+    from scipy.signal import fftconvolve
+
+    sigma = window_size / 6 if sigma is None else sigma  # the window spans +- 3 sigma
+    half_width = max(int(np.ceil(3 * sigma)), 1)
+    kernel = np.exp(-0.5 * (np.arange(-half_width, half_width + 1) / max(sigma, 1e-12)) ** 2)
+    kernel /= kernel.sum()
+    padded = np.pad(values, ((half_width, half_width), (0, 0)), mode="reflect" if len(values) > half_width else "edge")
+    return fftconvolve(padded, kernel[:, None], mode="valid", axes=0)
+
+
+_FILTERS = {
+    "rolling_mean": _rolling_mean,
+    "savgol": _savgol,
+    "butterworth": _butterworth,
+    "median": _median,
+    "fft_gaussian": _fft_gaussian,
+}
+
+
+def filter_traces(values: np.ndarray, method: str = "rolling_mean", window_size: int = 2, **options: Any) -> np.ndarray:
+    """
+    Smooths every column of a (n_frames, n_traces) matrix along the frame axis, all columns in one call.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        (n_frames, n_traces) samples. NaNs are bridged by linear interpolation while filtering, so
+        they don't spread, and kept as NaN (the rolling mean fills them from their neighbors instead).
+    method : str
+        One of FILTER_METHODS:
+        'rolling_mean' - centered moving average, shrinking at the edges (the original smoothing);
+        'savgol' - Savitzky-Golay, preserves peak heights better than a moving average, options: polyorder=2;
+        'butterworth' - zero-phase (forward-backward) low-pass, no onset or peak shift, options: order=4,
+        cutoff (fraction of the Nyquist frequency, defaults to the moving average's first zero 2 / window_size);
+        'median' - moving median, removes single-frame spikes without blurring steps;
+        'fft_gaussian' - Gaussian smoothing by FFT convolution, for wide windows, options: sigma (frames,
+        defaults to window_size / 6).
+    window_size : int
+        Window in frames.
+    options
+        Method specific options, see above.
+
+    Returns
+    -------
+    np.ndarray
+        Filtered matrix of the same shape.
+    """
+    if method not in _FILTERS:
+        raise ValueError(f"Unknown smoothing method '{method}', expected one of {FILTER_METHODS}.")
+    if window_size < 1:
+        raise ValueError(f"Smoothing window size must be at least 1, got {window_size}.")
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        return filter_traces(values[:, None], method, window_size, **options)[:, 0]
+    if len(values) < 2 or values.shape[1] == 0:
+        return values.copy()
+    if method == "rolling_mean":
+        return _rolling_mean(values, window_size)  # already skips NaNs, and fills them from their neighbors
+    nan_mask = np.isnan(values)
+    filtered = _FILTERS[method](_fill_nan(values), window_size, **options)
+    return np.where(nan_mask, np.nan, filtered)
@@ -1,12 +1,33 @@
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from scipy.signal import find_peaks
 
+from .baseline import NORMALIZATION_METHODS, sliding_percentile_baseline
 from .constants import BACKGROUND_FLUORESCENCE_ROIS, TIME_COL
+from .detrending import DETRENDING_MIN_RECOVERY_FRAMES, detect_recovery_rows, detrend_traces
+from .filters import filter_traces
 
 
 class Preprocessor:
+    # preprocessing stages in order, with the settings each stage depends on
+    STAGES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+        ("discard", ("first_n_points_to_discard",)),
+        ("smoothen", ("smoothing_windows_size", "smoothing_method", "smoothing_options")),
+        ("subtract_background", ("background_fluorescence_cols_names", "drop_background_fluorescence_cols")),
+        ("detrend", (
+            "detrending_model", "detrending_polynomial_degree", "detrending_post_recovery_start_frame",
+            "earliest_onset_frame"
+        )),
+        ("normalize", (
+            "normalization_sampling_start_frame", "normalization_sampling_end_frame", "normalization_method",
+            "normalization_window_size", "normalization_percentile"
+        )),
+        ("detect_corrupted_peaks", (
+            "earliest_onset_frame", "earliest_baseline_recovery_frame", "drop_traces_with_corrupted_peak"
+        )),
+    )
+
     def __init__(
             self,
             first_n_points_to_discard: int = 5,
@@ -18,7 +39,15 @@ class Preprocessor:
             earliest_onset_frame: int = 50,
             earliest_baseline_recovery_frame: int = 90,
             drop_traces_with_corrupted_peak: bool = False,
-            drop_background_fluorescence_cols: bool = True
+            drop_background_fluorescence_cols: bool = True,
+            smoothing_method: str = "rolling_mean",
+            smoothing_options: Optional[Dict[str, Any]] = None,
+            detrending_model: Optional[str] = None,
+            detrending_polynomial_degree: int = 2,
+            detrending_post_recovery_start_frame: Optional[int] = None,
+            normalization_method: str = "fixed_window",
+            normalization_window_size: int = 101,
+            normalization_percentile: float = 10.0
     ) -> None:
         self.first_n_points_to_discard = first_n_points_to_discard
         self.smoothing_windows_size = smoothing_windows_size
@@ -30,20 +59,131 @@ class Preprocessor:
         self.earliest_baseline_recovery_frame = earliest_baseline_recovery_frame
         self.drop_traces_with_corrupted_peak = drop_traces_with_corrupted_peak
         self.drop_background_fluorescence_cols = drop_background_fluorescence_cols
+        self.smoothing_method = smoothing_method  # see `filter_traces` for the methods and their options
+        self.smoothing_options = {} if smoothing_options is None else dict(smoothing_options)
+        self.detrending_model = detrending_model  # None, 'exponential' or 'polynomial'
+        self.detrending_polynomial_degree = detrending_polynomial_degree
+        # None fits each trace from its own return to baseline, see `detect_recovery_rows`
+        self.detrending_post_recovery_start_frame = detrending_post_recovery_start_frame
+        self.normalization_method = normalization_method  # 'fixed_window' or 'sliding_percentile'
+        self.normalization_window_size = normalization_window_size
+        self.normalization_percentile = normalization_percentile
+
+    def get_settings(self) -> Dict[str, Any]:
+        """The constructor arguments of this preprocessor, `Preprocessor(**p.get_settings())` is an equivalent copy."""
+        return {
+            "first_n_points_to_discard": self.first_n_points_to_discard,
+            "smoothing_windows_size": self.smoothing_windows_size,
+            "time_col_name": self.time_col_name,
+            "background_fluorescence_cols_names": self.background_fluorescence_cols_names,
+            "normalization_sampling_start_frame": self.normalization_sampling_start_frame,
+            "normalization_sampling_end_frame": self.normalization_sampling_end_frame,
+            "earliest_onset_frame": self.earliest_onset_frame,
+            "earliest_baseline_recovery_frame": self.earliest_baseline_recovery_frame,
+            "drop_traces_with_corrupted_peak": self.drop_traces_with_corrupted_peak,
+            "drop_background_fluorescence_cols": self.drop_background_fluorescence_cols,
+            "smoothing_method": self.smoothing_method,
+            "smoothing_options": dict(self.smoothing_options),
+            "detrending_model": self.detrending_model,
+            "detrending_polynomial_degree": self.detrending_polynomial_degree,
+            "detrending_post_recovery_start_frame": self.detrending_post_recovery_start_frame,
+            "normalization_method": self.normalization_method,
+            "normalization_window_size": self.normalization_window_size,
+            "normalization_percentile": self.normalization_percentile,
+        }
+
+    def get_stage_key(self, stage_idx: int) -> tuple:
+        """
+        Hashable key of the settings of stages 0..stage_idx. Two preprocessors with the same key
+        produce the same intermediate df after that stage, so it can be shared between them.
+        """
+        settings = self.get_settings()
+
+        def hashable(value: Any) -> Any:
+            if isinstance(value, list):
+                return tuple(value)
+            if isinstance(value, dict):
+                return tuple(sorted(value.items()))
+            return value
 
-    def preprocess(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy(deep=True)
-        df = self.discard_first_n_points(df, n=self.first_n_points_to_discard)
-        df = self.smoothen(df, window_size=self.smoothing_windows_size)
-        df = self.subtract_baseline_fluorescence(df, self.background_fluorescence_cols_names)
-        if self.drop_background_fluorescence_cols:
-            df = df.drop(columns=self.background_fluorescence_cols_names)
-        df = self.normalize(
-            df=df,
-            sampling_start_frame=self.normalization_sampling_start_frame,
-            sampling_end_frame=self.normalization_sampling_end_frame
+        return tuple(
+            (name, hashable(settings[name]))
+            for _, names in self.STAGES[:stage_idx + 1]
+            for name in names
         )
-        df = self._detect_traces_with_corrupted_peak(df, drop=self.drop_traces_with_corrupted_peak)
+
+    def run_stage(self, stage: str, df: pd.DataFrame) -> pd.DataFrame:
+        if stage == "discard":
+            return self.discard_first_n_points(df, n=self.first_n_points_to_discard)
+        if stage == "smoothen":
+            return self.smoothen(
+                df,
+                window_size=self.smoothing_windows_size,
+                method=self.smoothing_method,
+                exclude_cols=[self.time_col_name],
+                **self.smoothing_options
+            )
+        if stage == "subtract_background":
+            df = self.subtract_baseline_fluorescence(df, self.background_fluorescence_cols_names)
+            if self.drop_background_fluorescence_cols:
+                df = df.drop(columns=self.background_fluorescence_cols_names)
+            return df
+        if stage == "detrend":
+            if self.detrending_model is None:
+                return df
+            return self.detrend(
+                df,
+                model=self.detrending_model,
+                degree=self.detrending_polynomial_degree,
+                pre_onset_end_frame=self.earliest_onset_frame,
+                post_recovery_start_frame=self.detrending_post_recovery_start_frame,
+                exclude_cols=[self.time_col_name, *self.background_fluorescence_cols_names],
+            )
+        if stage == "normalize":
+            return self.normalize(
+                df=df,
+                sampling_start_frame=self.normalization_sampling_start_frame,
+                sampling_end_frame=self.normalization_sampling_end_frame,
+                method=self.normalization_method,
+                window_size=self.normalization_window_size,
+                percentile=self.normalization_percentile,
+                exclude_cols=[self.time_col_name],
+            )
+        if stage == "detect_corrupted_peaks":
+            return self._detect_traces_with_corrupted_peak(df, drop=self.drop_traces_with_corrupted_peak)
+        raise ValueError(f"Unknown preprocessing stage '{stage}', expected one of {[s for s, _ in self.STAGES]}.")
+
+    def preprocess(self, df: pd.DataFrame, cache: Optional[Dict[tuple, pd.DataFrame]] = None) -> pd.DataFrame:
+        """
+        Runs all stages on a raw coverslip df.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Raw coverslip df, as returned by `load_vsi`.
+        cache : Optional[Dict[tuple, pd.DataFrame]]
+            Intermediate dfs by stage key, shared between preprocessors that run on the same raw df.
+            Preprocessing resumes from the longest cached prefix of stages and adds the stages it runs.
+            Cached dfs are shared, so they must not be modified in place.
+
+        Returns
+        -------
+        pd.DataFrame
+            Preprocessed df.
+        """
+        first_stage_idx = 0
+        if cache is not None:
+            for stage_idx in reversed(range(len(self.STAGES))):
+                key = self.get_stage_key(stage_idx)
+                if key in cache:
+                    df, first_stage_idx = cache[key], stage_idx + 1
+                    break
+        if first_stage_idx == 0:
+            df = df.copy(deep=True)
+        for stage_idx in range(first_stage_idx, len(self.STAGES)):
+            df = self.run_stage(self.STAGES[stage_idx][0], df)
+            if cache is not None:
+                cache[self.get_stage_key(stage_idx)] = df
         return df
 
     @staticmethod
@@ -51,13 +191,30 @@ class Preprocessor:
         return df.iloc[n:]
 
     @staticmethod
-    def smoothen(df: pd.DataFrame, window_size: int = 2) -> pd.DataFrame:
-        """Assuming df includes only cell ROIs (no dead / fluorescence background) ROIs or time cols"""
-        return df.rolling(
-            window=window_size,
-            min_periods=1,  # allow smaller windows at edges
-            center=True
-        ).mean()
+    def smoothen(
+            df: pd.DataFrame,
+            window_size: int = 2,
+            method: str = "rolling_mean",
+            exclude_cols: Optional[List[str]] = None,
+            **options: Any
+    ) -> pd.DataFrame:
+        """
+        Smooths all columns along the frame axis with one filter call on the whole coverslip matrix.
+
+        The default 'rolling_mean' is the original smoothing and, as before, applies to every column.
+        The other methods of `filter_traces` (e.g. 'savgol', 'butterworth', 'median', 'fft_gaussian')
+        leave `exclude_cols` (the time column) untouched.
+        """
+        if method == "rolling_mean":
+            return df.rolling(
+                window=window_size,
+                min_periods=1,  # allow smaller windows at edges
+                center=True
+            ).mean()
+        cols = [col for col in df.columns if col not in (exclude_cols or [])]
+        result_df = df.copy()
+        result_df[cols] = filter_traces(df[cols].to_numpy(dtype=float), method=method, window_size=window_size, **options)
+        return result_df
 
     @staticmethod
     def subtract_baseline_fluorescence(df: pd.DataFrame, background_roi_cols: List[str]) -> pd.DataFrame:
@@ -66,10 +223,83 @@ class Preprocessor:
         return result_df
 
     @staticmethod
-    def normalize(df: pd.DataFrame, sampling_start_frame: int = 1, sampling_end_frame: int = 35) -> pd.DataFrame:
-        """Assuming df includes only cell ROIs (no dead / fluorescence background) ROIs or time cols"""
+    def detrend(
+            df: pd.DataFrame,
+            model: str = "exponential",
+            degree: int = 2,
+            pre_onset_end_frame: int = 50,
+            post_recovery_start_frame: Optional[int] = None,
+            exclude_cols: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Removes slow photobleaching / drift before normalization, see `detrend_traces`.
+
+        The bleaching model is fitted to the frames before `pre_onset_end_frame` and after the response,
+        of every column but `exclude_cols`, all columns in one batch, and each column is divided by its
+        trend relative to its first frame. The response ends at `post_recovery_start_frame` (frame index
+        label) if given, otherwise where each column is back at its pre-onset mean after its peak (see
+        `detect_recovery_rows`), as responses often outlast any fixed frame. Columns with fewer than
+        DETRENDING_MIN_RECOVERY_FRAMES frames after their response are left as is, rather than fitted to
+        their response or extrapolated from the pre-onset frames.
+        """
+        cols = [col for col in df.columns if col not in (exclude_cols or [])]
+        frames = df.index.to_numpy()
+        values = df[cols].to_numpy(dtype=float)
+        pre_onset_mask = frames < pre_onset_end_frame
+        rows = np.arange(len(frames))[:, None]
+        if post_recovery_start_frame is None:
+            recovery_rows = detect_recovery_rows(values, pre_onset_mask)
+        else:
+            recovery_rows = np.full(len(cols), np.searchsorted(frames, post_recovery_start_frame))
+        post_recovery_mask = (rows >= recovery_rows) & ~pre_onset_mask[:, None]
+        recovered = post_recovery_mask.sum(axis=0) >= DETRENDING_MIN_RECOVERY_FRAMES
+
+        result_df = df.copy()
+        for col in np.asarray(cols)[~recovered]:
+            print(f"   warning {col}: fewer than {DETRENDING_MIN_RECOVERY_FRAMES} frames after the response, not detrended")
+        if not np.any(recovered):
+            return result_df
+        detrended = detrend_traces(
+            frames,
+            values[:, recovered],
+            pre_onset_mask[:, None] | post_recovery_mask[:, recovered],
+            model=model,
+            degree=degree,
+        )
+        for col in np.asarray(cols)[recovered][~detrended.corrected]:
+            print(f"   warning {col}: no positive {model} bleaching trend could be fitted, not detrended")
+        values[:, recovered] = detrended.values
+        result_df[cols] = values
+        return result_df
+
+    @staticmethod
+    def normalize(
+            df: pd.DataFrame,
+            sampling_start_frame: int = 1,
+            sampling_end_frame: int = 35,
+            method: str = "fixed_window",
+            window_size: int = 101,
+            percentile: float = 10.0,
+            exclude_cols: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Divides every column by its baseline fluorescence F0, so the baseline is at 1.
+
+        'fixed_window' (the original normalization) takes F0 as the mean of the rows
+        `sampling_start_frame`..`sampling_end_frame`, for all columns. 'sliding_percentile' takes F0
+        per frame as the running `percentile` over a centered window of `window_size` frames (see
+        `sliding_percentile_baseline`), which copes with early responses and drift, for all columns but
+        `exclude_cols`. Those (the time column) keep the fixed window, so time based metrics keep the
+        same units in both modes.
+        """
+        if method not in NORMALIZATION_METHODS:
+            raise ValueError(f"Unknown normalization method '{method}', expected one of {NORMALIZATION_METHODS}.")
         f0 = df.iloc[sampling_start_frame:sampling_end_frame].mean(axis=0)  # baseline fluorescence
         result_df = df.div(f0, axis=1)
+        if method == "sliding_percentile":
+            cols = [col for col in df.columns if col not in (exclude_cols or [])]
+            sliding_f0 = sliding_percentile_baseline(df[cols].to_numpy(dtype=float), window_size, percentile)
+            result_df[cols] = df[cols].to_numpy(dtype=float) / sliding_f0
         return result_df
 
     @staticmethod
@@ -154,6 +384,8 @@ class Preprocessor:
 
         smooth = trace.rolling(window=10, center=True, min_periods=1).mean()
         # peaks only in the pre-rise region
+        from scipy.signal import find_peaks  # imported on first use, scipy is slow to import
+
         peaks, _ = find_peaks(trace.iloc[:pre_window])
         mean_pre_peaks = trace.iloc[peaks].mean() if peaks.size else 0.0
 
@@ -181,6 +413,8 @@ class Preprocessor:
             return True
 
         pre_segment = trace.iloc[:start_index]
+        from scipy.signal import find_peaks
+
         peaks, _ = find_peaks(pre_segment)
 
         if peaks.size == 0:
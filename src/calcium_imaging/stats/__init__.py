@@ -0,0 +1,3 @@
+from .clustered_values import ClusteredValues, get_clustered_values
+from .hierarchical_bootstrap import bootstrap_distribution, hierarchical_bootstrap
+from .permutation_test import PermutationTestResult, pairwise_permutation_tests, permutation_test
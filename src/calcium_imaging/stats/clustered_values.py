@@ -0,0 +1,64 @@
+from typing import NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CLUSTER_COLS = ("experiment_name", "coverslip")
+
+
+class ClusteredValues(NamedTuple):
+    values: np.ndarray  # (n_clusters, max_cluster_size), NaN padded
+    sizes: np.ndarray  # (n_clusters,)
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.sizes)
+
+    @property
+    def n_values(self) -> int:
+        return int(self.sizes.sum())
+
+    @property
+    def sums(self) -> np.ndarray:
+        return np.nansum(self.values, axis=1)
+
+
+def get_clustered_values(
+        df: pd.DataFrame,
+        column: str,
+        cluster_cols: Sequence[str] = DEFAULT_CLUSTER_COLS
+) -> ClusteredValues:
+    """
+    Packs the values of `column` into a padded (cluster x value) matrix, one row per cluster.
+
+    ROIs are nested in coverslips, so a cluster is identified by `cluster_cols`
+    (coverslip ids are only unique within an experiment). NaN values are dropped.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Analysis table, e.g. the output of `Experiment.get_full_analysis_df()`.
+    column : str
+        The metric column to pack.
+    cluster_cols : Sequence[str]
+        Columns identifying a cluster.
+
+    Returns
+    -------
+    ClusteredValues
+        NamedTuple(values, sizes)
+    """
+    missing_cols = [col for col in [column, *cluster_cols] if col not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Analysis table is missing columns {missing_cols}.")
+    df = df.dropna(subset=[column])
+    if df.empty:
+        raise ValueError(f"No values to resample in column '{column}'.")
+    cluster_codes = df.groupby(list(cluster_cols), sort=True).ngroup().to_numpy()
+    sizes = np.bincount(cluster_codes)
+    order = np.argsort(cluster_codes, kind="stable")
+    sorted_codes = cluster_codes[order]
+    positions = np.arange(len(sorted_codes)) - np.concatenate([[0], np.cumsum(sizes)[:-1]])[sorted_codes]
+    values = np.full((len(sizes), sizes.max()), np.nan)
+    values[sorted_codes, positions] = df[column].to_numpy(dtype=float)[order]
+    return ClusteredValues(values=values, sizes=sizes)
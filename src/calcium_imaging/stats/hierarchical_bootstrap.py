@@ -0,0 +1,147 @@
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from calcium_imaging.parallel import resolve_n_jobs, run_in_pool
+from .clustered_values import DEFAULT_CLUSTER_COLS, ClusteredValues, get_clustered_values
+
+BOOTSTRAP_STATISTICS = ("mean", "median")
+MAX_RESAMPLED_VALUES_PER_CHUNK = 4_000_000  # bounds the (replicates x clusters x values) index matrices
+
+
+def _bootstrap_chunk(values: np.ndarray, sizes: np.ndarray, n_resamples: int, statistic: str, seed) -> np.ndarray:
+    """Resamples clusters, then values within every drawn cluster, for `n_resamples` replicates at once."""
+    rng = np.random.default_rng(seed)
+    n_clusters, max_size = values.shape
+    cluster_idx = rng.integers(0, n_clusters, size=(n_resamples, n_clusters))
+    drawn_sizes = sizes[cluster_idx]
+    value_idx = (rng.random((n_resamples, n_clusters, max_size)) * drawn_sizes[..., None]).astype(np.intp)
+    resampled = values[cluster_idx[..., None], value_idx]
+    valid = np.arange(max_size) < drawn_sizes[..., None]
+    if statistic == "mean":
+        return np.where(valid, resampled, 0.0).sum(axis=(1, 2)) / drawn_sizes.sum(axis=1)
+    resampled = np.where(valid, resampled, np.nan).reshape(n_resamples, -1)
+    return np.nanmedian(resampled, axis=1)
+
+
+def _calculate_statistic(clustered_values: ClusteredValues, statistic: str) -> float:
+    if statistic == "mean":
+        return float(np.nanmean(clustered_values.values))
+    return float(np.nanmedian(clustered_values.values))
+
+
+def _plan_bootstrap_chunks(
+        clustered_values: ClusteredValues,
+        n_resamples: int,
+        statistic: str,
+        n_workers: int,
+        random_state: Union[None, int, np.random.SeedSequence]
+) -> List[tuple]:
+    if statistic not in BOOTSTRAP_STATISTICS:
+        raise ValueError(f"Unsupported statistic '{statistic}', expected one of {BOOTSTRAP_STATISTICS}.")
+    max_chunk_size = max(1, MAX_RESAMPLED_VALUES_PER_CHUNK // clustered_values.values.size)
+    n_chunks = max(min(n_workers, n_resamples), int(np.ceil(n_resamples / max_chunk_size)))
+    chunk_sizes = np.diff(np.linspace(0, n_resamples, n_chunks + 1).astype(int))
+    if not isinstance(random_state, np.random.SeedSequence):
+        random_state = np.random.SeedSequence(random_state)
+    seeds = random_state.spawn(n_chunks)
+    return [
+        (clustered_values.values, clustered_values.sizes, int(chunk_size), statistic, seed)
+        for chunk_size, seed in zip(chunk_sizes, seeds)
+    ]
+
+
+def bootstrap_distribution(
+        clustered_values: ClusteredValues,
+        n_resamples: int = 10_000,
+        statistic: str = "mean",
+        n_jobs: Optional[int] = None,
+        random_state: Optional[int] = None
+) -> np.ndarray:
+    """
+    Draws the hierarchical bootstrap distribution of `statistic` for one group.
+
+    Every replicate resamples clusters (coverslips) with replacement and then resamples values
+    (ROIs) with replacement within each drawn cluster. Replicates are generated as index matrices
+    in chunks that are spread over a process pool.
+    """
+    n_workers = resolve_n_jobs(n_jobs)
+    tasks = _plan_bootstrap_chunks(clustered_values, n_resamples, statistic, n_workers, random_state)
+    return np.concatenate(run_in_pool(_bootstrap_chunk, tasks, n_jobs=n_workers))
+
+
+def hierarchical_bootstrap(
+        df: pd.DataFrame,
+        column: str,
+        group_col: str = "group_type",
+        cluster_cols: Sequence[str] = DEFAULT_CLUSTER_COLS,
+        n_resamples: int = 10_000,
+        statistic: str = "mean",
+        confidence_level: float = 0.95,
+        n_jobs: Optional[int] = None,
+        random_state: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Estimates a per-group confidence interval that respects the coverslip -> ROI nesting.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Analysis table, e.g. the output of `Experiment.get_full_analysis_df()`.
+    column : str
+        Any numeric column of the analysis table, e.g. 'eflux' or 'amplitude'.
+    group_col : str
+        Column that defines the groups to estimate separately.
+    cluster_cols : Sequence[str]
+        Columns identifying a coverslip.
+    n_resamples : int
+        Number of bootstrap replicates per group.
+    statistic : str
+        'mean' or 'median' of the pooled ROI values.
+    confidence_level : float
+        Coverage of the percentile interval.
+    n_jobs : Optional[int]
+        Worker processes, None for all CPUs.
+    random_state : Optional[int]
+        Seed for reproducible intervals.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group with the observed statistic, bootstrap standard error and interval bounds.
+    """
+    alpha = (1 - confidence_level) / 2
+    n_workers = resolve_n_jobs(n_jobs)
+    groups = sorted(df[group_col].dropna().unique())
+    seeds = np.random.SeedSequence(random_state).spawn(len(groups))
+    group_to_clustered_values = {
+        group: get_clustered_values(df[df[group_col] == group], column, cluster_cols)
+        for group in groups
+    }
+
+    # all groups share one pool, chunks are split back per group afterwards
+    tasks, group_n_chunks = [], []
+    for group, seed in zip(groups, seeds):
+        group_tasks = _plan_bootstrap_chunks(
+            group_to_clustered_values[group], n_resamples, statistic, n_workers, seed
+        )
+        tasks.extend(group_tasks)
+        group_n_chunks.append(len(group_tasks))
+    chunk_results = run_in_pool(_bootstrap_chunk, tasks, n_jobs=n_workers)
+    chunk_bounds = np.cumsum([0] + group_n_chunks)
+
+    records = []
+    for i, group in enumerate(groups):
+        clustered_values = group_to_clustered_values[group]
+        distribution = np.concatenate(chunk_results[chunk_bounds[i]:chunk_bounds[i + 1]])
+        records.append({
+            group_col: group,
+            "n_coverslips": clustered_values.n_clusters,
+            "n_rois": clustered_values.n_values,
+            statistic: _calculate_statistic(clustered_values, statistic),
+            "bootstrap_se": distribution.std(ddof=1),
+            "ci_low": np.quantile(distribution, alpha),
+            "ci_high": np.quantile(distribution, 1 - alpha),
+        })
+    return pd.DataFrame.from_records(records).set_index(group_col)
@@ -0,0 +1,171 @@
+from itertools import combinations
+from math import comb
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from calcium_imaging.parallel import resolve_n_jobs, run_in_pool
+from .clustered_values import DEFAULT_CLUSTER_COLS, get_clustered_values
+
+PERMUTATION_UNITS = ("coverslip", "roi")
+MAX_PERMUTED_LABELS_PER_CHUNK = 4_000_000  # bounds the (permutations x units) label matrices
+
+
+class PermutationTestResult(NamedTuple):
+    group_a: str
+    group_b: str
+    statistic: float  # mean(group_a) - mean(group_b)
+    p_value: float
+    n_permutations: int
+    exact: bool
+
+
+def _mean_differences(assignments: np.ndarray, sums: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """Difference of pooled means for every row of a boolean (permutation x unit) assignment matrix."""
+    assignments = assignments.astype(float)
+    sums_a, sizes_a = assignments @ sums, assignments @ sizes
+    return sums_a / sizes_a - (sums.sum() - sums_a) / (sizes.sum() - sizes_a)
+
+
+def _permutation_chunk(sums: np.ndarray, sizes: np.ndarray, n_a: int, n_permutations: int, seed) -> np.ndarray:
+    """Randomly relabels `n_a` of the units as group A, `n_permutations` times at once."""
+    rng = np.random.default_rng(seed)
+    assignments = rng.random((n_permutations, len(sums))).argsort(axis=1) < n_a
+    return _mean_differences(assignments, sums, sizes)
+
+
+def permutation_test(
+        df: pd.DataFrame,
+        column: str,
+        group_a: str,
+        group_b: str,
+        group_col: str = "group_type",
+        cluster_cols: Sequence[str] = DEFAULT_CLUSTER_COLS,
+        unit: str = "coverslip",
+        n_permutations: int = 10_000,
+        n_jobs: Optional[int] = None,
+        random_state: Optional[int] = None
+) -> PermutationTestResult:
+    """
+    Two-sided permutation test for the difference in mean `column` between two groups.
+
+    With unit='coverslip' whole coverslips are relabeled, which keeps their ROIs together and is the
+    valid null for nested data. When the number of distinct relabelings does not exceed
+    `n_permutations` they are all enumerated and the p-value is exact. With unit='roi' single ROIs are
+    relabeled, ignoring the nesting.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Analysis table, e.g. the output of `Experiment.get_full_analysis_df()`.
+    column : str
+        Any numeric column of the analysis table, e.g. 'eflux' or 'amplitude'.
+    group_a, group_b : str
+        Values of `group_col` to compare.
+    group_col : str
+        Column holding the group labels.
+    cluster_cols : Sequence[str]
+        Columns identifying a coverslip.
+    unit : str
+        'coverslip' or 'roi', the exchangeable unit under the null hypothesis.
+    n_permutations : int
+        Number of random relabelings (upper bound for exact enumeration).
+    n_jobs : Optional[int]
+        Worker processes, None for all CPUs.
+    random_state : Optional[int]
+        Seed for reproducible p-values.
+
+    Returns
+    -------
+    PermutationTestResult
+        NamedTuple(group_a, group_b, statistic, p_value, n_permutations, exact)
+    """
+    if unit not in PERMUTATION_UNITS:
+        raise ValueError(f"Unsupported unit '{unit}', expected one of {PERMUTATION_UNITS}.")
+    unit_cluster_cols = list(cluster_cols) if unit == "coverslip" else [*cluster_cols, "roi"]
+    clustered_a = get_clustered_values(df[df[group_col] == group_a], column, unit_cluster_cols)
+    clustered_b = get_clustered_values(df[df[group_col] == group_b], column, unit_cluster_cols)
+    sums = np.concatenate([clustered_a.sums, clustered_b.sums])
+    sizes = np.concatenate([clustered_a.sizes, clustered_b.sizes]).astype(float)
+    n_a, n_units = clustered_a.n_clusters, len(sums)
+    observed = float(_mean_differences(np.arange(n_units)[None, :] < n_a, sums, sizes)[0])
+
+    exact = comb(n_units, n_a) <= n_permutations
+    if exact:
+        assignments = np.zeros((comb(n_units, n_a), n_units), dtype=bool)
+        for i, units_a in enumerate(combinations(range(n_units), n_a)):
+            assignments[i, list(units_a)] = True
+        null_distribution = _mean_differences(assignments, sums, sizes)
+    else:
+        n_workers = resolve_n_jobs(n_jobs)
+        max_chunk_size = max(1, MAX_PERMUTED_LABELS_PER_CHUNK // n_units)
+        n_chunks = max(min(n_workers, n_permutations), int(np.ceil(n_permutations / max_chunk_size)))
+        chunk_sizes = np.diff(np.linspace(0, n_permutations, n_chunks + 1).astype(int))
+        seeds = np.random.SeedSequence(random_state).spawn(n_chunks)
+        tasks = [(sums, sizes, n_a, int(chunk_size), seed) for chunk_size, seed in zip(chunk_sizes, seeds)]
+        null_distribution = np.concatenate(run_in_pool(_permutation_chunk, tasks, n_jobs=n_workers))
+
+    tolerance = 1e-12 * max(1.0, abs(observed))
+    n_extreme = int(np.sum(np.abs(null_distribution) >= abs(observed) - tolerance))
+    if exact:  # the observed labeling is one of the enumerated ones
+        p_value = n_extreme / len(null_distribution)
+    else:
+        p_value = (n_extreme + 1) / (len(null_distribution) + 1)
+    return PermutationTestResult(
+        group_a=group_a,
+        group_b=group_b,
+        statistic=observed,
+        p_value=p_value,
+        n_permutations=len(null_distribution),
+        exact=exact,
+    )
+
+
+def pairwise_permutation_tests(
+        df: pd.DataFrame,
+        column: str,
+        group_col: str = "group_type",
+        cluster_cols: Sequence[str] = DEFAULT_CLUSTER_COLS,
+        unit: str = "coverslip",
+        n_permutations: int = 10_000,
+        n_jobs: Optional[int] = None,
+        random_state: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Runs `permutation_test` for every pair of groups and adds Holm-adjusted p-values.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per pair with the columns of `PermutationTestResult` and 'p_value_holm'.
+    """
+    groups = sorted(df[group_col].dropna().unique())
+    pairs = list(combinations(groups, 2))
+    seeds = np.random.SeedSequence(random_state).generate_state(max(len(pairs), 1))
+    results = [
+        permutation_test(
+            df,
+            column,
+            group_a=group_a,
+            group_b=group_b,
+            group_col=group_col,
+            cluster_cols=cluster_cols,
+            unit=unit,
+            n_permutations=n_permutations,
+            n_jobs=n_jobs,
+            random_state=int(seed)
+        )
+        for (group_a, group_b), seed in zip(pairs, seeds)
+    ]
+    results_df = pd.DataFrame(results, columns=PermutationTestResult._fields)
+    if results_df.empty:
+        results_df["p_value_holm"] = pd.Series(dtype=float)
+        return results_df
+
+    # Holm-Bonferroni step-down adjustment
+    order = np.argsort(results_df["p_value"].to_numpy())
+    n_tests = len(order)
+    adjusted = np.maximum.accumulate(results_df["p_value"].to_numpy()[order] * (n_tests - np.arange(n_tests)))
+    results_df.loc[results_df.index[order], "p_value_holm"] = np.minimum(adjusted, 1.0)
+    return results_df
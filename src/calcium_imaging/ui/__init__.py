@@ -1,2 +1,3 @@
 from .get_bool_input import get_bool_input
 from .get_int_input import get_int_input
+from .review_app import ReviewApp, run_review_app
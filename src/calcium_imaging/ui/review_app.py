@@ -0,0 +1,374 @@
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from calcium_imaging.data_models import Experiment, ROI
+
+REVIEW_ACTIONS = ("accept", "drop", "peak", "onset")
+
+_REVIEW_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>ROI review</title>
+<script src="/plotly.min.js"></script>
+<style>
+  body { font-family: sans-serif; margin: 12px; }
+  #status { font-size: 15px; margin-bottom: 4px; }
+  #help { color: #666; font-size: 13px; }
+  #plot { width: 100%; height: 75vh; }
+  .accepted { color: green; } .dropped { color: red; } .pending { color: #666; }
+</style>
+</head>
+<body>
+<div id="status"></div>
+<div id="plot"></div>
+<div id="help">
+  <b>a</b>/<b>Enter</b> accept &middot; <b>d</b> drop &middot; <b>p</b>/<b>o</b> set the peak/onset at the frame under the cursor
+  &middot; <b>&rarr;</b>/<b>&larr;</b> next/previous &middot; <b>s</b> save edits &middot; <b>q</b> save and finish
+</div>
+<script>
+const CONFIG = __CONFIG__;
+const cache = new Map();  // position -> Promise of the ROI payload, the next ROIs are prefetched into it
+let position = 0;
+let hoverFrame = null;
+let pending = [];  // edits not sent yet, written to the experiment in batches
+let finished = false;
+
+function fetchRoi(p) {
+  if (!cache.has(p)) {
+    cache.set(p, fetch(`/roi/${p}`).then(r => r.json()));
+  }
+  return cache.get(p);
+}
+
+function prefetch(p) {
+  for (let k = 1; k <= CONFIG.prefetch && p + k < CONFIG.n_rois; k++) {
+    fetchRoi(p + k);
+  }
+}
+
+function marker(roi, idx, color, name) {
+  const i = roi.frames.indexOf(idx);
+  return {x: [idx], y: [i >= 0 ? roi.trace[i] : null], mode: "markers", name: name,
+          marker: {size: 10, color: color}, opacity: 0.7};
+}
+
+function render(roi) {
+  const data = [
+    {x: roi.frames, y: roi.trace, mode: "lines", name: roi.name, line: {color: "blue"}},
+    marker(roi, roi.onset_idx, "green", "onset"),
+    marker(roi, roi.peak_idx, "red", "peak"),
+    marker(roi, roi.baseline_return_idx, "orange", "baseline return"),
+  ];
+  const layout = {title: roi.title, template: "plotly_white", hovermode: "x", xaxis: {title: "frame"},
+                  margin: {t: 40}, uirevision: roi.position};
+  Plotly.react("plot", data, layout);
+  document.getElementById("status").innerHTML =
+    `ROI ${roi.position + 1}/${CONFIG.n_rois} &middot; <span class="${roi.status}">${roi.status}</span>` +
+    ` &middot; onset ${roi.onset_idx}, peak ${roi.peak_idx} &middot; ${pending.length} unsaved edits` +
+    (finished ? " &middot; <b>review finished, edits saved</b>" : "");
+}
+
+async function show(p) {
+  position = Math.max(0, Math.min(CONFIG.n_rois - 1, p));
+  render(await fetchRoi(position));
+  prefetch(position);
+}
+
+async function edit(action, frame) {
+  const roi = await fetchRoi(position);
+  if (roi.status === "dropped" && roi.saved) {
+    return;
+  }
+  pending.push({position: roi.position, action: action, frame: frame});
+  // shown right away, the server's detections (e.g. the baseline return) are updated on save
+  if (action === "peak") roi.peak_idx = frame;
+  if (action === "onset") roi.onset_idx = frame;
+  if (action === "accept") roi.status = "accepted";
+  if (action === "drop") roi.status = "dropped";
+  if (pending.length >= CONFIG.batch_size) {
+    save();
+  }
+}
+
+async function save(url = "/edits") {
+  const edits = pending;
+  pending = [];
+  const response = await fetch(url, {method: "POST", body: JSON.stringify(edits)});
+  const result = await response.json();
+  for (const roi of result.rois) {
+    roi.saved = true;
+    cache.set(roi.position, Promise.resolve(roi));
+  }
+  for (const error of result.errors) {
+    console.warn(error);
+  }
+  render(await fetchRoi(position));
+}
+
+document.addEventListener("keydown", async (e) => {
+  if (finished) return;
+  switch (e.key) {
+    case "ArrowRight": case "n": show(position + 1); break;
+    case "ArrowLeft": case "b": show(position - 1); break;
+    case "a": case "Enter": await edit("accept"); show(position + 1); break;
+    case "d": await edit("drop"); show(position + 1); break;
+    case "p": if (hoverFrame !== null) { await edit("peak", hoverFrame); render(await fetchRoi(position)); } break;
+    case "o": if (hoverFrame !== null) { await edit("onset", hoverFrame); render(await fetchRoi(position)); } break;
+    case "s": save(); break;
+    case "q": finished = true; save("/finish"); break;
+  }
+});
+window.addEventListener("beforeunload", () => {
+  if (pending.length > 0) navigator.sendBeacon("/edits", JSON.stringify(pending));
+});
+
+const plot = document.getElementById("plot");
+show(0).then(() => {
+  plot.on("plotly_hover", (e) => { hoverFrame = e.points[0].x; });
+  plot.on("plotly_click", (e) => { hoverFrame = e.points[0].x; });
+});
+</script>
+</body>
+</html>
+"""
+
+
+def _is_int(value: Any) -> bool:
+    """JSON integers only, not booleans (which are ints in Python)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ReviewApp:
+    """
+    Local browser-based review of an experiment's ROIs.
+
+    The page is served from this process and draws the traces with plotly.js (the copy bundled with
+    plotly, no external services). Figures are drawn in the browser from the raw samples of the ROI,
+    and the next ROIs are fetched in the background while the current one is reviewed, so moving on
+    to the next ROI doesn't wait for rendering. Edits are collected in the browser and written to the
+    experiment in batches; ROIs dropped in a batch are removed with a single `Experiment.drop_rois`.
+    """
+
+    def __init__(self, experiment: "Experiment", prefetch: int = 5, batch_size: int = 10) -> None:
+        if experiment.num_rois == 0:
+            raise ValueError(f"'{experiment.name}' has no ROIs to review.")
+        self.experiment = experiment
+        self.prefetch = prefetch
+        self.batch_size = batch_size
+        self.rois: List["ROI"] = list(experiment.iter_rois())  # fixed review order, dropped ROIs keep their position
+        self.statuses = ["pending"] * len(self.rois)
+        self._dropped = [False] * len(self.rois)
+        self._lock = threading.Lock()
+
+    def _roi_payload(self, position: int) -> Dict[str, Any]:
+        roi = self.rois[position]
+        values = roi.trace.to_numpy(dtype=float)
+        return {
+            "position": position,
+            "name": roi.name,
+            "title": roi.title,
+            "frames": roi.trace.index.tolist(),
+            "trace": np.where(np.isnan(values), None, values).tolist(),
+            "onset_idx": int(roi.onset_idx),
+            "peak_idx": int(roi.peak_idx),
+            "baseline_return_idx": int(roi.baseline_return_idx),
+            "status": self.statuses[position],
+        }
+
+    def get_roi(self, position: int) -> Dict[str, Any]:
+        if not 0 <= position < len(self.rois):
+            raise ValueError(f"ROI position {position} is out of range [0, {len(self.rois)}).")
+        with self._lock:
+            return self._roi_payload(position)
+
+    def apply_edits(self, edits: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Writes a batch of edits to the experiment, in order, so the last edit of a ROI wins.
+
+        Parameters
+        ----------
+        edits : List[Dict[str, Any]]
+            {"position", "action", "frame"} records, the action one of REVIEW_ACTIONS and the frame
+            (the new index) only for 'peak' and 'onset'.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The updated payloads of the edited ROIs, and a message per rejected edit.
+        """
+        errors = []
+        edited = set()
+        with self._lock:
+            for edit in edits:
+                if not isinstance(edit, dict):
+                    errors.append(f"Invalid edit {edit!r}, expected an object.")
+                    continue
+                position, action, frame = edit.get("position"), edit.get("action"), edit.get("frame")
+                if not _is_int(position) or not 0 <= position < len(self.rois):
+                    errors.append(f"Invalid ROI position {position}.")
+                    continue
+                roi = self.rois[position]
+                if self._dropped[position]:
+                    errors.append(f"{roi.title} was already dropped.")
+                    continue
+                if action in ("peak", "onset") and (not _is_int(frame) or frame not in roi.trace.index):
+                    errors.append(f"{roi.title}: frame {frame} is not in the trace.")
+                    continue
+                if action == "peak":
+                    roi.set_peak_idx(int(frame))
+                elif action == "onset":
+                    roi.set_onset_idx(int(frame))
+                elif action == "accept":
+                    self.statuses[position] = "accepted"
+                elif action == "drop":
+                    self.statuses[position] = "dropped"
+                else:
+                    errors.append(f"Unknown action '{action}', expected one of {REVIEW_ACTIONS}.")
+                    continue
+                edited.add(position)
+
+            to_drop = {id(self.rois[p]) for p in edited if self.statuses[p] == "dropped"}
+            if len(to_drop) > 0:
+                self.experiment.drop_rois(np.array([id(roi) in to_drop for roi in self.experiment.iter_rois()]))
+                for position in edited:
+                    self._dropped[position] = self._dropped[position] or id(self.rois[position]) in to_drop
+            return {"rois": [self._roi_payload(position) for position in sorted(edited)], "errors": errors}
+
+    def get_review_df(self) -> pd.DataFrame:
+        """One row per reviewed ROI with its status and current onset and peak frames."""
+        with self._lock:
+            return pd.DataFrame({
+                "group_type": [roi.group_type for roi in self.rois],
+                "coverslip": [roi.coverslip_id for roi in self.rois],
+                "roi": [roi.roi_id for roi in self.rois],
+                "status": self.statuses,
+                "onset_frame": [roi.onset_idx for roi in self.rois],
+                "peak_frame": [roi.peak_idx for roi in self.rois],
+            })
+
+    def _page(self) -> bytes:
+        config = {"n_rois": len(self.rois), "prefetch": self.prefetch, "batch_size": self.batch_size}
+        return _REVIEW_PAGE.replace("__CONFIG__", json.dumps(config)).encode()
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0, open_browser: bool = True) -> pd.DataFrame:
+        """
+        Serves the review page until it is finished with 'q' (or the process is interrupted).
+
+        Returns
+        -------
+        pd.DataFrame
+            See `get_review_df`.
+        """
+        # imported on first use, a review app isn't needed to import the package
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import webbrowser
+        from plotly.offline import get_plotlyjs
+
+        app = self
+        plotly_js = get_plotlyjs().encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body: bytes, content_type: str, status: int = 200) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, obj: Any, status: int = 200) -> None:
+                self._send(json.dumps(obj).encode(), "application/json", status)
+
+            def do_GET(self) -> None:
+                if self.path == "/":
+                    self._send(app._page(), "text/html; charset=utf-8")
+                elif self.path == "/plotly.min.js":
+                    self._send(plotly_js, "application/javascript")
+                elif self.path.startswith("/roi/"):
+                    try:
+                        self._send_json(app.get_roi(int(self.path[len("/roi/"):])))
+                    except ValueError as e:
+                        self._send_json({"error": str(e)}, status=404)
+                else:
+                    self._send_json({"error": f"Unknown path '{self.path}'."}, status=404)
+
+            def do_POST(self) -> None:
+                if self.path not in ("/edits", "/finish"):
+                    self._send_json({"error": f"Unknown path '{self.path}'."}, status=404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    edits = json.loads(body or b"[]")
+                except json.JSONDecodeError as e:
+                    self._send_json({"error": f"Invalid edits: {e}"}, status=400)
+                    return
+                if not isinstance(edits, list):
+                    self._send_json({"error": "Invalid edits: expected a list of edits."}, status=400)
+                    return
+                self._send_json(app.apply_edits(edits))
+                if self.path == "/finish":
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        url = f"http://{host}:{server.server_address[1]}/"
+        print(f"Reviewing {len(self.rois)} ROIs of '{self.experiment.name}' at {url}, press q on the page to finish")
+        if open_browser:
+            webbrowser.open(url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        review_df = self.get_review_df()
+        counts = review_df["status"].value_counts()
+        print(f"Review finished: {counts.get('accepted', 0)} accepted, {counts.get('dropped', 0)} dropped, "
+              f"{counts.get('pending', 0)} not reviewed")
+        return review_df
+
+
+def run_review_app(
+        experiment: "Experiment",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prefetch: int = 5,
+        batch_size: int = 10,
+        open_browser: bool = True
+) -> pd.DataFrame:
+    """
+    Reviews the experiment's ROIs in the browser, see `ReviewApp`.
+
+    Parameters
+    ----------
+    experiment : Experiment
+        Experiment to review, edited in place.
+    host : str
+        Interface to serve on, local only by default.
+    port : int
+        Port to serve on, 0 picks a free one.
+    prefetch : int
+        Number of ROIs ahead of the current one fetched in the background.
+    batch_size : int
+        Number of edits sent to the experiment at once. Unsent edits are also sent with 's', 'q',
+        and when the page is closed.
+    open_browser : bool
+        Open the page in the default browser.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per ROI with its review status ('accepted', 'dropped' or 'pending') and final onset
+        and peak frames.
+    """
+    return ReviewApp(experiment, prefetch=prefetch, batch_size=batch_size).serve(
+        host=host, port=port, open_browser=open_browser
+    )
@@ -1,2 +1,3 @@
+from .create_heatmap_figure import HeatmapPanel, create_heatmap_figure
 from .create_trace_figure import create_traces_figure
 from .plotly_color_iterator import get_n_colors_from_palette
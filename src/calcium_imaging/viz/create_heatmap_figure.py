@@ -0,0 +1,119 @@
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+MAX_LABELED_ROWS = 60  # ROI names are shown on the y axis only up to this many rows per panel
+
+
+class HeatmapPanel(NamedTuple):
+    title: str
+    frames: np.ndarray  # (n_frames,) x axis
+    traces: np.ndarray  # (n_frames, n_rois) fluorescence, columns in display order (top row first)
+    row_labels: List[str]  # (n_rois,) unique ROI names
+    onset_frames: Optional[np.ndarray] = None  # (n_rois,) drawn as one marker trace
+    peak_frames: Optional[np.ndarray] = None  # (n_rois,) drawn as one marker trace
+
+
+def create_heatmap_figure(
+        panels: Sequence[HeatmapPanel],
+        title: Optional[str] = None,
+        xaxis_title: Optional[str] = "Frame",
+        colorbar_title: Optional[str] = "F",
+        zrange: Optional[Tuple[float, float]] = None,
+        colorscale: str = "Viridis"
+) -> "go.Figure":
+    """
+    Raster of ROIs x frames, one heatmap image per panel stacked on a shared frame axis.
+
+    Each panel is a single image trace whatever its number of ROIs, and the onsets and peaks of all
+    its ROIs are one marker trace each, so the figure stays cheap to build and to render for
+    thousands of ROIs, where line overlays don't.
+
+    Parameters
+    ----------
+    panels : Sequence[HeatmapPanel]
+        One panel per facet (e.g. group), rows in the order given.
+    title : Optional[str]
+        Figure title.
+    xaxis_title : Optional[str]
+        Title of the shared frame axis.
+    colorbar_title : Optional[str]
+        Title of the shared color bar.
+    zrange : Optional[Tuple[float, float]]
+        Color range, defaults to the 1st to 99th percentile of all values so single outliers don't
+        wash out the image.
+    colorscale : str
+        Plotly color scale name.
+
+    Returns
+    -------
+    go.Figure
+    """
+    import plotly.graph_objects as go  # imported on first use, plotly is slow to import
+    from plotly.subplots import make_subplots
+
+    if len(panels) == 0:
+        raise ValueError("No panels to draw.")
+    n_rows = [max(panel.traces.shape[1], 1) for panel in panels]
+    if zrange is None:
+        values = np.concatenate([panel.traces.ravel() for panel in panels])
+        values = values[~np.isnan(values)]
+        zrange = tuple(np.percentile(values, [1, 99])) if len(values) > 0 else (0.0, 1.0)
+
+    fig = make_subplots(
+        rows=len(panels),
+        cols=1,
+        shared_xaxes=True,
+        row_heights=[n / sum(n_rows) for n in n_rows],
+        vertical_spacing=min(0.03, 0.3 / len(panels)),
+        subplot_titles=[panel.title for panel in panels],
+    )
+    for row, panel in enumerate(panels, start=1):
+        fig.add_trace(
+            go.Heatmap(
+                x=panel.frames,
+                y=panel.row_labels,
+                z=panel.traces.T,
+                coloraxis="coloraxis",
+                hovertemplate="%{y}<br>frame %{x}<br>F %{z:.3f}<extra></extra>",
+            ),
+            row=row,
+            col=1,
+        )
+        for frames, color, name in ((panel.onset_frames, "white", "onset"), (panel.peak_frames, "red", "peak")):
+            if frames is None:
+                continue
+            fig.add_trace(
+                go.Scatter(
+                    x=frames,
+                    y=panel.row_labels,
+                    mode="markers",
+                    marker=dict(size=4, color=color, line=dict(width=0.5, color="black")),
+                    name=name,
+                    legendgroup=name,
+                    showlegend=row == 1,
+                    hovertemplate=f"%{{y}}<br>{name} %{{x}}<extra></extra>",
+                ),
+                row=row,
+                col=1,
+            )
+        fig.update_yaxes(
+            autorange="reversed",
+            showticklabels=len(panel.row_labels) <= MAX_LABELED_ROWS,
+            tickfont=dict(size=8),
+            row=row,
+            col=1,
+        )
+
+    fig.update_xaxes(title_text=xaxis_title, row=len(panels), col=1)
+    fig.update_layout(
+        title=title,
+        template="plotly_white",
+        coloraxis=dict(colorscale=colorscale, cmin=zrange[0], cmax=zrange[1], colorbar=dict(title=colorbar_title)),
+        height=max(400, min(200 * len(panels) + sum(n_rows), 3000)),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+    )
+    return fig
@@ -1,11 +1,13 @@
 from typing import List
-from typing import Optional, Tuple, Iterable
+from typing import TYPE_CHECKING, Optional, Tuple, Iterable
 
 import pandas as pd
-import plotly.graph_objects as go
 
 from calcium_imaging.analysis import RegressionCoefficients1D
 
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
 
 def create_traces_figure(
         main_trace: pd.Series,
@@ -23,7 +25,9 @@ def create_traces_figure(
         influx_linear_coefficients: Optional[RegressionCoefficients1D] = None,
         yaxis_range: Optional[Tuple[float, float]] = (0.5, 2),
         traces_color: Optional[str] = "blue"
-) -> go.Figure:
+) -> "go.Figure":
+    import plotly.graph_objects as go  # imported on first use, plotly is slow to import
+
     # --- base trace ---
     fig = go.Figure()
 
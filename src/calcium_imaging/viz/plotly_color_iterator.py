@@ -1,8 +1,6 @@
 import itertools
 from typing import List
 
-import plotly.express as px
-
 
 def _get_color_iterator(palette_name='Plotly'):
     """
@@ -15,6 +13,8 @@ def _get_color_iterator(palette_name='Plotly'):
     Returns:
         Iterator[str]: Infinite color iterator.
     """
+    import plotly.express as px  # imported on first use, plotly is slow to import
+
     palette = getattr(px.colors.qualitative, palette_name, None)
     if palette is None:
         raise ValueError(f"Unknown palette name '{palette_name}'. Check plotly.express.colors.qualitative for options.")